@@ -0,0 +1,97 @@
+"""Compare the time of exact and approximated quantiles of numerical variables.
+
+Synthetic data frames with numerical variables only are generated in memory
+for an increasing number of rows. The statistics are computed with exact
+quantiles and with --approx-quantiles. The script fails if the approximation
+takes longer than --max-ratio times the exact computation, e.g.
+
+    python benchmarks/approximate_quantiles.py --rows 100000 1000000 --max-ratio 1.0
+"""
+import argparse
+import pathlib
+import sys
+import time
+from typing import Callable, List
+
+from synthetic import DatasetShape, generate_dataset
+
+# Import collect_stata from this working tree, also if it is not installed.
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+# pylint: disable=wrong-import-position
+from collect_stata.variables import CompactVariable
+from collect_stata.write_json import generate_statistics
+
+# pylint: enable=wrong-import-position
+
+
+def _best_time(function: Callable[[], object], repeat: int) -> float:
+    times = list()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def _metadata(names: List[str]) -> List[CompactVariable]:
+    return [
+        CompactVariable.from_dict(
+            {"name": name, "scale": "number", "categories": {"values": []}}
+        )
+        for name in names
+    ]
+
+
+def main() -> None:
+    """Time exact and approximated quantiles for the given numbers of rows."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--columns", type=int, default=20)
+    parser.add_argument("--error", type=float, default=0.01)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--max-ratio", type=float, help="Fail above this ratio")
+    args = parser.parse_args()
+
+    print("     rows  exact [s]  approximated [s]  ratio")
+    ratios = list()
+    for rows in args.rows:
+        shape = DatasetShape(
+            rows=rows,
+            columns=args.columns,
+            categorical_share=0,
+            numerical_share=1,
+            string_share=0,
+            date_share=0,
+        )
+        data = generate_dataset(shape)
+        names = list(data.columns)
+        # The defaults bind the data of this iteration to the functions.
+        exact_time = _best_time(
+            lambda data=data, names=names: generate_statistics(
+                data, _metadata(names), "benchmark"
+            ),
+            args.repeat,
+        )
+        approximate_time = _best_time(
+            lambda data=data, names=names: generate_statistics(
+                data, _metadata(names), "benchmark", quantile_error=args.error
+            ),
+            args.repeat,
+        )
+        ratios.append(approximate_time / exact_time)
+        print(
+            "{:>9}  {:>9.4f}  {:>16.4f}  {:>5.2f}".format(
+                rows, exact_time, approximate_time, ratios[-1]
+            )
+        )
+    if args.max_ratio is not None and max(ratios) > args.max_ratio:
+        sys.exit(
+            "Approximated quantiles took {:.2f} times as long as exact ones.".format(
+                max(ratios)
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Show that the time to gather variable metadata grows linearly with the variables.
+
+Wide synthetic files with few rows are generated for an increasing number
+of variables. The time of get_variable_metadata per variable should stay
+roughly constant, e.g.
+
+    python benchmarks/metadata_scaling.py --variables 1000 2000 4000 8000 16000 32000
+"""
+import argparse
+import pathlib
+import sys
+import tempfile
+import time
+import warnings
+from typing import Callable, List
+
+from synthetic import DatasetShape, write_dataset
+
+# Import collect_stata from this working tree, also if it is not installed.
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+# pylint: disable=wrong-import-position
+from collect_stata.read_header import StataHeaderReader
+from collect_stata.read_stata import StataDataExtractor
+
+# pylint: enable=wrong-import-position
+
+
+def _best_time(function: Callable[[], object], repeat: int) -> float:
+    times = list()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main() -> None:
+    """Time metadata extraction for files with the given numbers of variables."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument(
+        "--variables", type=int, nargs="+", default=[1_000, 2_000, 4_000, 8_000, 16_000]
+    )
+    parser.add_argument("--rows", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    warnings.simplefilter("ignore")
+    print("variables  pandas [s]  per variable [us]  header [s]  per variable [us]")
+    per_variable: List[float] = list()
+    with tempfile.TemporaryDirectory() as directory:
+        for variables in args.variables:
+            shape = DatasetShape(rows=args.rows, columns=variables)
+            file_name = write_dataset(shape, pathlib.Path(directory, "wide.dta"))
+            pandas_time = _best_time(
+                lambda file_name=file_name: StataDataExtractor(
+                    file_name
+                ).get_variable_metadata(),
+                args.repeat,
+            )
+            header_time = _best_time(
+                lambda file_name=file_name: StataHeaderReader(
+                    file_name
+                ).get_variable_metadata(),
+                args.repeat,
+            )
+            per_variable.append(pandas_time / variables)
+            print(
+                "{:>9}  {:>10.4f}  {:>17.2f}  {:>10.4f}  {:>17.2f}".format(
+                    variables,
+                    pandas_time,
+                    pandas_time / variables * 1e6,
+                    header_time,
+                    header_time / variables * 1e6,
+                )
+            )
+    print(
+        "Time per variable of the widest relative to the narrowest file: {:.2f}".format(
+            per_variable[-1] / per_variable[0]
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
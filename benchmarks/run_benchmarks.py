@@ -0,0 +1,191 @@
+"""Measure the throughput of collect_stata on synthetic stata files.
+
+Every case generates a synthetic file and times the processing stages
+separately. Each case runs in a fresh process, so the peak resident set size
+recorded for a case is not influenced by earlier cases.
+The results are written as json to compare them between versions, e.g.
+
+    python benchmarks/run_benchmarks.py --shape 100000x200 --output results.json
+"""
+
+import argparse
+import copy
+import json
+import multiprocessing
+import pathlib
+import platform
+import resource
+import sys
+import tempfile
+import time
+from dataclasses import asdict
+from typing import Any, Callable, Dict, List, Tuple
+
+import numpy
+import pandas
+from synthetic import DatasetShape, write_dataset
+
+# Import collect_stata from this working tree, also if it is not installed.
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+# pylint: disable=wrong-import-position
+import collect_stata
+from collect_stata.read_stata import StataDataExtractor
+from collect_stata.write_json import dump_json, generate_statistics, update_metadata
+
+# pylint: enable=wrong-import-position
+
+Result = Dict[str, Any]
+
+
+def peak_rss_kb() -> int:
+    """Get the peak resident set size of the current process in kilobytes."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, Linux kilobytes.
+    return int(peak / 1024) if sys.platform == "darwin" else int(peak)
+
+
+def _timed(stages: Dict[str, Result], name: str, function: Callable[[], Any]) -> Any:
+    start = time.perf_counter()
+    result = function()
+    stages[name] = {
+        "seconds": time.perf_counter() - start,
+        "peak_rss_kb": peak_rss_kb(),
+    }
+    return result
+
+
+def run_case(file_name: pathlib.Path, output_file: pathlib.Path) -> Result:
+    """Time the processing stages for a single file."""
+    stages: Dict[str, Result] = dict()
+    extractor = _timed(stages, "construct", lambda: StataDataExtractor(file_name))
+    metadata = _timed(stages, "get_variable_metadata", extractor.get_variable_metadata)
+    _timed(stages, "parse_file", extractor.parse_file)
+    metadata = update_metadata(copy.deepcopy(metadata), None)
+    statistics = _timed(
+        stages,
+        "generate_statistics",
+        lambda: generate_statistics(extractor.data, metadata, "benchmark"),
+    )
+
+    def _write() -> None:
+        with open(output_file, "w", encoding="utf-8") as json_file:
+            dump_json(statistics, json_file)
+
+    _timed(stages, "write_json", _write)
+    return {
+        "stages": stages,
+        "total_seconds": sum(stage["seconds"] for stage in stages.values()),
+        "peak_rss_kb": peak_rss_kb(),
+    }
+
+
+def _run_case_in_process(
+    file_name: pathlib.Path,
+    output_file: pathlib.Path,
+    queue: "multiprocessing.Queue[Result]",
+) -> None:
+    queue.put(run_case(file_name, output_file))
+
+
+def benchmark(shape: DatasetShape, repeat: int, directory: pathlib.Path) -> Result:
+    """Generate a file of the given shape and run the case repeat times.
+
+    Stage times are the minimum over all repetitions.
+    """
+    file_name = write_dataset(shape, directory.joinpath("benchmark.dta"))
+    context = multiprocessing.get_context("spawn")
+    runs = list()
+    for _ in range(repeat):
+        queue = context.Queue()
+        process = context.Process(
+            target=_run_case_in_process,
+            args=(file_name, directory.joinpath("benchmark.json"), queue),
+        )
+        process.start()
+        runs.append(queue.get())
+        process.join()
+    stages = {
+        name: min(run["stages"][name]["seconds"] for run in runs)
+        for name in runs[0]["stages"]
+    }
+    return {
+        "shape": asdict(shape),
+        "file_size": file_name.stat().st_size,
+        "stages": stages,
+        "total_seconds": min(run["total_seconds"] for run in runs),
+        "peak_rss_kb": max(run["peak_rss_kb"] for run in runs),
+        "runs": runs,
+    }
+
+
+def parse_shape(value: str) -> Tuple[int, int]:
+    """Parse a shape given as ROWSxCOLUMNS."""
+    rows, columns = value.lower().split("x")
+    return int(rows), int(columns)
+
+
+def main() -> None:
+    """Run benchmarks for all shapes given on the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument(
+        "--shape",
+        action="append",
+        type=parse_shape,
+        help="Shape of a synthetic file as ROWSxCOLUMNS. Can be given multiple times.",
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="Repetitions per case")
+    defaults = DatasetShape()
+    for field in ("categorical_share", "numerical_share", "string_share", "date_share"):
+        parser.add_argument(
+            "--" + field.replace("_", "-"), type=float, default=getattr(defaults, field)
+        )
+    parser.add_argument("--categories", type=int, default=defaults.categories)
+    parser.add_argument("--missing-rate", type=float, default=defaults.missing_rate)
+    parser.add_argument("--output", "-o", type=pathlib.Path, help="Write results here")
+    args = parser.parse_args()
+
+    cases: List[Result] = list()
+    for rows, columns in args.shape or [(10_000, 100), (100_000, 100), (10_000, 1_000)]:
+        shape = DatasetShape(
+            rows=rows,
+            columns=columns,
+            categorical_share=args.categorical_share,
+            numerical_share=args.numerical_share,
+            string_share=args.string_share,
+            date_share=args.date_share,
+            categories=args.categories,
+            missing_rate=args.missing_rate,
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            case = benchmark(shape, args.repeat, pathlib.Path(directory))
+        cases.append(case)
+        print(
+            "{}x{}: {:.3f}s, peak RSS {} kB ({})".format(
+                rows,
+                columns,
+                case["total_seconds"],
+                case["peak_rss_kb"],
+                ", ".join(
+                    "{} {:.3f}s".format(name, seconds)
+                    for name, seconds in case["stages"].items()
+                ),
+            )
+        )
+
+    results = {
+        "collect_stata": collect_stata.__version__,
+        "python": platform.python_version(),
+        "pandas": pandas.__version__,
+        "numpy": numpy.__version__,
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "cases": cases,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            json.dump(results, output_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Measure the startup time of the command line interface.
+
+Every case runs in a fresh interpreter, so no module is imported beforehand.
+Showing the help and importing the cli must not import pandas or numpy;
+the script fails if they are imported or if the help takes longer than
+--max-seconds, e.g.
+
+    python benchmarks/startup.py --repeat 5 --max-seconds 0.5
+"""
+
+import argparse
+import subprocess
+import sys
+import time
+from typing import List
+
+# Modules that must not be imported before processing starts.
+HEAVY_MODULES = ("pandas", "numpy")
+
+CASES = {
+    "python": [sys.executable, "-c", "pass"],
+    "--help": [sys.executable, "-m", "collect_stata", "--help"],
+    "import collect_stata": [sys.executable, "-c", "import collect_stata"],
+    "import write_json": [sys.executable, "-c", "import collect_stata.write_json"],
+}
+
+# Prints the heavy modules imported by the cli module.
+IMPORTED_HEAVY_MODULES = (
+    "import sys, collect_stata, collect_stata.__main__; "
+    "print(' '.join(name for name in {} if name in sys.modules))".format(HEAVY_MODULES)
+)
+
+
+def _best_time(command: List[str], repeat: int) -> float:
+    times = list()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main() -> None:
+    """Time the startup cases and check that no heavy module is imported."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--max-seconds", type=float, default=None)
+    args = parser.parse_args()
+
+    times = dict()
+    print("case                  best [s]")
+    for name, command in CASES.items():
+        times[name] = _best_time(command, args.repeat)
+        print("{:<20}  {:>8.3f}".format(name, times[name]))
+
+    imported = subprocess.run(
+        [sys.executable, "-c", IMPORTED_HEAVY_MODULES],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout.split()
+    if imported:
+        sys.exit("The cli imports {} at startup".format(", ".join(imported)))
+    if args.max_seconds is not None and times["--help"] > args.max_seconds:
+        sys.exit(
+            "Showing the help took {:.3f} s, more than {} s".format(
+                times["--help"], args.max_seconds
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""Generate synthetic stata files for benchmarks.
+
+The generated files resemble survey data: categorical variables with value
+labels and negative missing codes, numerical variables, string variables
+and date variables.
+"""
+
+import argparse
+import pathlib
+from dataclasses import dataclass
+from typing import Dict
+
+import numpy
+import pandas
+
+# Negative values used as missing codes in the generated data.
+MISSING_CODES = numpy.arange(-8, 0)
+
+
+@dataclass
+class DatasetShape:
+    """Describe the shape of a synthetic dataset.
+
+    The shares of variable types are normalized to sum up to one.
+    """
+
+    rows: int = 10_000
+    columns: int = 100
+    categorical_share: float = 0.6
+    numerical_share: float = 0.3
+    string_share: float = 0.05
+    date_share: float = 0.05
+    categories: int = 5
+    missing_rate: float = 0.1
+    seed: int = 0
+
+    def column_counts(self) -> Dict[str, int]:
+        """Get the number of columns of every variable type."""
+        shares = {
+            "cat": self.categorical_share,
+            "number": self.numerical_share,
+            "string": self.string_share,
+            "date": self.date_share,
+        }
+        total = sum(shares.values())
+        counts = {key: int(self.columns * share / total) for key, share in shares.items()}
+        counts["cat"] += self.columns - sum(counts.values())
+        return counts
+
+
+def _with_missing_codes(
+    values: numpy.ndarray, shape: DatasetShape, generator: numpy.random.Generator
+) -> numpy.ndarray:
+    missing = generator.random(values.size) < shape.missing_rate
+    values[missing] = generator.choice(MISSING_CODES, size=int(missing.sum()))
+    return values
+
+
+def generate_dataset(shape: DatasetShape) -> pandas.DataFrame:
+    """Create a DataFrame with random values of the given shape."""
+    generator = numpy.random.default_rng(shape.seed)
+    counts = shape.column_counts()
+    columns: Dict[str, numpy.ndarray] = dict()
+    for index in range(counts["cat"]):
+        values = generator.integers(1, shape.categories + 1, size=shape.rows)
+        columns[f"cat{index}"] = _with_missing_codes(values, shape, generator).astype(
+            "int16"
+        )
+    for index in range(counts["number"]):
+        values = generator.lognormal(7, 1, size=shape.rows).round(2)
+        columns[f"num{index}"] = _with_missing_codes(values, shape, generator)
+    words = numpy.array(["alpha", "beta", "gamma", "delta", "", "."], dtype=object)
+    for index in range(counts["string"]):
+        columns[f"str{index}"] = generator.choice(words, size=shape.rows)
+    for index in range(counts["date"]):
+        days = generator.integers(0, 20_000, size=shape.rows)
+        dates = pandas.to_datetime(days, unit="D", origin="1960-01-01").to_numpy(
+            copy=True
+        )
+        dates[generator.random(shape.rows) < shape.missing_rate] = numpy.datetime64("NaT")
+        columns[f"date{index}"] = dates
+    return pandas.DataFrame(columns)
+
+
+def write_dataset(shape: DatasetShape, file_name: pathlib.Path) -> pathlib.Path:
+    """Write a synthetic stata file with variable and value labels."""
+    data = generate_dataset(shape)
+    value_labels = dict()
+    for column in data.columns:
+        if column.startswith("cat"):
+            labels = {code: f"[{code}] missing" for code in MISSING_CODES.tolist()}
+            categories = range(1, shape.categories + 1)
+            labels.update({code: f"[{code}] category {code}" for code in categories})
+            value_labels[column] = labels
+    data.to_stata(
+        file_name,
+        version=118,
+        write_index=False,
+        variable_labels={column: f"Label of {column}" for column in data.columns},
+        value_labels=value_labels,
+        convert_dates={
+            column: "tc" for column in data.columns if column.startswith("date")
+        },
+    )
+    return file_name
+
+
+def main() -> None:
+    """Write a synthetic stata file from command line arguments."""
+    parser = argparse.ArgumentParser(description="Write a synthetic stata file")
+    parser.add_argument("output", type=pathlib.Path, help="Path of the dta file")
+    defaults = DatasetShape()
+    for field, value in vars(defaults).items():
+        parser.add_argument(
+            "--" + field.replace("_", "-"), type=type(value), default=value
+        )
+    args = vars(parser.parse_args())
+    output = args.pop("output")
+    write_dataset(DatasetShape(**args), output)
+
+
+if __name__ == "__main__":
+    main()
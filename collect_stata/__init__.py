@@ -0,0 +1,24 @@
+"""Accumulate data from stata files and write it to an open format."""
+__version__ = "0.1.0"
+
+from typing import TYPE_CHECKING, Any
+
+from collect_stata.missing_codes import MissingCodes
+
+if TYPE_CHECKING:
+    from collect_stata.api import DatasetResult, JsonSink, collect
+
+__all__ = ["DatasetResult", "JsonSink", "MissingCodes", "collect"]
+
+
+def __getattr__(name: str) -> Any:
+    """Import the Python API on first use.
+
+    It needs pandas and numpy, which are slow to import and not needed
+    by the command line interface before processing starts.
+    """
+    if name in ("DatasetResult", "JsonSink", "collect"):
+        from collect_stata import api  # pylint: disable=import-outside-toplevel
+
+        return getattr(api, name)
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
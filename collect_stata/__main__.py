@@ -1,21 +1,72 @@
 """Contains everything that enables cli usage of the package."""
 __author__ = "Marius Pahl"
 
+# pylint: disable=import-outside-toplevel
+# Modules that need pandas or numpy are imported when processing starts,
+# so that the help and argument errors are shown without waiting for them.
 import argparse
+import contextlib
+import importlib
+import importlib.util
 import logging
 import sys
 import time
-from multiprocessing import Process
+from concurrent.futures import Future, ProcessPoolExecutor, as_completed
 from pathlib import Path
-from typing import Optional
-
-from collect_stata.read_stata import StataDataExtractor
-from collect_stata.write_json import write_json
+from typing import (
+    TYPE_CHECKING,
+    ContextManager,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
+
+from collect_stata.manifest import FileEntry, Manifest, file_entry
+from collect_stata.metrics import FileMetrics, FileRecord, log_record, write_summary
+from collect_stata.missing_codes import DEFAULT_MISSING_CODES, MissingCodes
+from collect_stata.options import (
+    DEFAULT_ERROR,
+    ENGINES,
+    SIDECAR_FORMATS,
+    STUDY_FORMATS,
+    RunOptions,
+)
+from collect_stata.types import Variable
+
+if TYPE_CHECKING:
+    import pandas
+
+    from collect_stata.pipeline import ComputedFile, LoadedFile
+    from collect_stata.read_mmap import Extractor
+    from collect_stata.study_output import StudyOutput
+    from collect_stata.variables import CompactVariable
+
+# Modules used to process a file, imported once by every worker process.
+PROCESSING_MODULES = (
+    "collect_stata.read_header",
+    "collect_stata.read_mmap",
+    "collect_stata.write_json",
+)
+
+# Manifest entry, metrics and, for study outputs, the variables of a processed file.
+ProcessedFile = Tuple[FileEntry, FileRecord, Optional[List[Variable]]]
+
+
+def warm_up() -> None:
+    """Import the modules used to process files.
+
+    Used as initializer of worker processes, so every worker pays
+    the import time once when it starts instead of with its first file.
+    """
+    for module in PROCESSING_MODULES:
+        importlib.import_module(module)
 
 
-def main() -> None:
-    """Provide cli argument parsing and initiate the data processing."""
-
+def _create_parser() -> argparse.ArgumentParser:
+    """Create the parser of the command line arguments."""
     parser = argparse.ArgumentParser(
         description="Convert stata files to readable json files"
     )
@@ -42,6 +93,150 @@ def main() -> None:
         action="store_true",
         help="Process stata files in parallel",
     )
+    parser.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        help=(
+            "Number of worker processes used with --multiprocessing. "
+            "Defaults to the number of CPUs."
+        ),
+    )
+    parser.add_argument(
+        "--column-jobs",
+        type=int,
+        metavar="N",
+        help=(
+            "Compute the statistics of numeric variables of a file "
+            "in N processes, sharing the columns through shared memory. "
+            "Can not be combined with --multiprocessing or --chunksize."
+        ),
+    )
+    parser.add_argument(
+        "--pipeline",
+        action="store_true",
+        help=(
+            "Read the next files and write the previous file while the statistics "
+            "of the current file are computed. "
+            "Can not be combined with --multiprocessing or --chunksize."
+        ),
+    )
+    parser.add_argument(
+        "--read-ahead",
+        type=int,
+        default=1,
+        metavar="N",
+        help="Number of files read ahead with --pipeline (default: 1)",
+    )
+    parser.add_argument(
+        "--write-behind",
+        type=int,
+        default=1,
+        metavar="N",
+        help=(
+            "Number of computed files waiting to be written with --pipeline "
+            "(default: 1)"
+        ),
+    )
+    parser.add_argument(
+        "--chunksize",
+        "-c",
+        type=int,
+        help=(
+            "Read stata files in chunks of this many rows. "
+            "Limits memory usage to the size of a chunk instead of a whole file."
+        ),
+    )
+    parser.add_argument(
+        "--engine",
+        choices=ENGINES,
+        default="pandas",
+        help=(
+            "Reader for the data of stata files. "
+            "'mmap' decodes files of the formats 117 to 119 through a memory map, "
+            "other files are read with pandas. (default: pandas)"
+        ),
+    )
+    parser.add_argument(
+        "--include",
+        action="append",
+        metavar="PATTERN",
+        help=(
+            "Only compute statistics for variables matching this pattern, "
+            "e.g. 'hk*'. Can be given multiple times."
+        ),
+    )
+    parser.add_argument(
+        "--exclude",
+        action="append",
+        metavar="PATTERN",
+        help=(
+            "Do not compute statistics for variables matching this pattern. "
+            "Their metadata is still written. Can be given multiple times."
+        ),
+    )
+    parser.add_argument(
+        "--approx-quantiles",
+        nargs="?",
+        const=DEFAULT_ERROR,
+        type=float,
+        metavar="ERROR",
+        help=(
+            "Approximate quartiles and median of numerical variables "
+            "with a quantile sketch instead of sorting all values. "
+            "ERROR bounds the rank error (default: {})".format(DEFAULT_ERROR)
+        ),
+    )
+    parser.add_argument(
+        "--missing-codes",
+        metavar="RANGES",
+        help=(
+            "Missing codes of the study as comma separated ranges LOW:HIGH "
+            "or single codes, e.g. --missing-codes=-99:-91,9999. Values in the "
+            "ranges are invalid and category values in them are flagged as missings. "
+            "(default: negative values are invalid, -200 to -1 are flagged)"
+        ),
+    )
+    parser.add_argument(
+        "--study-output",
+        choices=STUDY_FORMATS,
+        help=(
+            "Also write the variables of all files into a single file named "
+            "after the study: newline delimited json or a SQLite database "
+            "keyed by dataset and variable."
+        ),
+    )
+    parser.add_argument(
+        "--sidecar",
+        choices=SIDECAR_FORMATS,
+        help=(
+            "Write the decoded data of every file as a Parquet or Feather file "
+            "with the variable and value labels next to the json file. "
+            "Later runs read it instead of the stata file while it is newer. "
+            "Needs pyarrow. Can not be combined with --chunksize."
+        ),
+    )
+    parser.add_argument(
+        "--distinct",
+        action="store_true",
+        help=(
+            "Estimate the number of distinct values of string variables "
+            "with HyperLogLog (about 1%% relative error)"
+        ),
+    )
+    parser.add_argument(
+        "--compact",
+        action="store_true",
+        help=(
+            "Write json files without indentation. "
+            "Uses orjson for faster serialisation if it is installed."
+        ),
+    )
+    parser.add_argument(
+        "--gzip",
+        action="store_true",
+        help="Write gzip compressed json files (.json.gz)",
+    )
     parser.add_argument(
         "--latin1",
         "-l",
@@ -51,20 +246,89 @@ def main() -> None:
             "are encoded with Latin-1 or  Windows-1252"
         ),
     )
+    parser.add_argument(
+        "--force",
+        "-f",
+        action="store_true",
+        help="Process all files, even if their output is up to date",
+    )
     parser.add_argument(
         "--debug", "-d", action="store_true", help="Set logging Level to DEBUG"
     )
     parser.add_argument(
         "--verbose", "-v", action="store_true", help="Set logging Level to INFO"
     )
+    return parser
+
+
+def _validate(args: argparse.Namespace, parser: argparse.ArgumentParser) -> None:
+    """Exit with an argument error if an option is invalid or can not be combined."""
+    if args.input is None and args.input_german is None:
+        parser.error("At least one input required")
+    for option in ("jobs", "chunksize", "column_jobs", "read_ahead", "write_behind"):
+        value = getattr(args, option)
+        if value is not None and value < 1:
+            parser.error("--{} must be at least 1".format(option.replace("_", "-")))
+    for option in ("column_jobs", "pipeline"):
+        if getattr(args, option) and (args.multiprocessing or args.chunksize):
+            parser.error(
+                "--{} can not be combined with -m or --chunksize".format(
+                    option.replace("_", "-")
+                )
+            )
+    if args.sidecar is not None:
+        if importlib.util.find_spec("pyarrow") is None:
+            parser.error("--sidecar needs pyarrow to be installed")
+        if args.chunksize:
+            parser.error("--sidecar can not be combined with --chunksize")
+    if args.approx_quantiles is not None and not 0 < args.approx_quantiles < 1:
+        parser.error("--approx-quantiles must be between 0 and 1")
+
+
+def _parse_args() -> Tuple[argparse.Namespace, RunOptions]:
+    """Parse and validate the command line arguments.
+
+    Exits with the help if no arguments are given and with an argument error
+    if they are invalid.
+
+    Returns:
+        The parsed arguments and the settings of the run taken from them.
+    """
+    parser = _create_parser()
     if len(sys.argv) == 1:
         parser.print_help()
         sys.exit(1)
 
     args: argparse.Namespace = parser.parse_args()
+    _validate(args, parser)
+    missing_codes = DEFAULT_MISSING_CODES
+    if args.missing_codes is not None:
+        try:
+            missing_codes = MissingCodes.parse(args.missing_codes)
+        except ValueError as error:
+            parser.error("--missing-codes: {}".format(error))
+    options = RunOptions(
+        engine=args.engine,
+        chunksize=args.chunksize,
+        column_jobs=args.column_jobs,
+        include=args.include,
+        exclude=args.exclude,
+        quantile_error=args.approx_quantiles,
+        distinct=args.distinct,
+        missing_codes=missing_codes,
+        sidecar=args.sidecar,
+        compact=args.compact,
+        compress=args.gzip,
+        study_output=args.study_output,
+        force=args.force,
+    )
+    return args, options
 
-    if args.input is None and args.input_german is None:
-        parser.error("At least one input required")
+
+def main() -> None:
+    """Provide cli argument parsing and initiate the data processing."""
+
+    args, options = _parse_args()
     study = args.study
     input_path = Path(args.input).absolute()
     input_de_path = Path(args.input_german) if args.input_german else None
@@ -86,15 +350,20 @@ def main() -> None:
         input_de_path=input_de_path,
         output_path=output_path,
         latin1=latin1,
+        options=options,
     )
 
     if run_parallel:
-        stata_to_json.parallel_run()
+        stata_to_json.parallel_run(jobs=args.jobs)
+    elif args.pipeline:
+        stata_to_json.pipelined_run(
+            read_ahead=args.read_ahead, write_behind=args.write_behind
+        )
     else:
         stata_to_json.single_process_run()
 
     duration = time.time() - start_time
-    logging.info("Duration {:.5f} seconds".format(duration))
+    logging.info("Duration %.5f seconds", duration)
 
 
 class StataToJson:
@@ -105,6 +374,7 @@ class StataToJson:
     input_path: Path to main data folder. (Data should be english if available)
     input_de_path: path to german data folder.
     output_path: path to output folder
+    options: Settings of the run, e.g. the engine, chunking and output format.
 
     This method reads stata file(s), transforms it in tabular data package.
     After this, it writes it out as csv and json files.
@@ -115,6 +385,7 @@ class StataToJson:
     input_de_path: Optional[Path]
     output_path: Path
     latin1: bool
+    options: RunOptions
 
     def __init__(  # pylint: disable=too-many-arguments
         self,
@@ -123,6 +394,7 @@ class StataToJson:
         output_path: Path,
         input_de_path: Optional[Path] = None,
         latin1: bool = False,
+        options: RunOptions = RunOptions(),
     ) -> None:
 
         self.study = study_name
@@ -130,64 +402,394 @@ class StataToJson:
         self.input_de_path = input_de_path
         self.output_path = output_path
         self.latin1 = latin1
+        self.options = options
 
         output_path.mkdir(parents=True, exist_ok=True)
 
-    def parallel_run(self) -> None:
-        """Run processes per file in parallel."""
-        # gather the processes
-
-        processes = []
-        if self.input_path and not self.input_de_path:
-            for file in self.input_path.glob("*.dta"):
-                process = Process(target=self._run, args=(file, None))
-                processes.append(process)
-                process.start()
-        elif self.input_path and self.input_de_path:
-            for file in self.input_path.glob("*.dta"):
-                file_de = Path(self.input_de_path.joinpath(file.name))
-                process = Process(target=self._run, args=(file, file_de))
-
-                processes.append(process)
-                process.start()
-
-        # complete the processes
-        for process in processes:
-            process.join()
-            process.terminate()
+    def _file_pairs(self) -> List[Tuple[Path, Optional[Path]]]:
+        """Pair every input file with its german counterpart, largest files first.
+
+        Sorting by size lets the largest files start early, so that a single
+        huge file does not end up running alone after all others are done.
+        """
+        if not self.input_path.is_dir():
+            return [(self.input_path, self.input_de_path)]
+
+        files = sorted(
+            self.input_path.glob("*.dta"),
+            key=lambda file: file.stat().st_size,
+            reverse=True,
+        )
+        if self.input_de_path is None:
+            return [(file, None) for file in files]
+        return [(file, self.input_de_path.joinpath(file.name)) for file in files]
+
+    def _output_file(self, file: Path) -> Path:
+        suffix = ".json.gz" if self.options.compress else ".json"
+        return self.output_path.joinpath(file.stem + suffix)
+
+    def _load_manifest(self) -> Manifest:
+        options = {
+            "study": self.study,
+            "latin1": self.latin1,
+            "engine": self.options.engine,
+            "chunksize": self.options.chunksize,
+            "include": self.options.include,
+            "exclude": self.options.exclude,
+            "quantile_error": self.options.quantile_error,
+            "distinct": self.options.distinct,
+            "missing_codes": self.options.missing_codes.option(),
+            "sidecar": self.options.sidecar,
+            "compact": self.options.compact,
+            "compress": self.options.compress,
+        }
+        return Manifest(self.output_path, options=options)
+
+    def _study_output_missing(self) -> bool:
+        if self.options.study_output is None:
+            return False
+        from collect_stata.study_output import study_output_file
+
+        return not study_output_file(
+            self.output_path, self.study, self.options.study_output
+        ).is_file()
+
+    def _outdated_file_pairs(
+        self, manifest: Manifest
+    ) -> List[Tuple[Path, Optional[Path]]]:
+        """Get all file pairs whose output is not up to date.
+
+        New modification times of reused files are saved in the manifest.
+        Logs how many files are reused and how many have to be rebuilt,
+        as a warning if files are reused, so skipped files are noticed
+        without --verbose.
+        """
+        file_pairs = self._file_pairs()
+        if self.options.force or self._study_output_missing():
+            outdated = file_pairs
+        else:
+            outdated = [
+                (file, file_de)
+                for file, file_de in file_pairs
+                if not manifest.is_current(file, file_de, self._output_file(file))
+            ]
+        if manifest.refreshed:
+            manifest.save()
+        reused = len(file_pairs) - len(outdated)
+        logging.log(
+            logging.WARNING if reused else logging.INFO,
+            "Reusing %s and rebuilding %s of %s files%s",
+            reused,
+            len(outdated),
+            len(file_pairs),
+            ", use --force to rebuild all" if reused else "",
+        )
+        return outdated
+
+    def _process(self, file: Path, file_de: Optional[Path]) -> ProcessedFile:
+        """Process a file and return its manifest entry and metrics.
+
+        The fingerprints are taken before processing, so that changes
+        during processing are detected by the next run.
+        The metrics are logged by the process that did the work.
+        The variables are only returned if they are written to a study output.
+        """
+        from collect_stata.variables import to_dicts
+
+        entry = file_entry(file, file_de)
+        metrics, variables = self._run(file, file_de)
+        record = metrics.record()
+        log_record(record)
+        return entry, record, to_dicts(variables) if self.options.study_output else None
+
+    def _open_study_output(
+        self, outdated: List[Tuple[Path, Optional[Path]]]
+    ) -> ContextManager[Optional["StudyOutput"]]:
+        """Open the study output, keeping the datasets of files that are reused."""
+        if self.options.study_output is None:
+            return contextlib.nullcontext()
+        from collect_stata.study_output import create_study_output
+
+        rebuilt = {file for file, _ in outdated}
+        return create_study_output(
+            self.output_path,
+            self.study,
+            self.options.study_output,
+            keep={file.stem for file, _ in self._file_pairs() if file not in rebuilt},
+            latin1=self.latin1,
+        )
+
+    def parallel_run(self, jobs: Optional[int] = None) -> None:
+        """Process files in parallel with a bounded pool of worker processes.
+
+        Args:
+            jobs: Maximum number of worker processes.
+                  Defaults to the number of CPUs.
+
+        Raises:
+            RuntimeError: If processing failed for at least one file.
+                          All other files are still processed.
+        """
+        start_time = time.time()
+        failed_files = list()
+        records: List[FileRecord] = list()
+        manifest = self._load_manifest()
+        outdated = self._outdated_file_pairs(manifest)
+        # Forked workers inherit the modules, other workers import them on start.
+        warm_up()
+        with ProcessPoolExecutor(
+            max_workers=jobs, initializer=warm_up
+        ) as executor, self._open_study_output(outdated) as study_output:
+            futures: Dict["Future[ProcessedFile]", Path] = {
+                executor.submit(self._process, file, file_de): file
+                for file, file_de in outdated
+            }
+            for future in as_completed(futures):
+                file = futures[future]
+                error = future.exception()
+                if error is not None:
+                    logging.error("Processing %s failed", file, exc_info=error)
+                    failed_files.append(file)
+                    continue
+                records.append(
+                    self._finish(file, future.result(), manifest, study_output)
+                )
+
+        write_summary(self.output_path, records, time.time() - start_time)
+        if failed_files:
+            raise RuntimeError(
+                "Processing failed for {} file(s): {}".format(
+                    len(failed_files), ", ".join(file.name for file in failed_files)
+                )
+            )
 
     def single_process_run(self) -> None:
         """Run on files sequentially."""
 
-        if not self.input_path.is_dir():
-            self._run(self.input_path, self.input_de_path)
-            return None
+        start_time = time.time()
+        records: List[FileRecord] = list()
+        manifest = self._load_manifest()
+        outdated = self._outdated_file_pairs(manifest)
+        with self._open_study_output(outdated) as study_output:
+            for file, file_de in outdated:
+                processed = self._process(file=file, file_de=file_de)
+                records.append(self._finish(file, processed, manifest, study_output))
+        write_summary(self.output_path, records, time.time() - start_time)
+
+    def pipelined_run(self, read_ahead: int = 1, write_behind: int = 1) -> None:
+        """Run on files sequentially, overlapping reading, computing and writing.
+
+        Args:
+            read_ahead: Maximum number of files read into memory ahead of
+                        the file whose statistics are computed.
+            write_behind: Maximum number of computed files waiting to be written.
+
+        Raises:
+            RuntimeError: If processing failed for at least one file.
+                          All other files are still processed.
+        """
+        start_time = time.time()
+        records: List[FileRecord] = list()
+        manifest = self._load_manifest()
+        outdated = self._outdated_file_pairs(manifest)
+        german_files = dict(outdated)
+        from collect_stata.pipeline import Pipeline
+
+        def load(file: Path) -> "LoadedFile":
+            entry = file_entry(file, german_files[file])
+            return self._load(file, german_files[file], entry)
+
+        def write(computed: "ComputedFile") -> None:
+            records.append(self._write(computed, manifest, study_output))
+
+        pipeline: "Pipeline[Path, LoadedFile, ComputedFile]" = Pipeline(
+            load, self._compute, write, read_ahead, write_behind
+        )
+        with self._open_study_output(outdated) as study_output:
+            failed = pipeline.run(german_files)
+
+        write_summary(self.output_path, records, time.time() - start_time)
+        if failed:
+            raise RuntimeError(
+                "Processing failed for {} file(s): {}".format(
+                    len(failed), ", ".join(file.name for file, _ in failed)
+                )
+            )
+
+    def _finish(
+        self,
+        file: Path,
+        processed: ProcessedFile,
+        manifest: Manifest,
+        study_output: Optional["StudyOutput"],
+    ) -> FileRecord:
+        """Add a processed file to the study output and record it in the manifest.
+
+        Returns the metrics of the file.
+        """
+        entry, record, variables = processed
+        if study_output is not None and variables is not None:
+            study_output.write(file.stem, variables)
+        manifest.record(file, entry)
+        manifest.save()
+        return record
+
+    def _write(
+        self,
+        computed: "ComputedFile",
+        manifest: Manifest,
+        study_output: Optional["StudyOutput"],
+    ) -> FileRecord:
+        """Write the json file of a file computed by the pipeline and record it."""
+        from collect_stata.variables import to_dicts
+        from collect_stata.write_json import write_variables
+
+        with computed.metrics.stage("serialise"):
+            variables = to_dicts(computed.variables)
+            write_variables(
+                variables,
+                self._output_file(computed.file),
+                self.latin1,
+                compact=self.options.compact,
+                compress=self.options.compress,
+            )
+        record = computed.metrics.record()
+        log_record(record)
+        return self._finish(
+            computed.file, (computed.entry, record, variables), manifest, study_output
+        )
 
-        if self.input_path and not self.input_de_path:
-            for file in self.input_path.glob("*.dta"):
-                self._run(file=file, file_de=None)
-        if self.input_path is not None and self.input_de_path is not None:
-            for file in self.input_path.glob("*.dta"):
-                file_de = Path(self.input_de_path.joinpath(file.name))
-                self._run(file=file, file_de=file_de)
-        return None
-
-    def _run(self, file: Path, file_de: Optional[Path]) -> None:
-        """Encapsulate data processing run with multiprocessing."""
-
-        output_file = self.output_path.joinpath(file.name).with_suffix(".json")
-        stata_data = StataDataExtractor(file)
-        stata_data.parse_file()
-        data = stata_data.data
-        metadata = stata_data.get_variable_metadata()
-        metadata_de = None
-        if file_de:
-            stata_data_de = StataDataExtractor(file_de)
-            metadata_de = stata_data_de.get_variable_metadata()
-
-        write_json(
-            data, metadata, metadata_de, output_file, study=self.study, latin1=self.latin1
+    def _load(
+        self, file: Path, file_de: Optional[Path], entry: FileEntry
+    ) -> "LoadedFile":
+        """Read the data and metadata of a file for the pipeline."""
+        from collect_stata.pipeline import LoadedFile
+
+        metrics = FileMetrics(file)
+        stata_data, metadata = self._open(file, metrics)
+        return LoadedFile(
+            file=file,
+            entry=entry,
+            metadata=metadata,
+            metadata_de=self._german_metadata(file_de, metrics),
+            data=self._read(file, stata_data, metrics),
+            metrics=metrics,
+        )
+
+    def _compute(self, loaded: "LoadedFile") -> "ComputedFile":
+        """Compute the statistics of a file loaded by the pipeline."""
+        from collect_stata.pipeline import ComputedFile
+        from collect_stata.write_json import generate_statistics, update_metadata
+
+        metadata = update_metadata(loaded.metadata, loaded.metadata_de)
+        variables = generate_statistics(
+            loaded.data,
+            metadata,
+            self.study,
+            self.options.quantile_error,
+            loaded.metrics,
+            self.options.column_jobs,
+            self.options.distinct,
+            self.options.missing_codes,
+        )
+        return ComputedFile(loaded.file, loaded.entry, variables, loaded.metrics)
+
+    def _sidecar_file(self, file: Path) -> Optional[Path]:
+        if self.options.sidecar is None:
+            return None
+        from collect_stata.sidecar import sidecar_file
+
+        return sidecar_file(self.output_path, file, self.options.sidecar)
+
+    def _open(
+        self, file: Path, metrics: FileMetrics
+    ) -> Tuple["Extractor", List["CompactVariable"]]:
+        """Create the extractor of a file and read its variable metadata.
+
+        The data is read from the sidecar of the file, if it is up to date.
+        """
+        from collect_stata.read_mmap import create_extractor
+
+        with metrics.stage("open"):
+            stata_data = create_extractor(
+                file,
+                engine=self.options.engine,
+                include=self.options.include,
+                exclude=self.options.exclude,
+                sidecar=self._sidecar_file(file),
+            )
+        with metrics.stage("metadata"):
+            metadata = stata_data.get_variable_metadata()
+        metrics.variables = len(metadata)
+        metrics.file_size = stata_data.file_name.stat().st_size
+        return stata_data, metadata
+
+    def _read(
+        self, file: Path, stata_data: "Extractor", metrics: FileMetrics
+    ) -> "pandas.DataFrame":
+        """Read the data of a file and write its sidecar, if it is requested."""
+        from collect_stata.sidecar import SidecarExtractor, write_sidecar
+
+        with metrics.stage("read"):
+            stata_data.parse_file()
+        metrics.rows = len(stata_data.data)
+        sidecar = self._sidecar_file(file)
+        if sidecar is not None and not isinstance(stata_data, SidecarExtractor):
+            with metrics.stage("sidecar"):
+                write_sidecar(
+                    stata_data.data, stata_data.get_variable_metadata(), sidecar
+                )
+        return stata_data.data
+
+    @staticmethod
+    def _german_metadata(
+        file_de: Optional[Path], metrics: FileMetrics
+    ) -> Optional[List["CompactVariable"]]:
+        if not file_de:
+            return None
+        from collect_stata.read_header import StataHeaderReader
+
+        # Only labels are needed from the german file; its data is never read.
+        with metrics.stage("metadata"):
+            return StataHeaderReader(file_de).get_variable_metadata()
+
+    def _run(
+        self, file: Path, file_de: Optional[Path]
+    ) -> Tuple[FileMetrics, List["CompactVariable"]]:
+        """Encapsulate data processing run with multiprocessing.
+
+        Returns the time spent in every stage and the amount of data processed,
+        and the written variables.
+        """
+
+        from collect_stata.write_json import write_json
+
+        metrics = FileMetrics(file)
+        output_file = self._output_file(file)
+        stata_data, metadata = self._open(file, metrics)
+        data: Union["pandas.DataFrame", Iterator["pandas.DataFrame"]]
+        if self.options.chunksize:
+            data = stata_data.iter_chunks(self.options.chunksize)
+        else:
+            data = self._read(file, stata_data, metrics)
+        metadata_de = self._german_metadata(file_de, metrics)
+
+        variables = write_json(
+            data,
+            metadata,
+            metadata_de,
+            output_file,
+            study=self.study,
+            latin1=self.latin1,
+            quantile_error=self.options.quantile_error,
+            compact=self.options.compact,
+            compress=self.options.compress,
+            metrics=metrics,
+            jobs=self.options.column_jobs,
+            distinct=self.options.distinct,
+            missing_codes=self.options.missing_codes,
         )
+        return metrics, variables
 
 
 if __name__ == "__main__":
@@ -0,0 +1,560 @@
+"""Mergeable accumulators to compute statistics over chunks of a dataset.
+
+Every accumulator is updated with one chunk of a single column at a time
+and keeps only a summary of the values seen so far.
+Two accumulators for the same variable can be merged, e.g. when the chunks
+of a file were processed by different workers.
+The results are the same as the ones computed by the functions in
+collect_stata.write_json on the whole column.
+Exact quantiles are taken from histograms of the distinct values in sorted
+NumPy arrays. Every chunk is counted and merged into them without aligning
+indexes. A histogram keeps at most MAX_HISTOGRAM_SIZE distinct values. Above
+it, the histogram is moved into a QuantileSketch with the default error bound
+and quantiles are approximated from then on, so the memory stays bounded.
+"""
+__author__ = "Marius Pahl"
+
+from typing import Dict, Optional
+
+import numpy
+import pandas
+from pandas.api.types import is_datetime64_any_dtype
+
+from collect_stata.dates import (
+    NAT,
+    UNIT_NANOSECONDS,
+    coarsest_unit,
+    date_statistics,
+    datetime_values,
+    summarize_dates,
+)
+from collect_stata.missing_codes import DEFAULT_MISSING_CODES, MissingCodes
+from collect_stata.options import DEFAULT_ERROR
+from collect_stata.sketch import DistinctSketch, QuantileSketch, weighted_quantile
+from collect_stata.string_statistics import invalid_string_mask
+from collect_stata.types import Numeric, Statistics
+from collect_stata.variables import CompactVariable
+
+# Upper bound for the number of distinct values kept in a histogram.
+# 2 ** 20 values with their counts take 16 MiB.
+MAX_HISTOGRAM_SIZE = 2 ** 20
+
+
+class Histogram:
+    """Count the distinct values of a column in sorted arrays.
+
+    Args:
+        dtype: The dtype of the values.
+
+    Attributes:
+        values: The distinct values, sorted.
+        counts: The number of occurrences of every value.
+    """
+
+    values: numpy.ndarray
+    counts: numpy.ndarray
+
+    def __init__(self, dtype: str) -> None:
+        self.values = numpy.empty(0, dtype=dtype)
+        self.counts = numpy.empty(0, dtype="int64")
+
+    def __len__(self) -> int:
+        return int(self.values.size)
+
+    def update(self, values: numpy.ndarray) -> None:
+        """Count the values of a chunk. They must not contain NaN."""
+        distinct, counts = numpy.unique(values, return_counts=True)
+        self.add(distinct, counts)
+
+    def add(self, values: numpy.ndarray, counts: numpy.ndarray) -> None:
+        """Add sorted distinct values with the number of times they occur."""
+        if not self.values.size:
+            self.values = values.astype(self.values.dtype)
+            self.counts = counts.astype("int64")
+            return
+        positions = numpy.searchsorted(self.values, values)
+        found = self.values[numpy.minimum(positions, self.values.size - 1)] == values
+        self.counts[positions[found]] += counts[found]
+        # Both arrays are sorted, so new values are inserted in order.
+        self.values = numpy.insert(self.values, positions[~found], values[~found])
+        self.counts = numpy.insert(self.counts, positions[~found], counts[~found])
+
+    def to_sketch(self) -> QuantileSketch:
+        """Move the values into a quantile sketch with the default error bound."""
+        sketch = QuantileSketch(error=DEFAULT_ERROR)
+        sketch.update_counts(self.values, self.counts)
+        self.values = self.values[:0]
+        self.counts = self.counts[:0]
+        return sketch
+
+
+class StatisticsAccumulator:
+    """Base class for the scale specific accumulators.
+
+    Attributes:
+        total: Number of values seen.
+        nulls: Number of null values seen.
+    """
+
+    total: int
+    nulls: int
+
+    def __init__(self) -> None:
+        self.total = 0
+        self.nulls = 0
+
+    def update(self, column: pandas.Series) -> None:
+        """Add the values of a chunk of the column to the summary."""
+        self.total += int(column.size)
+        self.nulls += int(column.isnull().sum())
+
+    def merge(self, other: "StatisticsAccumulator") -> None:
+        """Add the summary of another accumulator to this one."""
+        self.total += other.total
+        self.nulls += other.nulls
+
+    def statistics(self) -> Statistics:
+        """Return the statistics for all values seen."""
+        return dict()
+
+
+class CategoricalAccumulator(StatisticsAccumulator):
+    """Count valid and invalid values of a categorical variable.
+
+    Null values and missing codes count as invalid.
+
+    Args:
+        missing_codes: The values that are invalid besides null values.
+    """
+
+    missing_codes: MissingCodes
+    invalid: int
+
+    def __init__(self, missing_codes: MissingCodes = DEFAULT_MISSING_CODES) -> None:
+        super().__init__()
+        self.missing_codes = missing_codes
+        self.invalid = 0
+
+    def count(self, column: pandas.Series) -> numpy.ndarray:
+        """Count the values of a chunk and return the mask of its invalid values.
+
+        Raises:
+            TypeError: If the values can not be compared to numbers.
+        """
+        invalid_mask = self.missing_codes.invalid(column)
+        self.total += int(column.size)
+        self.invalid += int(invalid_mask.sum())
+        return invalid_mask
+
+    def update(self, column: pandas.Series) -> None:
+        self.count(column)
+
+    def merge(self, other: StatisticsAccumulator) -> None:
+        super().merge(other)
+        if isinstance(other, CategoricalAccumulator):
+            self.invalid += other.invalid
+
+    def statistics(self) -> Dict[str, Numeric]:
+        return {"valid": self.total - self.invalid, "invalid": self.invalid}
+
+
+class NominalAccumulator(StatisticsAccumulator):
+    """Count valid and invalid values of a string variable.
+
+    Null values, empty strings and "." count as invalid.
+    If distinct values are estimated, the valid values are added to a sketch.
+    """
+
+    invalid: int
+    sketch: Optional[DistinctSketch]
+
+    def __init__(self, distinct: bool = False) -> None:
+        super().__init__()
+        self.invalid = 0
+        self.sketch = DistinctSketch() if distinct else None
+
+    def update(self, column: pandas.Series) -> None:
+        self.total += int(column.size)
+        invalid_mask = invalid_string_mask(column)
+        self.invalid += int(invalid_mask.sum())
+        if self.sketch is not None:
+            self.sketch.update(column.to_numpy(dtype=object)[~invalid_mask])
+
+    def merge(self, other: StatisticsAccumulator) -> None:
+        super().merge(other)
+        if isinstance(other, NominalAccumulator):
+            self.invalid += other.invalid
+            if self.sketch is not None and other.sketch is not None:
+                self.sketch.merge(other.sketch)
+
+    def statistics(self) -> Dict[str, Numeric]:
+        statistics: Dict[str, Numeric] = {
+            "valid": self.total - self.invalid,
+            "invalid": self.invalid,
+        }
+        if self.sketch is not None:
+            statistics["distinct"] = self.sketch.estimate()
+        return statistics
+
+
+class NumericalAccumulator(CategoricalAccumulator):
+    """Summarize the valid values of a numerical variable.
+
+    Valid values are kept as a histogram of distinct values.
+    Quantiles computed from it are exact; its size depends on the number of
+    distinct values, not on the number of rows. Above MAX_HISTOGRAM_SIZE
+    distinct values, the valid values are summarized by an
+    ApproximateNumericalAccumulator with the default error bound instead.
+    If a chunk can not be compared to numbers, no statistics are returned,
+    like get_numerical_statistics does.
+    """
+
+    histogram: Histogram
+    approximation: Optional["ApproximateNumericalAccumulator"]
+    failed: bool
+
+    def __init__(self, missing_codes: MissingCodes = DEFAULT_MISSING_CODES) -> None:
+        super().__init__(missing_codes)
+        self.histogram = Histogram("float64")
+        self.approximation = None
+        self.failed = False
+
+    def update(self, column: pandas.Series) -> None:
+        if self.failed:
+            return
+        try:
+            valid_values = column[~self.count(column)].to_numpy(dtype="float64")
+        except TypeError:
+            self.failed = True
+            return
+        if self.approximation is not None:
+            self.approximation.add(valid_values)
+            return
+        self.histogram.update(valid_values)
+        self._limit_histogram()
+
+    def merge(self, other: StatisticsAccumulator) -> None:
+        super().merge(other)
+        if isinstance(other, NumericalAccumulator):
+            self.failed = self.failed or other.failed
+            if self.approximation is None and other.approximation is None:
+                self.histogram.add(other.histogram.values, other.histogram.counts)
+                self._limit_histogram()
+                return
+            approximation = self.approximation or self._approximate()
+            if other.approximation is not None:
+                approximation.merge(other.approximation)
+            else:
+                approximation.add(other.histogram.values, other.histogram.counts)
+
+    def _limit_histogram(self) -> None:
+        if len(self.histogram) > MAX_HISTOGRAM_SIZE:
+            self._approximate()
+
+    def _approximate(self) -> "ApproximateNumericalAccumulator":
+        approximation = ApproximateNumericalAccumulator(DEFAULT_ERROR, self.missing_codes)
+        approximation.add(self.histogram.values, self.histogram.counts)
+        self.histogram = Histogram("float64")
+        self.approximation = approximation
+        return approximation
+
+    def statistics(self) -> Dict[str, Numeric]:
+        if self.failed:
+            return dict()
+        if self.approximation is not None:
+            approximated = self.approximation.statistics()
+            approximated.update(super().statistics())
+            return approximated
+        values = self.histogram.values
+        counts = self.histogram.counts
+        valid_count = int(counts.sum())
+        if valid_count:
+            minimum, maximum = float(values[0]), float(values[-1])
+            mean = float(numpy.dot(values, counts) / valid_count)
+        else:
+            minimum = maximum = mean = 0.0
+        statistics: Dict[str, Numeric] = {
+            "Min.": minimum,
+            "1st Qu.": weighted_quantile(values, counts, 0.25),
+            "Median": weighted_quantile(values, counts, 0.5),
+            "Mean": mean,
+            "3rd Qu.": weighted_quantile(values, counts, 0.75),
+            "Max.": maximum,
+        }
+        statistics.update(super().statistics())
+        return statistics
+
+
+class ApproximateNumericalAccumulator(CategoricalAccumulator):
+    """Summarize the valid values of a numerical variable with a quantile sketch.
+
+    Minimum, maximum and mean are exact, quantiles are approximated
+    within the error bound of the sketch.
+    """
+
+    sketch: QuantileSketch
+    minimum: float
+    maximum: float
+    valid_sum: float
+    failed: bool
+
+    def __init__(
+        self, quantile_error: float, missing_codes: MissingCodes = DEFAULT_MISSING_CODES
+    ) -> None:
+        super().__init__(missing_codes)
+        self.sketch = QuantileSketch(error=quantile_error)
+        self.minimum = numpy.inf
+        self.maximum = -numpy.inf
+        self.valid_sum = 0.0
+        self.failed = False
+
+    def update(self, column: pandas.Series) -> None:
+        if self.failed:
+            return
+        try:
+            valid_values = column[~self.count(column)].to_numpy(dtype="float64")
+        except TypeError:
+            self.failed = True
+            return
+        self.add(valid_values)
+
+    def add(
+        self, valid_values: numpy.ndarray, counts: Optional[numpy.ndarray] = None
+    ) -> None:
+        """Add valid values, or distinct valid values and their counts.
+
+        Only the summary of the valid values is changed, not the counts of
+        valid and invalid values.
+        """
+        if not valid_values.size:
+            return
+        self.minimum = min(self.minimum, float(valid_values.min()))
+        self.maximum = max(self.maximum, float(valid_values.max()))
+        if counts is None:
+            self.valid_sum += float(valid_values.sum())
+            self.sketch.update(valid_values)
+        else:
+            self.valid_sum += float(numpy.dot(valid_values, counts))
+            self.sketch.update_counts(valid_values, counts)
+
+    def merge(self, other: StatisticsAccumulator) -> None:
+        super().merge(other)
+        if isinstance(other, ApproximateNumericalAccumulator):
+            self.failed = self.failed or other.failed
+            self.minimum = min(self.minimum, other.minimum)
+            self.maximum = max(self.maximum, other.maximum)
+            self.valid_sum += other.valid_sum
+            self.sketch.merge(other.sketch)
+
+    def statistics(self) -> Dict[str, Numeric]:
+        if self.failed:
+            return dict()
+        valid_count = self.sketch.count
+        statistics: Dict[str, Numeric] = {
+            "Min.": self.minimum if valid_count else 0.0,
+            "1st Qu.": self.sketch.quantile(0.25),
+            "Median": self.sketch.quantile(0.5),
+            "Mean": self.valid_sum / valid_count if valid_count else 0.0,
+            "3rd Qu.": self.sketch.quantile(0.75),
+            "Max.": self.maximum if valid_count else 0.0,
+        }
+        statistics.update(super().statistics())
+        return statistics
+
+
+class DateAccumulator(StatisticsAccumulator):
+    """Summarize the values of a datetime variable.
+
+    The values are kept as a histogram of their int64 representation,
+    so the median is exact and no value is converted to a string.
+    Above MAX_HISTOGRAM_SIZE distinct values, the median is approximated
+    with a QuantileSketch and rounded down to the coarsest unit of the
+    minimum and maximum. Missing values (NaT) are invalid.
+
+    Attributes:
+        unit: Time unit of the values. All chunks of a column have the same unit.
+        sketch: The sketch replacing the histogram, if it got too large.
+        minimum: The smallest valid value, kept along with the sketch.
+        maximum: The largest valid value, kept along with the sketch.
+    """
+
+    histogram: Histogram
+    unit: Optional[str]
+    sketch: Optional[QuantileSketch]
+    minimum: int
+    maximum: int
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.histogram = Histogram("int64")
+        self.unit = None
+        self.sketch = None
+        self.minimum = numpy.iinfo("int64").max
+        self.maximum = NAT
+
+    def update(self, column: pandas.Series) -> None:
+        values, self.unit = datetime_values(column)
+        self.total += int(values.size)
+        valid_values = values[values != NAT]
+        self.nulls += int(values.size - valid_values.size)
+        distinct, counts = numpy.unique(valid_values, return_counts=True)
+        self._add(distinct, counts)
+
+    def merge(self, other: StatisticsAccumulator) -> None:
+        super().merge(other)
+        if isinstance(other, DateAccumulator):
+            self.unit = self.unit or other.unit
+            self._add(other.histogram.values, other.histogram.counts)
+            if other.sketch is not None:
+                self._approximate().merge(other.sketch)
+                self.minimum = min(self.minimum, other.minimum)
+                self.maximum = max(self.maximum, other.maximum)
+
+    def _add(self, values: numpy.ndarray, counts: numpy.ndarray) -> None:
+        if self.sketch is None:
+            self.histogram.add(values, counts)
+            if len(self.histogram) > MAX_HISTOGRAM_SIZE:
+                self._approximate()
+        elif values.size:
+            self.minimum = min(self.minimum, int(values[0]))
+            self.maximum = max(self.maximum, int(values[-1]))
+            self.sketch.update_counts(values, counts)
+
+    def _approximate(self) -> QuantileSketch:
+        if self.sketch is None:
+            values = self.histogram.values
+            if values.size:
+                self.minimum = int(values[0])
+                self.maximum = int(values[-1])
+            self.sketch = self.histogram.to_sketch()
+        return self.sketch
+
+    def statistics(self) -> Statistics:
+        unit = self.unit or "ns"
+        if self.sketch is None:
+            return date_statistics(
+                self.histogram.values, self.histogram.counts, unit, invalid=self.nulls
+            )
+        valid = self.sketch.count
+        if not valid:
+            return {"valid": 0, "invalid": self.nulls}
+        iso_unit = coarsest_unit(numpy.array([self.minimum, self.maximum]), unit)
+        step = UNIT_NANOSECONDS[iso_unit] // UNIT_NANOSECONDS[unit]
+        median = int(self.sketch.quantile(0.5)) // step * step
+        median = min(max(median, self.minimum), self.maximum)
+        return summarize_dates(
+            self.minimum, median, self.maximum, unit, valid, invalid=self.nulls
+        )
+
+
+class FrequencyAccumulator:
+    """Count the occurrences of the category values of a variable.
+
+    Attributes:
+        values: The category values to count, in output order.
+        counts: The counts for every category value.
+    """
+
+    values: numpy.ndarray
+    counts: numpy.ndarray
+
+    def __init__(self, values: numpy.ndarray) -> None:
+        self.values = values
+        self.counts = numpy.zeros(len(values), dtype="int64")
+
+    def update(self, column: pandas.Series) -> None:
+        """Add the frequencies of a chunk of the column."""
+        if not self.values.size:
+            return
+        value_counts = column.value_counts(sort=False)
+        self.counts += value_counts.reindex(self.values, fill_value=0).to_numpy("int64")
+
+    def merge(self, other: "FrequencyAccumulator") -> None:
+        """Add the frequencies counted by another accumulator."""
+        self.counts += other.counts
+
+    def frequencies(self) -> numpy.ndarray:
+        """Return the frequencies ordered like the category values."""
+        return self.counts.copy()
+
+
+class VariableAccumulator:
+    """Collect statistics and frequencies of a single variable over chunks.
+
+    The accumulator for the statistics is chosen by the scale of the variable.
+    Like in get_univariate_statistics, the variable scale of datetime columns
+    is changed to "date" on the first update.
+
+    Args:
+        variable: Metadata of the variable.
+        quantile_error: If given, quantiles of numerical variables are
+                        approximated with this error bound.
+        distinct: Estimate the number of distinct values of string variables.
+        missing_codes: The values that are invalid besides null values.
+    """
+
+    variable: CompactVariable
+    quantile_error: Optional[float]
+    distinct: bool
+    missing_codes: MissingCodes
+    accumulator: Optional[StatisticsAccumulator]
+    frequency_accumulator: FrequencyAccumulator
+
+    def __init__(
+        self,
+        variable: CompactVariable,
+        quantile_error: Optional[float] = None,
+        distinct: bool = False,
+        missing_codes: MissingCodes = DEFAULT_MISSING_CODES,
+    ) -> None:
+        self.variable = variable
+        self.quantile_error = quantile_error
+        self.distinct = distinct
+        self.missing_codes = missing_codes
+        self.accumulator = None
+        self.frequency_accumulator = FrequencyAccumulator(variable.categories.values)
+
+    def _create_accumulator(self, column: pandas.Series) -> StatisticsAccumulator:
+        if is_datetime64_any_dtype(column):
+            self.variable.scale = "date"
+        scale = self.variable.scale
+        if scale == "date":
+            return DateAccumulator()
+        if scale == "cat":
+            return CategoricalAccumulator(self.missing_codes)
+        if scale == "string":
+            return NominalAccumulator(self.distinct)
+        if scale == "number" and self.quantile_error is not None:
+            return ApproximateNumericalAccumulator(
+                self.quantile_error, self.missing_codes
+            )
+        if scale == "number":
+            return NumericalAccumulator(self.missing_codes)
+        return StatisticsAccumulator()
+
+    def update(self, column: pandas.Series) -> None:
+        """Add a chunk of the column of this variable."""
+        if self.accumulator is None:
+            self.accumulator = self._create_accumulator(column)
+        self.accumulator.update(column)
+        self.frequency_accumulator.update(column)
+
+    def merge(self, other: "VariableAccumulator") -> None:
+        """Add the summary of another accumulator for the same variable."""
+        if other.accumulator is None:
+            return
+        if self.accumulator is None:
+            self.accumulator = other.accumulator
+        else:
+            self.accumulator.merge(other.accumulator)
+        self.frequency_accumulator.merge(other.frequency_accumulator)
+
+    def statistics(self) -> Statistics:
+        """Return the statistics of this variable."""
+        if self.accumulator is None:
+            return dict()
+        return self.accumulator.statistics()
+
+    def frequencies(self) -> numpy.ndarray:
+        """Return the frequencies ordered like the category values."""
+        return self.frequency_accumulator.frequencies()
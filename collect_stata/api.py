@@ -0,0 +1,288 @@
+"""Collect metadata and statistics of stata files from Python.
+
+The collect function processes stata files and yields the variables of every
+dataset with their statistics as soon as they are ready, without writing
+anything to disk. Long running processes can pass the same worker pool
+to many calls, so the workers are only started once. Writing json files is
+an optional sink, e.g.
+
+    with ProcessPoolExecutor() as pool:
+        for result in collect(["data/"], study="soep-core", pool=pool):
+            store(result.dataset, result.variables)
+"""
+__author__ = "Marius Pahl"
+
+import functools
+import os
+import pathlib
+from concurrent.futures import FIRST_COMPLETED, Executor, Future, wait
+from typing import (
+    Callable,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Set,
+    Union,
+)
+
+from collect_stata.metrics import FileMetrics, FileRecord
+from collect_stata.missing_codes import DEFAULT_MISSING_CODES, MissingCodes
+from collect_stata.read_header import StataHeaderReader
+from collect_stata.read_mmap import create_extractor
+from collect_stata.types import Variable
+from collect_stata.variables import to_dicts
+from collect_stata.write_json import (
+    generate_statistics,
+    generate_streaming_statistics,
+    update_metadata,
+    write_variables,
+)
+
+PathLike = Union[str, "os.PathLike[str]"]
+
+
+class DatasetResult(NamedTuple):
+    """Metadata and statistics of all variables of a dataset.
+
+    Attributes:
+        dataset: Name of the dataset, the name of the stata file without suffix.
+        file: The processed stata file.
+        variables: The variables with their metadata and statistics,
+                   as they are written to json files.
+        metrics: Time spent in every stage and the amount of data processed.
+    """
+
+    dataset: str
+    file: pathlib.Path
+    variables: List[Variable]
+    metrics: FileRecord
+
+
+def dta_files(paths: Iterable[PathLike]) -> List[pathlib.Path]:
+    """Expand folders to the stata files in them, largest files first.
+
+    Files are returned as given, after the files found in folders.
+    """
+    files: List[pathlib.Path] = list()
+    folder_files: List[pathlib.Path] = list()
+    for path in map(pathlib.Path, paths):
+        if path.is_dir():
+            folder_files.extend(path.glob("*.dta"))
+        else:
+            files.append(path)
+    folder_files.sort(key=lambda file: file.stat().st_size, reverse=True)
+    return folder_files + files
+
+
+def collect_dataset(  # pylint: disable=too-many-arguments
+    file: pathlib.Path,
+    study: str,
+    file_de: Optional[pathlib.Path] = None,
+    engine: str = "pandas",
+    include: Optional[Sequence[str]] = None,
+    exclude: Optional[Sequence[str]] = None,
+    chunksize: Optional[int] = None,
+    column_jobs: Optional[int] = None,
+    quantile_error: Optional[float] = None,
+    distinct: bool = False,
+    missing_codes: MissingCodes = DEFAULT_MISSING_CODES,
+) -> DatasetResult:
+    """Compute the metadata and statistics of all variables of a stata file.
+
+    See collect for the arguments.
+    """
+    metrics = FileMetrics(file)
+    with metrics.stage("open"):
+        stata_data = create_extractor(
+            file, engine=engine, include=include, exclude=exclude
+        )
+    with metrics.stage("metadata"):
+        metadata = stata_data.get_variable_metadata()
+    metrics.variables = len(metadata)
+    metrics.file_size = file.stat().st_size
+    metadata_de = None
+    if file_de:
+        with metrics.stage("metadata"):
+            metadata_de = StataHeaderReader(file_de).get_variable_metadata()
+    metadata = update_metadata(metadata, metadata_de)
+
+    if chunksize:
+        variables = generate_streaming_statistics(
+            stata_data.iter_chunks(chunksize),
+            metadata,
+            study,
+            quantile_error,
+            metrics,
+            distinct,
+            missing_codes,
+        )
+    else:
+        with metrics.stage("read"):
+            stata_data.parse_file()
+        metrics.rows = len(stata_data.data)
+        variables = generate_statistics(
+            stata_data.data,
+            metadata,
+            study,
+            quantile_error,
+            metrics,
+            column_jobs,
+            distinct,
+            missing_codes,
+        )
+    return DatasetResult(file.stem, file, to_dicts(variables), metrics.record())
+
+
+def collect(  # pylint: disable=too-many-arguments
+    paths: Iterable[PathLike],
+    study: str,
+    german_path: Optional[PathLike] = None,
+    pool: Optional[Executor] = None,
+    sink: Optional[Callable[[DatasetResult], None]] = None,
+    max_pending: Optional[int] = None,
+    engine: str = "pandas",
+    include: Optional[Sequence[str]] = None,
+    exclude: Optional[Sequence[str]] = None,
+    chunksize: Optional[int] = None,
+    column_jobs: Optional[int] = None,
+    quantile_error: Optional[float] = None,
+    distinct: bool = False,
+    missing_codes: MissingCodes = DEFAULT_MISSING_CODES,
+) -> Iterator[DatasetResult]:
+    """Collect metadata and statistics of stata files lazily.
+
+    Files are only processed while the results are consumed.
+    Without a pool, the files are processed one after another in the calling
+    process and the results are yielded in the order of the files.
+    With a pool, up to max_pending files are processed at the same time and
+    the results are yielded as they are done.
+
+    Args:
+        paths: Stata files and folders with stata files.
+        study: Name of the study.
+        german_path: Folder with german stata files of the same names.
+                     Their labels are added as german labels.
+        pool: An executor, e.g. a ProcessPoolExecutor, to process files in.
+              It is not shut down, so it can be reused for other calls.
+        sink: Called with every result before it is yielded, e.g. a JsonSink.
+        max_pending: Maximum number of files submitted to the pool at a time.
+                     Limits the memory used by results that were not consumed.
+                     Defaults to twice the number of CPUs.
+        engine: Reader for the data, "pandas" or "mmap".
+        include: Patterns of variables to compute statistics for.
+        exclude: Patterns of variables to only collect metadata for.
+        chunksize: If given, files are read in chunks of this many rows.
+        column_jobs: If greater than one, the statistics of numeric variables
+                     of a file are computed by this many processes.
+        quantile_error: If given, quantiles of numerical variables are
+                        approximated with this error bound.
+        distinct: Estimate the number of distinct values of string variables.
+        missing_codes: The missing codes of the study, e.g.
+                       MissingCodes.parse("-99:-91,9999"). By default, negative
+                       values are invalid and -200 to -1 are flagged as missings.
+
+    Yields:
+        A DatasetResult for every stata file.
+
+    Raises:
+        Any error raised while processing a file. Files submitted to the pool
+        that did not start yet are cancelled.
+    """
+    process = functools.partial(
+        collect_dataset,
+        study=study,
+        engine=engine,
+        include=include,
+        exclude=exclude,
+        chunksize=chunksize,
+        column_jobs=column_jobs,
+        quantile_error=quantile_error,
+        distinct=distinct,
+        missing_codes=missing_codes,
+    )
+    files = dta_files(paths)
+
+    def german_file(file: pathlib.Path) -> Optional[pathlib.Path]:
+        if german_path is None:
+            return None
+        return pathlib.Path(german_path, file.name)
+
+    results: Iterator[DatasetResult]
+    if pool is None:
+        results = (process(file, file_de=german_file(file)) for file in files)
+    else:
+        results = _pool_results(
+            pool,
+            (
+                functools.partial(process, file, file_de=german_file(file))
+                for file in files
+            ),
+            max_pending or 2 * (os.cpu_count() or 1),
+        )
+    for result in results:
+        if sink is not None:
+            sink(result)
+        yield result
+
+
+def _pool_results(
+    pool: Executor, tasks: Iterator[Callable[[], DatasetResult]], max_pending: int
+) -> Iterator[DatasetResult]:
+    """Run tasks in a pool, keeping at most max_pending tasks submitted."""
+    pending: Set["Future[DatasetResult]"] = set()
+    try:
+        while True:
+            for task in tasks:
+                pending.add(pool.submit(task))
+                if len(pending) >= max_pending:
+                    break
+            if not pending:
+                return
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+class JsonSink:
+    """Write every result to a json file, like the command line interface.
+
+    Args:
+        output_path: Folder for the json files.
+        latin1: Set if the source files are encoded with Latin-1.
+        compact: Write json files without indentation.
+        compress: Write gzip compressed json files.
+    """
+
+    output_path: pathlib.Path
+    latin1: bool
+    compact: bool
+    compress: bool
+
+    def __init__(
+        self,
+        output_path: PathLike,
+        latin1: bool = False,
+        compact: bool = False,
+        compress: bool = False,
+    ) -> None:
+        self.output_path = pathlib.Path(output_path)
+        self.latin1 = latin1
+        self.compact = compact
+        self.compress = compress
+        self.output_path.mkdir(parents=True, exist_ok=True)
+
+    def __call__(self, result: DatasetResult) -> None:
+        suffix = ".json.gz" if self.compress else ".json"
+        write_variables(
+            result.variables,
+            self.output_path.joinpath(result.dataset + suffix),
+            self.latin1,
+            compact=self.compact,
+            compress=self.compress,
+        )
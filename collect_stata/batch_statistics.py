@@ -0,0 +1,388 @@
+"""Compute statistics for many numeric variables at once.
+
+Instead of several passes per variable, the columns of numeric variables are
+grouped into two dimensional blocks. Every block is sorted once column wise and
+all statistics are then taken from the sorted block with NumPy reductions
+and index lookups, without Python level iteration over values and without
+filtered copies per column.
+Categorical variables with integer codes are counted with numpy.bincount
+instead, which gives the frequencies and the valid and invalid counts in a
+single pass without sorting.
+Invalid values are taken from one mask per block or column, built from the
+missing codes of the study.
+With an error bound for quantiles, blocks are not sorted. The quartiles of
+every column are approximated with a QuantileSketch and the frequencies are
+counted by looking up the values of the column in the sorted category values.
+The results are the same as the ones of the per variable functions
+get_categorical_statistics, get_numerical_statistics and set_frequencies
+in collect_stata.write_json.
+"""
+__author__ = "Marius Pahl"
+
+from typing import Dict, List, Optional, Tuple
+
+import numpy
+import pandas
+from pandas.api.types import is_bool_dtype, is_numeric_dtype
+
+from collect_stata.missing_codes import DEFAULT_MISSING_CODES, MissingCodes
+from collect_stata.sketch import QuantileSketch
+from collect_stata.types import Numeric
+from collect_stata.variables import CompactVariable
+
+# Upper bound for the number of values in a single block.
+# Limits the memory used in addition to the data to a few block copies.
+BLOCK_SIZE = 2 ** 24
+
+BATCH_SCALES = ("cat", "number")
+
+# Upper bound for the range between the smallest and largest code of a
+# categorical variable to be counted with bincount.
+MAX_CODE_RANGE = 2 ** 16
+
+# Statistics of number variables, in the order they are written.
+SUMMARY_NAMES = ("Min.", "1st Qu.", "Median", "Mean", "3rd Qu.", "Max.")
+
+# Statistics and the frequencies of the category values of a variable.
+BatchResult = Tuple[Dict[str, Numeric], numpy.ndarray]
+
+
+def is_batchable(variable: CompactVariable, data: pandas.DataFrame) -> bool:
+    """Check if the statistics of a variable can be computed in a batch."""
+    if variable.scale not in BATCH_SCALES:
+        return False
+    dtype = data[variable.name].dtype
+    return is_numeric_dtype(dtype) and not is_bool_dtype(dtype)
+
+
+def _block_dtype(dtype: numpy.dtype) -> numpy.dtype:
+    """Floats are kept to get the same rounding as pandas, integers are converted."""
+    if dtype.kind == "f":
+        return dtype
+    return numpy.dtype("float64")
+
+
+def _lerp(
+    lower: numpy.ndarray, upper: numpy.ndarray, weight: numpy.ndarray
+) -> numpy.ndarray:
+    """Interpolate linearly like numpy.quantile does."""
+    difference = upper - lower
+    result: numpy.ndarray = numpy.where(
+        weight >= 0.5, upper - difference * (1 - weight), lower + difference * weight
+    )
+    return result
+
+
+def _mean(valid_values: numpy.ndarray) -> float:
+    """Compute the mean of the valid values of a column like pandas does.
+
+    The values are summed as one contiguous array in their own dtype, so the
+    rounding is the same as for Series.mean. Summing the block along its
+    columns would round differently.
+    """
+    if not valid_values.size:
+        return 0.0
+    dtype = valid_values.dtype
+    return float(valid_values.sum(dtype=dtype) / dtype.type(valid_values.size))
+
+
+def _sorted_quantiles(
+    sorted_block: numpy.ndarray,
+    start: numpy.ndarray,
+    count: numpy.ndarray,
+    quantile: float,
+) -> numpy.ndarray:
+    """Get a quantile for every column from the valid section of the sorted block.
+
+    Args:
+        sorted_block: Column wise sorted values.
+        start: Row index of the first valid value per column.
+        count: Number of valid values per column.
+        quantile: The quantile to compute.
+    """
+    columns = numpy.arange(sorted_block.shape[1])
+    position = quantile * numpy.maximum(count - 1, 0).astype("float64")
+    lower_index = numpy.floor(position).astype("int64")
+    upper_index = numpy.minimum(lower_index + 1, numpy.maximum(count - 1, 0))
+    weight = position - lower_index
+    last_row = sorted_block.shape[0] - 1
+    lower = sorted_block[numpy.minimum(start + lower_index, last_row), columns]
+    upper = sorted_block[numpy.minimum(start + upper_index, last_row), columns]
+    return _lerp(lower, upper, weight)
+
+
+def _summarize_columns(
+    block: numpy.ndarray,
+    invalid_mask: numpy.ndarray,
+    codes: numpy.ndarray,
+    valid_counts: numpy.ndarray,
+    negative: bool,
+) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    """Sort a block and summarize the valid values of every column.
+
+    Args:
+        block: The values of the columns.
+        invalid_mask: Set for null values and missing codes.
+        codes: Number of missing codes per column.
+        valid_counts: Number of valid values per column.
+        negative: Set for the default missing codes, where all negative
+                  values are invalid.
+
+    Returns:
+        The column wise sorted block and the summary of every column,
+        with one row per name in SUMMARY_NAMES.
+    """
+    rows = block.shape[0]
+    means = [
+        _mean(block[:, index][~invalid_mask[:, index]])
+        for index in range(block.shape[1])
+    ]
+
+    # NaN is sorted to the end. With the default missing codes, the codes
+    # are sorted to the beginning, and the valid values of column i are
+    # in rows codes[i]:codes[i] + valid_counts[i].
+    # Other codes can be between valid values, so the valid values are
+    # sorted again without them.
+    sorted_block = numpy.sort(block, axis=0)
+    valid_start = codes
+    if negative:
+        sorted_valid = sorted_block
+    else:
+        sorted_valid = numpy.sort(numpy.where(invalid_mask, numpy.nan, block), axis=0)
+        valid_start = numpy.zeros_like(codes)
+    if not rows:
+        sorted_valid = numpy.zeros((1, block.shape[1]), dtype=block.dtype)
+    columns = numpy.arange(block.shape[1])
+    minimums = sorted_valid[numpy.minimum(valid_start, max(rows - 1, 0)), columns]
+    maximums = sorted_valid[
+        numpy.maximum(valid_start + valid_counts - 1, 0), columns
+    ]
+    quartiles = [
+        _sorted_quantiles(sorted_valid, valid_start, valid_counts, quantile)
+        for quantile in (0.25, 0.5, 0.75)
+    ]
+    summaries = numpy.stack(
+        [minimums, quartiles[0], quartiles[1], means, quartiles[2], maximums]
+    ).astype("float64")
+    return sorted_block, summaries
+
+
+def _number_statistics(summary: numpy.ndarray, valid: int) -> Dict[str, Numeric]:
+    """Name the summary of a column. All statistics are 0.0 without valid values."""
+    if not valid:
+        return dict.fromkeys(SUMMARY_NAMES, 0.0)
+    return {name: float(value) for name, value in zip(SUMMARY_NAMES, summary)}
+
+
+def _sorted_frequencies(
+    sorted_column: numpy.ndarray, values: numpy.ndarray
+) -> numpy.ndarray:
+    """Count how often the category values occur in a sorted column."""
+    if not values.size:
+        return numpy.zeros(0, dtype="int64")
+    frequencies: numpy.ndarray = numpy.searchsorted(
+        sorted_column, values, side="right"
+    ) - numpy.searchsorted(sorted_column, values, side="left")
+    return frequencies
+
+
+def _block_statistics(
+    block: numpy.ndarray,
+    variables: List[CompactVariable],
+    missing_codes: MissingCodes = DEFAULT_MISSING_CODES,
+) -> Dict[str, BatchResult]:
+    """Compute statistics and frequencies for all columns of one block."""
+    rows = block.shape[0]
+    invalid_mask = numpy.isnan(block)
+    nulls = invalid_mask.sum(axis=0)
+    invalid_mask |= missing_codes.codes(block)
+    valid_counts = rows - invalid_mask.sum(axis=0)
+    codes = rows - nulls - valid_counts
+    sorted_block, summaries = _summarize_columns(
+        block, invalid_mask, codes, valid_counts, missing_codes.negative
+    )
+
+    results: Dict[str, BatchResult] = dict()
+    for index, variable in enumerate(variables):
+        valid = int(valid_counts[index])
+        statistics: Dict[str, Numeric] = dict()
+        if variable.scale == "number":
+            statistics = _number_statistics(summaries[:, index], valid)
+        statistics["valid"] = valid
+        statistics["invalid"] = rows - valid
+        # NaN is sorted to the end of the column.
+        results[variable.name] = statistics, _sorted_frequencies(
+            sorted_block[: max(rows - int(nulls[index]), 0), index],
+            variable.categories.values,
+        )
+
+    return results
+
+
+def _count_values(column: numpy.ndarray, values: numpy.ndarray) -> numpy.ndarray:
+    """Count how often the category values occur in a column without sorting it."""
+    unique_values, inverse = numpy.unique(values, return_inverse=True)
+    positions = numpy.searchsorted(unique_values, column)
+    found = unique_values[numpy.minimum(positions, unique_values.size - 1)] == column
+    counts = numpy.bincount(positions[found], minlength=unique_values.size)
+    return counts[inverse]
+
+
+def _approximate_statistics(
+    valid_values: numpy.ndarray, quantile_error: float
+) -> Dict[str, Numeric]:
+    """Summarize the valid values of a column with approximated quartiles."""
+    if not valid_values.size:
+        return dict.fromkeys(SUMMARY_NAMES, 0.0)
+    sketch = QuantileSketch(error=quantile_error)
+    sketch.update(valid_values)
+    summary = (
+        float(valid_values.min()),
+        sketch.quantile(0.25),
+        sketch.quantile(0.5),
+        _mean(valid_values),
+        sketch.quantile(0.75),
+        float(valid_values.max()),
+    )
+    return dict(zip(SUMMARY_NAMES, summary))
+
+
+def _approximate_block_statistics(
+    block: numpy.ndarray,
+    variables: List[CompactVariable],
+    missing_codes: MissingCodes,
+    quantile_error: float,
+) -> Dict[str, BatchResult]:
+    """Compute statistics and frequencies for all columns of one block without sorting.
+
+    Gives the same results as get_numerical_statistics with quantile_error and
+    set_frequencies in collect_stata.write_json.
+    """
+    rows = block.shape[0]
+    invalid_mask = numpy.isnan(block) | missing_codes.codes(block)
+
+    results: Dict[str, BatchResult] = dict()
+    for index, variable in enumerate(variables):
+        column = block[:, index]
+        valid_values = column[~invalid_mask[:, index]]
+        statistics: Dict[str, Numeric] = dict()
+        if variable.scale == "number":
+            statistics = _approximate_statistics(valid_values, quantile_error)
+        statistics["valid"] = valid_values.size
+        statistics["invalid"] = rows - valid_values.size
+
+        values = variable.categories.values
+        frequencies = numpy.zeros(0, dtype="int64")
+        if values.size:
+            frequencies = _count_values(column, values)
+        results[variable.name] = (statistics, frequencies)
+
+    return results
+
+
+def count_categories(
+    column: numpy.ndarray,
+    values: numpy.ndarray,
+    missing_codes: MissingCodes = DEFAULT_MISSING_CODES,
+) -> Optional[BatchResult]:
+    """Count the codes of a categorical variable in a single pass.
+
+    Missing codes and NaN are invalid, all other codes are valid.
+
+    Args:
+        column: The values of the variable.
+        values: The category values to get frequencies for.
+        missing_codes: The values that are invalid besides NaN.
+
+    Returns:
+        The valid and invalid counts and the frequencies of the category values.
+        None if the column contains values that are not integers or the codes
+        span more than MAX_CODE_RANGE values.
+    """
+    if column.dtype.kind == "f":
+        codes = column[~numpy.isnan(column)]
+        if not numpy.isfinite(codes).all() or not numpy.array_equal(
+            codes, numpy.trunc(codes)
+        ):
+            return None
+    elif column.dtype.kind in "iu":
+        codes = column
+    else:
+        return None
+
+    rows = column.size
+    category_values = numpy.asarray(values, dtype="int64")
+    if not codes.size:
+        statistics: Dict[str, Numeric] = {"valid": 0, "invalid": rows}
+        return statistics, numpy.zeros(len(values), dtype="int64")
+    low, high = int(codes.min()), int(codes.max())
+    if high - low >= MAX_CODE_RANGE:
+        return None
+    counts = numpy.bincount(codes.astype("int64") - low, minlength=high - low + 1)
+    # The mask of missing codes is built once for the range of the codes.
+    code_mask = missing_codes.codes(numpy.arange(low, high + 1))
+    valid = int(counts[~code_mask].sum())
+    positions = category_values - low
+    inside = (positions >= 0) & (positions < counts.size)
+    frequencies = numpy.zeros(len(values), dtype="int64")
+    frequencies[inside] = counts[positions[inside]]
+    return {"valid": valid, "invalid": rows - valid}, frequencies
+
+
+def get_batch_statistics(
+    data: pandas.DataFrame,
+    metadata: List[CompactVariable],
+    missing_codes: MissingCodes = DEFAULT_MISSING_CODES,
+    quantile_error: Optional[float] = None,
+) -> Dict[str, BatchResult]:
+    """Compute statistics and frequencies for all batchable variables.
+
+    Categorical variables are counted per column with count_categories.
+    All other variables are grouped by the dtype of their columns.
+    Every group is split into blocks of at most BLOCK_SIZE values.
+
+    Args:
+        data: The dataset loaded by pandas.
+        metadata: Metadata of the variables in the dataset.
+        missing_codes: The values that are invalid besides null values.
+        quantile_error: If given, quartiles are approximated with this error bound
+                        and the blocks are not sorted.
+
+    Returns:
+        A dictionary mapping variable names to a tuple of the statistics
+        and the frequencies of the variable.
+        Variables that can not be processed in a batch are not contained.
+    """
+    groups: Dict[numpy.dtype, List[CompactVariable]] = dict()
+    results: Dict[str, BatchResult] = dict()
+    for variable in metadata:
+        if not is_batchable(variable, data):
+            continue
+        if variable.scale == "cat":
+            result = count_categories(
+                data[variable.name].to_numpy(),
+                variable.categories.values,
+                missing_codes,
+            )
+            if result is not None:
+                results[variable.name] = result
+                continue
+        dtype = _block_dtype(data[variable.name].dtype)
+        groups.setdefault(dtype, list()).append(variable)
+
+    columns_per_block = max(1, BLOCK_SIZE // max(len(data), 1))
+    for dtype, variables in groups.items():
+        for start in range(0, len(variables), columns_per_block):
+            block_variables = variables[start : start + columns_per_block]
+            block = data[[variable.name for variable in block_variables]].to_numpy(
+                dtype=dtype
+            )
+            if quantile_error is None:
+                results.update(_block_statistics(block, block_variables, missing_codes))
+            else:
+                results.update(
+                    _approximate_block_statistics(
+                        block, block_variables, missing_codes, quantile_error
+                    )
+                )
+    return results
@@ -0,0 +1,130 @@
+"""Compute statistics of datetime variables on their integer representation.
+
+Datetime columns are viewed as int64 counts of their time unit,
+so neither the column nor the values have to be converted to strings.
+Only the few resulting dates are formatted as ISO 8601 strings.
+"""
+__author__ = "Marius Pahl"
+
+from typing import Dict, Tuple, Union
+
+import numpy
+import pandas
+
+# Units tried in this order to format dates without trailing zeros.
+ISO_UNITS = ("D", "s", "ms", "us", "ns")
+
+# Length of the units in nanoseconds.
+UNIT_NANOSECONDS = {
+    "D": 86_400 * 10 ** 9,
+    "s": 10 ** 9,
+    "ms": 10 ** 6,
+    "us": 10 ** 3,
+    "ns": 1,
+}
+
+# NaT is stored as the smallest int64 value.
+NAT = numpy.iinfo("int64").min
+
+
+def datetime_values(column: pandas.Series) -> Tuple[numpy.ndarray, str]:
+    """Get the int64 representation of a datetime column without copying it.
+
+    Args:
+        column: A column with a datetime dtype.
+
+    Returns:
+        The values as counts of the time unit and the time unit of the column.
+        Missing values are NAT.
+    """
+    if column.dtype.kind != "M":
+        # Timezone aware columns are compared in UTC.
+        column = column.dt.tz_convert(None)
+    values = column.to_numpy()
+    unit, _ = numpy.datetime_data(values.dtype)
+    return values.view("int64"), unit
+
+
+def coarsest_unit(values: numpy.ndarray, unit: str) -> str:
+    """Get the coarsest ISO unit that represents all int64 dates exactly."""
+    dates = values.astype("int64").view(f"datetime64[{unit}]")
+    for iso_unit in ISO_UNITS:
+        if (dates.astype(f"datetime64[{iso_unit}]") == dates).all():
+            break
+    return iso_unit
+
+
+def format_dates(values: numpy.ndarray, unit: str) -> numpy.ndarray:
+    """Format int64 dates as ISO 8601 strings with the coarsest unit for all of them."""
+    dates = values.astype("int64").view(f"datetime64[{unit}]")
+    # Casting to str gives the same strings as numpy.datetime_as_string.
+    return dates.astype(f"datetime64[{coarsest_unit(values, unit)}]").astype(str)
+
+
+def summarize_dates(
+    minimum: int, median: int, maximum: int, unit: str, valid: int, invalid: int
+) -> Dict[str, Union[int, str]]:
+    """Format the statistics of a datetime variable with valid values.
+
+    Args:
+        minimum: Smallest valid value as count of the time unit.
+        median: Median of the valid values as count of the time unit.
+        maximum: Largest valid value as count of the time unit.
+        unit: Time unit of the values.
+        valid: Number of valid values.
+        invalid: Number of missing values.
+    """
+    minimum_date, median_date, maximum_date = format_dates(
+        numpy.array([minimum, median, maximum]), unit
+    ).tolist()
+    return {
+        "Min.": minimum_date,
+        "Median": median_date,
+        "Max.": maximum_date,
+        "valid": valid,
+        "invalid": invalid,
+    }
+
+
+def date_statistics(
+    values: numpy.ndarray, counts: numpy.ndarray, unit: str, invalid: int
+) -> Dict[str, Union[int, str]]:
+    """Compute the statistics of a datetime variable from its distinct values.
+
+    The median of an even number of values is the midpoint of the two middle
+    values, rounded down to the time unit.
+
+    Args:
+        values: Sorted distinct valid values as counts of the time unit.
+        counts: Number of occurrences of each value.
+        unit: Time unit of the values.
+        invalid: Number of missing values.
+
+    Returns:
+        Minimum, median and maximum as ISO 8601 strings and the number of
+        valid and invalid values. Without valid values, only the counts.
+    """
+    valid = int(counts.sum())
+    if not valid:
+        return {"valid": 0, "invalid": invalid}
+    cumulative = numpy.cumsum(counts)
+    lower, upper = values[
+        numpy.searchsorted(cumulative, [(valid + 1) // 2, valid // 2 + 1])
+    ]
+    median = lower + (upper - lower) // 2
+    return summarize_dates(
+        int(values[0]), int(median), int(values[-1]), unit, valid, invalid
+    )
+
+
+def get_date_statistics(column: pandas.Series) -> Dict[str, Union[int, str]]:
+    """Compute the statistics of a datetime column.
+
+    Missing values (NaT) are invalid, all other values are valid.
+    """
+    values, unit = datetime_values(column)
+    valid_values = values[values != NAT]
+    distinct, counts = numpy.unique(valid_values, return_counts=True)
+    return date_statistics(
+        distinct, counts, unit, invalid=values.size - valid_values.size
+    )
@@ -0,0 +1,163 @@
+"""Keep track of processed files to skip unchanged files in later runs.
+
+The manifest is a json file in the output folder, next to the generated
+json files. For every processed input file it records a fingerprint of the
+file and of its german companion.
+A file is reused when its fingerprints, the tool version and the options
+that influence the output did not change since the last run.
+"""
+__author__ = "Marius Pahl"
+
+import hashlib
+import json
+import os
+import pathlib
+from typing import Any, Dict, Optional
+
+from collect_stata import __version__
+
+MANIFEST_NAME = ".collect_stata_manifest.json"
+
+Fingerprint = Dict[str, Any]
+FileEntry = Dict[str, Optional[Fingerprint]]
+
+
+def file_hash(file_name: pathlib.Path, block_size: int = 2 ** 20) -> str:
+    """Compute the sha256 hash of the content of a file."""
+    content_hash = hashlib.sha256()
+    with open(file_name, "rb") as file:
+        for block in iter(lambda: file.read(block_size), b""):
+            content_hash.update(block)
+    return content_hash.hexdigest()
+
+
+def fingerprint(file_name: Optional[pathlib.Path]) -> Optional[Fingerprint]:
+    """Record size, modification time and content hash of a file.
+
+    Returns None if no file is given or the file does not exist.
+    """
+    if file_name is None or not file_name.is_file():
+        return None
+    stat = file_name.stat()
+    return {
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "sha256": file_hash(file_name),
+    }
+
+
+def is_unchanged(
+    file_name: Optional[pathlib.Path], recorded: Optional[Fingerprint]
+) -> bool:
+    """Check a file against its recorded fingerprint.
+
+    Size and modification time are compared first. The content hash is only
+    computed if the modification time changed, e.g. because the file
+    was copied. Use refresh to record the new modification time afterwards.
+    """
+    if file_name is None or not file_name.is_file():
+        return recorded is None
+    if recorded is None:
+        return False
+    stat = file_name.stat()
+    if stat.st_size != recorded["size"]:
+        return False
+    if stat.st_mtime_ns == recorded["mtime_ns"]:
+        return True
+    return bool(file_hash(file_name) == recorded["sha256"])
+
+
+def refresh(
+    file_name: Optional[pathlib.Path], recorded: Optional[Fingerprint]
+) -> Optional[Fingerprint]:
+    """Update the modification time of an unchanged file in its fingerprint.
+
+    Returns None if the recorded modification time is still current.
+    """
+    if file_name is None or recorded is None:
+        return None
+    mtime_ns = file_name.stat().st_mtime_ns
+    if mtime_ns == recorded["mtime_ns"]:
+        return None
+    return dict(recorded, mtime_ns=mtime_ns)
+
+
+class Manifest:
+    """Fingerprints of the files processed into an output folder.
+
+    Args:
+        output_path: The output folder containing the manifest.
+        options: Settings that influence the output, e.g. the study name.
+                 If they differ from the recorded ones, no file is reused.
+
+    Attributes:
+        path: Location of the manifest file.
+        options: Settings that influence the output.
+        files: Recorded entries by input file name.
+        refreshed: True if the modification time of an unchanged file was updated
+                   and the manifest should be saved.
+    """
+
+    path: pathlib.Path
+    options: Dict[str, Any]
+    files: Dict[str, FileEntry]
+    refreshed: bool
+
+    def __init__(self, output_path: pathlib.Path, options: Dict[str, Any]) -> None:
+        self.path = output_path.joinpath(MANIFEST_NAME)
+        self.options = options
+        self.files = dict()
+        self.refreshed = False
+        if not self.path.is_file():
+            return
+        with open(self.path, "r", encoding="utf-8") as manifest_file:
+            try:
+                content = json.load(manifest_file)
+            except json.JSONDecodeError:
+                return
+        if content.get("version") == __version__ and content.get("options") == options:
+            self.files = content.get("files", dict())
+
+    def is_current(
+        self,
+        file: pathlib.Path,
+        file_de: Optional[pathlib.Path],
+        output_file: pathlib.Path,
+    ) -> bool:
+        """Check if the output of a file is up to date and can be reused.
+
+        If only the modification time of a file changed, it is recorded,
+        so later runs do not compute the content hash again.
+        """
+        entry = self.files.get(file.name)
+        if entry is None or not output_file.is_file():
+            return False
+        files = {"input": file, "input_de": file_de}
+        if not all(is_unchanged(name, entry[key]) for key, name in files.items()):
+            return False
+        for key, file_name in files.items():
+            refreshed = refresh(file_name, entry[key])
+            if refreshed is not None:
+                entry[key] = refreshed
+                self.refreshed = True
+        return True
+
+    def record(self, file: pathlib.Path, entry: FileEntry) -> None:
+        """Store the fingerprints of a processed file."""
+        self.files[file.name] = entry
+
+    def save(self) -> None:
+        """Write the manifest. A temporary file is used to never leave it truncated."""
+        temporary_path = self.path.with_name(self.path.name + ".tmp")
+        with open(temporary_path, "w", encoding="utf-8") as manifest_file:
+            json.dump(
+                {"version": __version__, "options": self.options, "files": self.files},
+                manifest_file,
+                indent=2,
+            )
+        os.replace(temporary_path, self.path)
+
+
+def file_entry(file: pathlib.Path, file_de: Optional[pathlib.Path]) -> FileEntry:
+    """Create the manifest entry for an input file and its german companion."""
+    return {"input": fingerprint(file), "input_de": fingerprint(file_de)}
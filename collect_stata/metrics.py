@@ -0,0 +1,196 @@
+"""Measure the processing of files, stage by stage.
+
+Every processed file gets a FileMetrics object, that accumulates the time
+spent in each stage, e.g. reading or computing statistics, together with
+the number of rows and variables and the peak memory of the process.
+The metrics of a file are logged when it is done. At the end of a run,
+the metrics of all files are written as a run summary into the output folder.
+Metrics are plain dictionaries once recorded, so they can be passed back
+from worker processes.
+"""
+__author__ = "Marius Pahl"
+
+import contextlib
+import csv
+import json
+import logging
+import os
+import pathlib
+import sys
+import time
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    ContextManager,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+)
+
+from collect_stata import __version__
+
+if TYPE_CHECKING:
+    import pandas
+
+try:
+    import resource
+except ImportError:  # pragma: no cover
+    resource = None  # type: ignore
+
+SUMMARY_JSON = ".collect_stata_run.json"
+SUMMARY_CSV = ".collect_stata_run.csv"
+
+# Stages in the order they happen. Stages that did not happen are reported as 0.
+STAGES = (
+    "open",
+    "metadata",
+    "read",
+    "sidecar",
+    "statistics",
+    "frequencies",
+    "serialise",
+)
+
+FileRecord = Dict[str, Any]
+
+
+def peak_rss_kb() -> int:
+    """Get the peak resident set size of the current process in kilobytes.
+
+    Returns 0 on platforms without the resource module.
+    """
+    if resource is None:  # pragma: no cover
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, Linux kilobytes.
+    return int(peak / 1024) if sys.platform == "darwin" else int(peak)
+
+
+class FileMetrics:
+    """Metrics about the processing of a single file.
+
+    Args:
+        file_name: The processed stata file.
+
+    Attributes:
+        file_name: The processed stata file.
+        stages: Seconds spent in every stage.
+        file_size: Size of the file the data is read from, the stata file or its sidecar.
+        rows: Number of rows processed.
+        variables: Number of variables processed.
+    """
+
+    file_name: pathlib.Path
+    stages: Dict[str, float]
+    file_size: int
+    rows: int
+    variables: int
+
+    def __init__(self, file_name: pathlib.Path) -> None:
+        self.file_name = file_name
+        self.stages = {stage: 0.0 for stage in STAGES}
+        self.file_size = 0
+        self.rows = 0
+        self.variables = 0
+
+    @contextlib.contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Add the time spent in the with block to a stage.
+
+        A stage can be entered multiple times, e.g. once per chunk.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
+
+    def chunks(
+        self, chunks: Iterable["pandas.DataFrame"]
+    ) -> Iterator["pandas.DataFrame"]:
+        """Pass chunks through, adding the time to read them to the read stage."""
+        iterator = iter(chunks)
+        while True:
+            with self.stage("read"):
+                chunk = next(iterator, None)
+            if chunk is None:
+                return
+            self.rows += len(chunk)
+            yield chunk
+
+    def record(self) -> FileRecord:
+        """Get the metrics as a dictionary that can be serialised."""
+        return {
+            "file": self.file_name.name,
+            "seconds": sum(self.stages.values()),
+            "stages": dict(self.stages),
+            "file_size": self.file_size,
+            "rows": self.rows,
+            "variables": self.variables,
+            "peak_rss_kb": peak_rss_kb(),
+            "pid": os.getpid(),
+        }
+
+
+def measure(metrics: Optional[FileMetrics], name: str) -> ContextManager[None]:
+    """Time a stage if metrics are collected, otherwise do nothing."""
+    if metrics is None:
+        return contextlib.nullcontext()
+    return metrics.stage(name)
+
+
+def log_record(record: FileRecord) -> None:
+    """Log the metrics of a file.
+
+    The record is attached to the log record as attribute metrics,
+    so that handlers can format it, e.g. as json.
+    """
+    logging.info(
+        "Processed %s: %s rows, %s variables in %.3f seconds (%s), peak RSS %s kB",
+        record["file"],
+        record["rows"],
+        record["variables"],
+        record["seconds"],
+        ", ".join(
+            "{} {:.3f}s".format(stage, seconds)
+            for stage, seconds in record["stages"].items()
+        ),
+        record["peak_rss_kb"],
+        extra={"metrics": record},
+    )
+
+
+def write_summary(
+    output_path: pathlib.Path, records: List[FileRecord], duration: float
+) -> None:
+    """Write the metrics of all files processed in a run as json and csv.
+
+    Args:
+        output_path: The output folder.
+        records: The metrics of every processed file.
+        duration: Wall clock time of the whole run in seconds.
+    """
+    with open(output_path.joinpath(SUMMARY_JSON), "w", encoding="utf-8") as json_file:
+        json.dump(
+            {
+                "version": __version__,
+                "duration": duration,
+                "peak_rss_kb": max(
+                    [record["peak_rss_kb"] for record in records] + [peak_rss_kb()]
+                ),
+                "files": records,
+            },
+            json_file,
+            indent=2,
+        )
+
+    fieldnames = ["file", "seconds", *STAGES, "file_size", "rows", "variables"]
+    fieldnames += ["peak_rss_kb", "pid"]
+    csv_path = output_path.joinpath(SUMMARY_CSV)
+    with open(csv_path, "w", encoding="utf-8", newline="") as csv_file:
+        writer = csv.DictWriter(csv_file, fieldnames=fieldnames, extrasaction="ignore")
+        writer.writeheader()
+        for record in records:
+            writer.writerow({**record, **record["stages"]})
@@ -0,0 +1,139 @@
+"""Missing codes of a study and the masks of invalid values derived from them.
+
+Stata files of a study mark missing answers with codes in the data instead of
+empty values. By default, all negative values are missing codes and the
+category values from -200 to -1 are flagged as missings. Studies that use
+other codes give the ranges of their codes instead, e.g. "-99:-91,9999".
+
+The mask of invalid values of a column is computed once and shared by all
+statistics of the column. Only comparisons are used, so this module can be
+imported without pandas and numpy.
+"""
+__author__ = "Marius Pahl"
+
+from typing import TYPE_CHECKING, List, Optional, Sequence, Tuple, TypeVar
+
+if TYPE_CHECKING:
+    import numpy
+    import pandas
+
+# Category values flagged as missings by the default missing codes.
+DEFAULT_RANGES = ((-200.0, -1.0),)
+
+Values = TypeVar("Values", "numpy.ndarray", "pandas.Series")
+
+
+class MissingCodes:
+    """The values that are missing codes in the data of a study.
+
+    Args:
+        ranges: Pairs of the lowest and highest missing code of a range.
+                If not given, the default missing codes are used.
+
+    Attributes:
+        ranges: Pairs of the lowest and highest missing code of a range,
+                both included. Category values in a range are flagged
+                as missings.
+        negative: Set for the default missing codes, where all negative
+                  values are invalid, also outside of the ranges.
+    """
+
+    __slots__ = ("ranges", "negative")
+
+    ranges: Tuple[Tuple[float, float], ...]
+    negative: bool
+
+    def __init__(self, ranges: Optional[Sequence[Tuple[float, float]]] = None) -> None:
+        if ranges is None:
+            self.ranges = DEFAULT_RANGES
+            self.negative = True
+            return
+        if not ranges:
+            raise ValueError("At least one range of missing codes is needed.")
+        for low, high in ranges:
+            if low > high:
+                raise ValueError(
+                    "Missing codes {}:{} start above their end.".format(low, high)
+                )
+        self.ranges = tuple((float(low), float(high)) for low, high in ranges)
+        self.negative = False
+
+    @classmethod
+    def parse(cls, text: str) -> "MissingCodes":
+        """Read missing codes from a comma separated list of ranges.
+
+        A range is given as "LOW:HIGH", a single code as "CODE",
+        e.g. "-99:-91,-1,9999".
+
+        Raises:
+            ValueError: If a range is not a pair of numbers or starts above its end.
+        """
+        ranges: List[Tuple[float, float]] = list()
+        for part in text.split(","):
+            low, _, high = part.strip().partition(":")
+            try:
+                ranges.append((float(low), float(high or low)))
+            except ValueError:
+                raise ValueError(
+                    "Invalid range of missing codes {!r}".format(part)
+                ) from None
+        return cls(ranges)
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, MissingCodes):
+            return NotImplemented
+        return self.ranges == other.ranges and self.negative == other.negative
+
+    def __hash__(self) -> int:
+        return hash((self.ranges, self.negative))
+
+    def __repr__(self) -> str:
+        if self.negative:
+            return "MissingCodes()"
+        return "MissingCodes({!r})".format(list(self.ranges))
+
+    def option(self) -> Optional[List[List[float]]]:
+        """Get the ranges in a form that can be stored as json.
+
+        None for the default missing codes.
+        """
+        if self.negative:
+            return None
+        return [[low, high] for low, high in self.ranges]
+
+    def flags(self, values: Values) -> Values:
+        """Mark the values that are in one of the ranges of missing codes.
+
+        Used to flag category values as missings.
+        """
+        low, high = self.ranges[0]
+        mask = (values >= low) & (values <= high)
+        for low, high in self.ranges[1:]:
+            mask |= (values >= low) & (values <= high)
+        return mask
+
+    def codes(self, values: Values) -> Values:
+        """Mark the values that are missing codes and therefore invalid.
+
+        Null values are no missing codes. They are invalid anyway.
+
+        Raises:
+            TypeError: If the values can not be compared to numbers.
+        """
+        if self.negative:
+            return values < 0
+        flags: Values = self.flags(values)
+        return flags
+
+    def invalid(self, column: "pandas.Series") -> "numpy.ndarray":
+        """Get the mask of null values and missing codes of a column.
+
+        Raises:
+            TypeError: If the values can not be compared to numbers.
+        """
+        nulls = column.isnull().to_numpy(dtype=bool)
+        invalid: numpy.ndarray = nulls | self.codes(column).to_numpy(dtype=bool)
+        return invalid
+
+
+DEFAULT_MISSING_CODES = MissingCodes()
@@ -0,0 +1,61 @@
+"""Choices and defaults of the command line options.
+
+They are kept apart from the modules that use them, so the command line
+interface can parse its arguments without importing pandas and numpy.
+"""
+__author__ = "Marius Pahl"
+
+from typing import List, NamedTuple, Optional
+
+from collect_stata.missing_codes import DEFAULT_MISSING_CODES, MissingCodes
+
+# Readers for the data of stata files.
+ENGINES = ("pandas", "mmap")
+
+# Default bound for the normalized rank error of a quantile.
+DEFAULT_ERROR = 0.01
+
+# Formats of the sidecar files with the decoded data.
+SIDECAR_FORMATS = ("parquet", "feather")
+
+# Formats of the file with the variables of all datasets of a study.
+STUDY_FORMATS = ("ndjson", "sqlite")
+
+
+class RunOptions(NamedTuple):
+    """Settings of a run, applied to every processed file.
+
+    Attributes:
+        engine: Reader for the data, "pandas" or "mmap".
+        chunksize: If set, files are read in chunks of this many rows.
+        column_jobs: If greater than one, the statistics of numeric variables
+                     of a file are computed by this many processes.
+        include: Patterns of variables to compute statistics for.
+        exclude: Patterns of variables to only write metadata for.
+        quantile_error: If given, quantiles of numerical variables are approximated
+                        with this error bound.
+        distinct: Estimate the number of distinct values of string variables.
+        missing_codes: The values that are invalid besides null values.
+        sidecar: If "parquet" or "feather", the decoded data is written in this
+                 format next to the json files and read by later runs.
+        compact: Write json files without indentation.
+        compress: Write gzip compressed json files.
+        study_output: If "ndjson" or "sqlite", the variables of all files are also
+                      written into a single file in this format.
+        force: Process all files, even if the manifest in the output folder
+               shows that their output is up to date.
+    """
+
+    engine: str = "pandas"
+    chunksize: Optional[int] = None
+    column_jobs: Optional[int] = None
+    include: Optional[List[str]] = None
+    exclude: Optional[List[str]] = None
+    quantile_error: Optional[float] = None
+    distinct: bool = False
+    missing_codes: MissingCodes = DEFAULT_MISSING_CODES
+    sidecar: Optional[str] = None
+    compact: bool = False
+    compress: bool = False
+    study_output: Optional[str] = None
+    force: bool = False
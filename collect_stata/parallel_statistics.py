@@ -0,0 +1,184 @@
+"""Compute the statistics of the columns of a single file in several processes.
+
+The columns of numeric variables are copied once into a shared memory
+segment. Worker processes attach to the segment and compute the statistics
+of a group of columns with get_batch_statistics on NumPy views of it,
+so no column is pickled. Only the metadata of the variables and the results
+are sent between the processes.
+Workers are not forked from the calling process, because it may run other
+threads, e.g. the reader and writer threads of a pipelined run or the threads
+of a pool passed to the Python API. A child forked while another thread holds
+a lock would wait for it forever. They are forked from a fresh server process
+with the forkserver start method, or spawned where it is not available.
+"""
+__author__ = "Marius Pahl"
+
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy
+import pandas
+
+from collect_stata.batch_statistics import BatchResult, get_batch_statistics, is_batchable
+from collect_stata.missing_codes import DEFAULT_MISSING_CODES, MissingCodes
+from collect_stata.variables import CompactVariable
+
+# Below this number of values, the statistics are computed in the calling process.
+# Starting workers and copying the columns would take longer than the computation.
+MIN_PARALLEL_VALUES = 2 ** 22
+
+# Offsets of columns in the shared memory segment are aligned to this many bytes.
+ALIGNMENT = 64
+
+# Start method of the worker processes. Forking the calling process is not safe.
+START_METHOD = (
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+)
+
+
+class SharedColumn(NamedTuple):
+    """Location of a column in a shared memory segment."""
+
+    name: str
+    dtype: str
+    offset: int
+    rows: int
+
+
+def _aligned(offset: int) -> int:
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def _group_statistics(
+    segment_name: str,
+    columns: List[SharedColumn],
+    variables: List[CompactVariable],
+    missing_codes: MissingCodes,
+    quantile_error: Optional[float],
+) -> Dict[str, BatchResult]:
+    """Compute the statistics of a group of columns in a worker process."""
+    segment = shared_memory.SharedMemory(name=segment_name)
+    try:
+        data = pandas.DataFrame(
+            {
+                column.name: numpy.ndarray(
+                    column.rows,
+                    dtype=column.dtype,
+                    buffer=segment.buf,
+                    offset=column.offset,
+                )
+                for column in columns
+            },
+            copy=False,
+        )
+        results = get_batch_statistics(data, variables, missing_codes, quantile_error)
+        # The views have to be released before the segment can be closed.
+        del data
+    finally:
+        segment.close()
+    return results
+
+
+def _shared_columns(
+    data: pandas.DataFrame, variables: List[CompactVariable]
+) -> Tuple[Dict[str, SharedColumn], int]:
+    """Lay out the columns of the variables in a shared memory segment.
+
+    Returns the location of every column and the size of the segment.
+    """
+    columns: Dict[str, SharedColumn] = dict()
+    size = 0
+    for variable in variables:
+        column = data[variable.name]
+        columns[variable.name] = SharedColumn(
+            name=variable.name, dtype=column.dtype.str, offset=size, rows=len(column)
+        )
+        size = _aligned(size + column.dtype.itemsize * len(column))
+    return columns, size
+
+
+def _column_groups(
+    variables: List[CompactVariable], columns: Dict[str, SharedColumn], groups: int
+) -> List[List[CompactVariable]]:
+    """Split variables into groups of consecutive variables with similar sizes."""
+    sizes = [numpy.dtype(columns[variable.name].dtype).itemsize for variable in variables]
+    target = sum(sizes) / groups
+    result: List[List[CompactVariable]] = [list()]
+    size = 0
+    for variable, variable_size in zip(variables, sizes):
+        if size >= target and len(result) < groups:
+            result.append(list())
+            size = 0
+        result[-1].append(variable)
+        size += variable_size
+    return result
+
+
+def _worker_context() -> multiprocessing.context.BaseContext:
+    """Get the context to start workers with, without forking the calling process."""
+    context = multiprocessing.get_context(START_METHOD)
+    if START_METHOD == "forkserver":
+        # The server imports the statistics modules once for all workers.
+        context.set_forkserver_preload([__name__])
+    return context
+
+
+def get_parallel_batch_statistics(
+    data: pandas.DataFrame,
+    metadata: List[CompactVariable],
+    jobs: int,
+    missing_codes: MissingCodes = DEFAULT_MISSING_CODES,
+    quantile_error: Optional[float] = None,
+) -> Dict[str, BatchResult]:
+    """Compute statistics and frequencies of batchable variables in parallel.
+
+    Gives the same results as get_batch_statistics.
+
+    Args:
+        data: The dataset loaded by pandas.
+        metadata: Metadata of the variables in the dataset.
+        jobs: Number of worker processes.
+        missing_codes: The values that are invalid besides null values.
+        quantile_error: If given, quartiles are approximated with this error bound.
+
+    Returns:
+        A dictionary mapping variable names to a tuple of the statistics
+        and the frequencies of the variable.
+        Variables that can not be processed in a batch are not contained.
+    """
+    variables = [variable for variable in metadata if is_batchable(variable, data)]
+    if jobs < 2 or len(variables) < 2 or len(variables) * len(data) < MIN_PARALLEL_VALUES:
+        return get_batch_statistics(data, variables, missing_codes, quantile_error)
+
+    columns, size = _shared_columns(data, variables)
+    segment = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    try:
+        for column in columns.values():
+            numpy.ndarray(
+                column.rows, dtype=column.dtype, buffer=segment.buf, offset=column.offset
+            )[:] = data[column.name].to_numpy()
+
+        results: Dict[str, BatchResult] = dict()
+        groups = _column_groups(variables, columns, groups=jobs * 2)
+        with ProcessPoolExecutor(
+            max_workers=jobs, mp_context=_worker_context()
+        ) as executor:
+            futures = [
+                executor.submit(
+                    _group_statistics,
+                    segment.name,
+                    [columns[variable.name] for variable in group],
+                    group,
+                    missing_codes,
+                    quantile_error,
+                )
+                for group in groups
+            ]
+            for future in futures:
+                results.update(future.result())
+    finally:
+        segment.close()
+        segment.unlink()
+    return results
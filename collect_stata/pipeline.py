@@ -0,0 +1,206 @@
+"""Process files in a pipeline of reading, computing and writing stages.
+
+A reader thread loads the next files while the calling thread computes the
+statistics of the current file and a writer thread serialises the previous
+one. The stages are connected by bounded queues, so at most read_ahead loaded
+files and write_behind computed files wait between the stages and memory
+stays bounded. Reading and writing mostly wait for the disk or the network,
+so they overlap with the computation although they run in threads.
+"""
+__author__ = "Marius Pahl"
+
+import logging
+import queue
+import threading
+from pathlib import Path
+from typing import (
+    Any,
+    Callable,
+    Generic,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    TypeVar,
+)
+
+import pandas
+
+from collect_stata.manifest import FileEntry
+from collect_stata.metrics import FileMetrics
+from collect_stata.variables import CompactVariable
+
+Item = TypeVar("Item")
+Loaded = TypeVar("Loaded")
+Computed = TypeVar("Computed")
+
+# Marks the end of the items in a queue.
+_DONE = object()
+
+# Seconds to wait for a full queue before checking if the pipeline was stopped.
+_POLL_INTERVAL = 0.1
+
+
+class LoadedFile(NamedTuple):
+    """A file with its data and metadata read into memory."""
+
+    file: Path
+    entry: FileEntry
+    metadata: List[CompactVariable]
+    metadata_de: Optional[List[CompactVariable]]
+    data: pandas.DataFrame
+    metrics: FileMetrics
+
+
+class ComputedFile(NamedTuple):
+    """A file with the statistics of all its variables."""
+
+    file: Path
+    entry: FileEntry
+    variables: List[CompactVariable]
+    metrics: FileMetrics
+
+
+class Pipeline(Generic[Item, Loaded, Computed]):  # pylint: disable=too-few-public-methods
+    """Run items through a load, a compute and a write stage concurrently.
+
+    Args:
+        load: Called by the reader thread for every item.
+        compute: Called by the thread running the pipeline with the loaded item.
+        write: Called by the writer thread with the computed item.
+        read_ahead: Maximum number of loaded items waiting to be computed.
+        write_behind: Maximum number of computed items waiting to be written.
+
+    Attributes:
+        failed: Items that failed in any stage, with the error raised.
+                They are not passed to later stages.
+    """
+
+    load: Callable[[Item], Loaded]
+    compute: Callable[[Loaded], Computed]
+    write: Callable[[Computed], None]
+    read_ahead: int
+    write_behind: int
+    failed: List[Tuple[Item, BaseException]]
+
+    def __init__(
+        self,
+        load: Callable[[Item], Loaded],
+        compute: Callable[[Loaded], Computed],
+        write: Callable[[Computed], None],
+        read_ahead: int = 1,
+        write_behind: int = 1,
+    ) -> None:
+        if read_ahead < 1 or write_behind < 1:
+            raise ValueError("Queue sizes have to be at least one.")
+        self.load = load
+        self.compute = compute
+        self.write = write
+        self.read_ahead = read_ahead
+        self.write_behind = write_behind
+        self.failed = list()
+        self._stop = threading.Event()
+
+    def _fail(self, item: Item, error: BaseException) -> None:
+        logging.error("Processing %s failed", item, exc_info=error)
+        self.failed.append((item, error))
+
+    def _put(
+        self,
+        target: "queue.Queue[Any]",
+        entry: Any,
+        consumer: Optional[threading.Thread] = None,
+    ) -> bool:
+        """Put an entry into a bounded queue unless the pipeline was stopped.
+
+        Also gives up if the consumer thread of the queue ended,
+        because the entry would never be taken.
+        """
+        while not self._stop.is_set() and (consumer is None or consumer.is_alive()):
+            try:
+                target.put(entry, timeout=_POLL_INTERVAL)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _read(self, items: Iterable[Item], loaded: "queue.Queue[Any]") -> None:
+        try:
+            for item in items:
+                if self._stop.is_set():
+                    return
+                try:
+                    result = self.load(item)
+                except Exception as error:  # pylint: disable=broad-except
+                    self._fail(item, error)
+                    continue
+                if not self._put(loaded, (item, result)):
+                    return
+        finally:
+            self._put(loaded, _DONE)
+
+    def _write(self, computed: "queue.Queue[Any]") -> None:
+        while True:
+            entry = computed.get()
+            if entry is _DONE or self._stop.is_set():
+                return
+            item, result = entry
+            try:
+                self.write(result)
+            except Exception as error:  # pylint: disable=broad-except
+                self._fail(item, error)
+            except BaseException as error:  # pylint: disable=broad-except
+                # The writer ends; run stops handing items to it.
+                self._fail(item, error)
+                return
+
+    @staticmethod
+    def _end(target: "queue.Queue[Any]", consumer: threading.Thread) -> None:
+        """Put the end marker into a queue while its consumer thread is running."""
+        while consumer.is_alive():
+            try:
+                target.put(_DONE, timeout=_POLL_INTERVAL)
+                return
+            except queue.Full:
+                continue
+
+    def run(self, items: Iterable[Item]) -> List[Tuple[Item, BaseException]]:
+        """Process all items and return the ones that failed."""
+        loaded: "queue.Queue[Any]" = queue.Queue(maxsize=self.read_ahead)
+        computed: "queue.Queue[Any]" = queue.Queue(maxsize=self.write_behind)
+        reader = threading.Thread(
+            target=self._read, args=(items, loaded), name="collect_stata-reader"
+        )
+        writer = threading.Thread(
+            target=self._write, args=(computed,), name="collect_stata-writer"
+        )
+        reader.start()
+        writer.start()
+        try:
+            while True:
+                entry = loaded.get()
+                if entry is _DONE:
+                    break
+                item, result = entry
+                # The loaded data is released as soon as it was computed.
+                del entry
+                try:
+                    computed_result = self.compute(result)
+                except Exception as error:  # pylint: disable=broad-except
+                    self._fail(item, error)
+                    continue
+                finally:
+                    del result
+                if not self._put(computed, (item, computed_result), writer):
+                    break
+        except BaseException:
+            self._stop.set()
+            raise
+        finally:
+            # Unblocks the writer; after a stop it skips all remaining items.
+            self._end(computed, writer)
+            writer.join()
+            self._stop.set()
+            reader.join()
+        return self.failed
@@ -0,0 +1,393 @@
+"""Read only the metadata of stata dta files.
+
+The pandas StataReader is built to read data. Reading the value labels
+with it involves setting up the whole reader for the data section.
+The StataHeaderReader in this module parses the header, the variable
+descriptors, the variable labels and the value label tables and seeks past
+the data section, so its cost does not depend on the number of observations.
+Supported are the dta formats 105 to 119.
+"""
+__author__ = "Marius Pahl"
+
+import pathlib
+import struct
+from typing import BinaryIO, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy
+
+from collect_stata.variables import CompactCategories, CompactVariable
+
+# Storage types of numeric variables and their width in bytes.
+# Formats before 117 use single byte codes, later formats two byte codes.
+NUMERIC_TYPE_WIDTHS = {251: 1, 252: 2, 253: 4, 254: 4, 255: 8}
+NUMERIC_TYPE_WIDTHS_XML = {65530: 1, 65529: 2, 65528: 4, 65527: 4, 65526: 8}
+# Type codes of formats before 111 and their equivalent in later formats.
+OLD_TYPE_MAPPING = {98: 251, 105: 252, 108: 253, 102: 254, 100: 255}
+STRL_TYPE = 32768
+# Scales of the numeric storage types. All other types hold strings.
+TYPE_SCALES = {
+    code: "number" for code in [*NUMERIC_TYPE_WIDTHS, *NUMERIC_TYPE_WIDTHS_XML]
+}
+
+SUPPORTED_VERSIONS = (105, 108, 110, 111, 113, 114, 115, 117, 118, 119)
+
+
+class ValueLabelTable(NamedTuple):
+    """A value label table sorted by value.
+
+    The values and labels are shared by all variables using the table.
+    The values are a read only array, the labels must not be changed.
+    """
+
+    values: numpy.ndarray
+    labels: List[str]
+    categorical: bool
+
+
+class ValueLabelCache:
+    """Intern value label tables, so every distinct table is sorted only once.
+
+    Tables are identified by their content. Variables that share a table,
+    within a file or across files, get the same lists of values and labels.
+
+    Args:
+        max_tables: The cache is emptied when it holds more tables than this.
+
+    Attributes:
+        max_tables: The cache is emptied when it holds more tables than this.
+        hits: Number of tables found in the cache.
+        misses: Number of tables that had to be sorted.
+    """
+
+    max_tables: int
+    hits: int
+    misses: int
+    _tables: Dict[Tuple[Tuple[int, str], ...], ValueLabelTable]
+
+    def __init__(self, max_tables: int = 100_000) -> None:
+        self.max_tables = max_tables
+        self.hits = 0
+        self.misses = 0
+        self._tables = dict()
+
+    def intern(self, table: Dict[int, str]) -> ValueLabelTable:
+        """Get the sorted version of a value label table."""
+        key = tuple(table.items())
+        interned = self._tables.get(key)
+        if interned is not None:
+            self.hits += 1
+            return interned
+        self.misses += 1
+        value_label_pairs = sorted(table.items())
+        values = numpy.array([value for value, _ in value_label_pairs], dtype="int64")
+        values.flags.writeable = False
+        interned = ValueLabelTable(
+            values=values,
+            labels=[label for _, label in value_label_pairs],
+            # At the moment if a variable has value labels attached, it is
+            # interpretet as being on a categorical scale.
+            categorical=any(value > 0 and label for value, label in value_label_pairs),
+        )
+        if len(self._tables) >= self.max_tables:
+            self._tables.clear()
+        self._tables[key] = interned
+        return interned
+
+
+# Shared by all files processed in a process.
+VALUE_LABEL_CACHE = ValueLabelCache()
+
+
+def build_variable_metadata(  # pylint: disable=too-many-arguments
+    dataset: str,
+    varlist: Sequence[str],
+    lbllist: Sequence[str],
+    variable_labels: Dict[str, str],
+    value_labels: Dict[str, Dict[int, str]],
+    scales: Sequence[str],
+    cache: Optional[ValueLabelCache] = None,
+) -> List[CompactVariable]:
+    """Create the metadata of all variables from the metadata of a stata file.
+
+    Every variable is visited once, by its position in the file.
+    Every value label table is looked up once per file in the cache.
+
+    Args:
+        dataset: Name of the dataset.
+        varlist: Names of all variables.
+        lbllist: Name of the value label table attached to every variable.
+        variable_labels: Mapping of variable names to variable labels.
+        value_labels: Mapping of value label table names to value label tables.
+        scales: Scale of every variable derived from its storage type.
+                Used for variables that are not categorical.
+        cache: Cache of sorted value label tables. Defaults to VALUE_LABEL_CACHE.
+
+    Returns:
+        A CompactVariable for every variable.
+    """
+    if cache is None:
+        cache = VALUE_LABEL_CACHE
+    empty_values = numpy.array([], dtype="int64")
+    empty_values.flags.writeable = False
+    empty_table = ValueLabelTable(values=empty_values, labels=[], categorical=False)
+    tables = {
+        name: cache.intern(table) for name, table in value_labels.items() if table
+    }
+    metadata: List[CompactVariable] = list()
+    for variable, valuelabel_link, scale in zip(varlist, lbllist, scales):
+        table = tables.get(valuelabel_link, empty_table)
+        metadata.append(
+            CompactVariable(
+                name=variable,
+                dataset=dataset,
+                label=variable_labels.get(variable, None),
+                scale="cat" if table.categorical else scale,
+                categories=CompactCategories(table.values, table.labels),
+            )
+        )
+
+    return metadata
+
+
+class StataHeaderReader:
+    """Read variable metadata from a stata file without reading its data.
+
+    Args:
+        file_name: The location of the stata file to be processed.
+
+    Attributes:
+        file_name: The location of the stata file to be processed.
+        format_version: The dta format of the file, e.g. 114 or 118.
+        byteorder: "<" for little endian files, ">" for big endian files.
+        nobs: Number of observations in the file.
+        varlist: Names of all variables.
+        typlist: Stata storage type code of every variable.
+        fmtlist: Display format of every variable, e.g. "%td" for dates.
+        lbllist: Name of the value label table attached to every variable.
+        vlblist: Label of every variable.
+        section_offsets: Offsets of the sections listed in the map of
+                         files of the formats 117 to 119. Empty for older formats.
+    """
+
+    file_name: pathlib.Path
+    format_version: int
+    byteorder: str
+    nobs: int
+    varlist: List[str]
+    typlist: List[int]
+    fmtlist: List[str]
+    lbllist: List[str]
+    vlblist: List[str]
+    section_offsets: List[int]
+    _value_label_dict: Dict[str, Dict[int, str]]
+
+    def __init__(self, file_name: pathlib.Path):
+        self.file_name = file_name
+        self._value_label_dict = dict()
+        self.section_offsets = list()
+        with open(file_name, "rb") as file:
+            first_bytes = file.read(1)
+            file.seek(0)
+            if first_bytes == b"<":
+                self._read_new_format(file)
+            else:
+                self._read_old_format(file)
+
+    @property
+    def encoding(self) -> str:
+        """Encoding of strings in the file, as assumed by pandas."""
+        return "latin-1" if self.format_version < 118 else "utf-8"
+
+    def _decode(self, raw: bytes) -> str:
+        raw = raw.partition(b"\0")[0]
+        try:
+            return raw.decode(self.encoding)
+        except UnicodeDecodeError:
+            return raw.decode("latin-1")
+
+    def _unpack(self, fmt: str, file: BinaryIO) -> int:
+        size = struct.calcsize(fmt)
+        value: int = struct.unpack(self.byteorder + fmt, file.read(size))[0]
+        return value
+
+    def _read_strings(self, file: BinaryIO, count: int, width: int) -> List[str]:
+        raw = file.read(count * width)
+        return [
+            self._decode(raw[start : start + width])
+            for start in range(0, count * width, width)
+        ]
+
+    def _check_version(self) -> None:
+        if self.format_version not in SUPPORTED_VERSIONS:
+            raise ValueError(
+                "Unsupported dta format {} in {}".format(
+                    self.format_version, self.file_name
+                )
+            )
+
+    def _read_old_format(self, file: BinaryIO) -> None:
+        """Read files of the formats 105 to 115."""
+        self.format_version = file.read(1)[0]
+        self._check_version()
+        self.byteorder = ">" if file.read(1)[0] == 0x1 else "<"
+        file.read(2)  # filetype, unused
+        nvar = self._unpack("H", file)
+        self.nobs = self._unpack("I", file)
+        file.read(81 if self.format_version > 105 else 32)  # data label
+        file.read(18)  # time stamp
+
+        type_codes = list(file.read(nvar))
+        if self.format_version < 111:
+            type_codes = [
+                OLD_TYPE_MAPPING[code] if code in OLD_TYPE_MAPPING else code - 127
+                for code in type_codes
+            ]
+        self.typlist = type_codes
+
+        name_width = 33 if self.format_version > 108 else 9
+        self.varlist = self._read_strings(file, nvar, name_width)
+        file.read(2 * (nvar + 1))  # sort list
+        self.fmtlist = self._read_strings(
+            file, nvar, 49 if self.format_version > 113 else 12
+        )
+        self.lbllist = self._read_strings(file, nvar, name_width)
+        self.vlblist = self._read_strings(
+            file, nvar, 81 if self.format_version > 105 else 32
+        )
+
+        # Expansion fields end with a field of type 0.
+        while True:
+            data_type = file.read(1)[0]
+            data_length = self._unpack("i" if self.format_version > 108 else "h", file)
+            if data_type == 0:
+                break
+            file.seek(data_length, 1)
+
+        record_width = sum(NUMERIC_TYPE_WIDTHS.get(code, code) for code in self.typlist)
+        file.seek(self.nobs * record_width, 1)
+        if self.format_version >= 108:
+            self._read_value_label_tables(file)
+        else:
+            self._read_fixed_width_value_labels(file)
+
+    def _read_new_format(self, file: BinaryIO) -> None:
+        """Read files of the formats 117 to 119.
+
+        These files contain a map with the offsets of all sections.
+        """
+        file.read(len(b"<stata_dta><header><release>"))
+        self.format_version = int(file.read(3))
+        self._check_version()
+        file.read(len(b"</release><byteorder>"))
+        self.byteorder = ">" if file.read(3) == b"MSF" else "<"
+        file.read(len(b"</byteorder><K>"))
+        nvar = self._unpack("I" if self.format_version == 119 else "H", file)
+        file.read(len(b"</K><N>"))
+        self.nobs = self._unpack("I" if self.format_version == 117 else "Q", file)
+        file.read(len(b"</N><label>"))
+        label_length = self._unpack("B" if self.format_version == 117 else "H", file)
+        file.read(label_length)
+        file.read(len(b"</label><timestamp>"))
+        file.read(file.read(1)[0])
+        file.read(len(b"</timestamp></header><map>"))
+        section_offsets = [self._unpack("Q", file) for _ in range(14)]
+        self.section_offsets = section_offsets
+
+        file.seek(section_offsets[2] + len(b"<variable_types>"))
+        self.typlist = [self._unpack("H", file) for _ in range(nvar)]
+
+        name_width = 33 if self.format_version == 117 else 129
+        file.seek(section_offsets[3] + len(b"<varnames>"))
+        self.varlist = self._read_strings(file, nvar, name_width)
+        file.seek(section_offsets[5] + len(b"<formats>"))
+        self.fmtlist = self._read_strings(
+            file, nvar, 49 if self.format_version == 117 else 57
+        )
+        file.seek(section_offsets[6] + len(b"<value_label_names>"))
+        self.lbllist = self._read_strings(file, nvar, name_width)
+        file.seek(section_offsets[7] + len(b"<variable_labels>"))
+        self.vlblist = self._read_strings(
+            file, nvar, 81 if self.format_version == 117 else 321
+        )
+
+        file.seek(section_offsets[11] + len(b"<value_labels>"))
+        self._read_value_label_tables(file)
+
+    def _read_value_label_tables(self, file: BinaryIO) -> None:
+        """Read value labels with variable length strings (format 108 and later)."""
+        if self.format_version == 108:
+            name_width = 9
+        elif self.format_version <= 117:
+            name_width = 33
+        else:
+            name_width = 129
+        while True:
+            if self.format_version >= 117 and file.read(5) != b"<lbl>":
+                break
+            if not file.read(4):  # table length, missing at the end of the file
+                break
+            table_name = self._decode(file.read(name_width))
+            file.read(3)  # padding
+            entries = self._unpack("I", file)
+            text_length = self._unpack("I", file)
+            offsets = struct.unpack(
+                "{}{}i".format(self.byteorder, entries), file.read(4 * entries)
+            )
+            values = struct.unpack(
+                "{}{}i".format(self.byteorder, entries), file.read(4 * entries)
+            )
+            text = file.read(text_length)
+            ends = dict(zip(sorted(offsets), sorted(offsets)[1:] + [text_length]))
+            self._value_label_dict[table_name] = {
+                value: self._decode(text[offset : ends[offset]])
+                for offset, value in sorted(zip(offsets, values))
+            }
+            if self.format_version >= 117:
+                file.read(len(b"</lbl>"))
+
+    def _read_fixed_width_value_labels(self, file: BinaryIO) -> None:
+        """Read value labels with fixed length strings (format 105)."""
+        while True:
+            raw_entries = file.read(2)
+            if len(raw_entries) < 2:
+                break
+            entries = struct.unpack(self.byteorder + "H", raw_entries)[0]
+            table_name = self._decode(file.read(9))
+            file.read(1)  # padding
+            values = struct.unpack(
+                "{}{}h".format(self.byteorder, entries), file.read(2 * entries)
+            )
+            self._value_label_dict[table_name] = {
+                value: self._decode(file.read(8)) for value in values
+            }
+
+    def variable_labels(self) -> Dict[str, str]:
+        """Return a dictionary mapping variable names to their labels."""
+        return dict(zip(self.varlist, self.vlblist))
+
+    def value_labels(self) -> Dict[str, Dict[int, str]]:
+        """Return a dictionary mapping value label table names to their tables."""
+        return self._value_label_dict
+
+    def variable_scales(self) -> List[str]:
+        """Determine the scale of every variable from its storage type.
+
+        Categorical scales are determined from the value labels later.
+        """
+        return [TYPE_SCALES.get(type_code, "string") for type_code in self.typlist]
+
+    def get_variable_metadata(self) -> List[CompactVariable]:
+        """Gather metadata about variables in the file.
+
+        Returns:
+            A CompactVariable for every variable with the same content
+            as returned by StataDataExtractor.get_variable_metadata.
+        """
+        return build_variable_metadata(
+            dataset=pathlib.Path(self.file_name).stem,
+            varlist=self.varlist,
+            lbllist=self.lbllist,
+            variable_labels=self.variable_labels(),
+            value_labels=self.value_labels(),
+            scales=self.variable_scales(),
+        )
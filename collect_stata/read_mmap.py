@@ -0,0 +1,327 @@
+"""Read the data of stata dta files through a memory map.
+
+The data section of the formats 117 to 119 is a sequence of fixed width
+records. The MappedStataExtractor maps the file into memory and describes
+the records with a structured NumPy dtype that only contains the selected
+variables. Every column is a strided view into the mapped file, created
+with numpy.frombuffer without copying. The values of a chunk are copied once
+when the column is converted to native byte order, and missing values are
+replaced in the copy, so variables that are not selected never get allocated.
+The DataFrames do not refer to the mapped file, which is closed when all
+chunks are read.
+The resulting DataFrames are equal to those of pandas.read_stata with
+convert_categoricals=False, which is used by the StataDataExtractor.
+Dates are converted with _date_formats and _stata_elapsed_date_to_datetime_vec
+from pandas.io.stata, which are private to pandas. If a pandas release
+removes them, files are read with the StataDataExtractor instead.
+"""
+__author__ = "Marius Pahl"
+
+import mmap
+import pathlib
+import struct
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy
+import pandas
+
+from collect_stata.read_header import (
+    NUMERIC_TYPE_WIDTHS_XML,
+    STRL_TYPE,
+    StataHeaderReader,
+    build_variable_metadata,
+)
+from collect_stata.options import ENGINES
+from collect_stata.read_stata import StataDataExtractor, is_selected
+from collect_stata.sidecar import SidecarExtractor, is_current
+from collect_stata.variables import CompactVariable
+
+try:
+    from pandas.io.stata import _date_formats, _stata_elapsed_date_to_datetime_vec
+except ImportError:  # pragma: no cover
+    _date_formats = None  # type: ignore[assignment, unused-ignore]
+
+MAPPED_VERSIONS = (117, 118, 119)
+
+# NumPy types of the numeric storage types.
+NUMERIC_DTYPES = {65530: "i1", 65529: "i2", 65528: "i4", 65527: "f4", 65526: "f8"}
+
+# Values outside of these ranges are stata missing values, e.g. ".a".
+VALID_RANGES: Dict[int, Tuple[float, float]] = {
+    65530: (-127, 100),
+    65529: (-32767, 32740),
+    65528: (-2147483647, 2147483620),
+    65527: (
+        float(numpy.frombuffer(b"\xff\xff\xff\xfe", dtype="<f4")[0]),
+        float(numpy.frombuffer(b"\xff\xff\xff\x7e", dtype="<f4")[0]),
+    ),
+    65526: (
+        float(numpy.frombuffer(b"\xff\xff\xff\xff\xff\xff\xef\xff", dtype="<f8")[0]),
+        float(numpy.frombuffer(b"\xff\xff\xff\xff\xff\xff\xdf\x7f", dtype="<f8")[0]),
+    ),
+}
+
+
+def _column_dtype(type_code: int) -> str:
+    if type_code in NUMERIC_DTYPES:
+        return NUMERIC_DTYPES[type_code]
+    if type_code == STRL_TYPE:
+        return "u8"
+    return "S{}".format(type_code)
+
+
+class MappedStataExtractor:
+    """Extract metadata and data from a stata file through a memory map.
+
+    Provides the same interface as the StataDataExtractor.
+    Only the formats 117 to 119 are supported.
+
+    Args:
+        file_name: The location of the stata file to be processed.
+        include: Patterns of variables to read data for. Reads all if not given.
+        exclude: Patterns of variables to not read data for.
+
+    Attributes:
+        file_name: The location of the stata file to be processed.
+        include: Patterns of variables to read data for. Reads all if not given.
+        exclude: Patterns of variables to not read data for.
+        header: Metadata of the file, read without touching the data section.
+        data: The data of the selected variables. Is initiated empty.
+              To parse the data, the method parse_file() has to be called.
+        metadata: The metadata of all variables. Is initiated empty.
+    """
+
+    file_name: pathlib.Path
+    include: Optional[Sequence[str]]
+    exclude: Optional[Sequence[str]]
+    header: StataHeaderReader
+    data: pandas.DataFrame
+    metadata: List[CompactVariable]
+
+    def __init__(
+        self,
+        file_name: pathlib.Path,
+        include: Optional[Sequence[str]] = None,
+        exclude: Optional[Sequence[str]] = None,
+    ):
+        self.file_name = file_name
+        self.include = include
+        self.exclude = exclude
+        if _date_formats is None:
+            raise ValueError("The date conversion of pandas.io.stata is not available")
+        self.header = StataHeaderReader(file_name)
+        if self.header.format_version not in MAPPED_VERSIONS:
+            raise ValueError(
+                "The dta format {} of {} can not be memory mapped".format(
+                    self.header.format_version, file_name
+                )
+            )
+        self.data = pandas.DataFrame()
+        self.metadata = list()
+        self._strls: Optional[Dict[int, str]] = None
+
+    def selected_columns(self) -> Optional[List[str]]:
+        """Get the names of the variables to read data for.
+
+        Returns:
+            None if all variables are selected.
+        """
+        if not self.include and not self.exclude:
+            return None
+        return [
+            name
+            for name in self.header.varlist
+            if is_selected(name, self.include, self.exclude)
+        ]
+
+    def get_variable_metadata(self) -> List[CompactVariable]:
+        """Gather metadata about variables in the data.
+
+        Returns:
+            A CompactVariable for every variable with the same content
+            as returned by StataDataExtractor.get_variable_metadata.
+        """
+        if not self.metadata:
+            self.metadata = build_variable_metadata(
+                dataset=pathlib.Path(self.file_name).stem,
+                varlist=self.header.varlist,
+                lbllist=self.header.lbllist,
+                variable_labels=self.header.variable_labels(),
+                value_labels=self.header.value_labels(),
+                scales=self.header.variable_scales(),
+            )
+        return self.metadata
+
+    def parse_file(self) -> None:
+        """Initiate reading of the data and metadata."""
+        self.metadata = self.get_variable_metadata()
+        empty = pandas.DataFrame(columns=self.selected_columns() or self.header.varlist)
+        self.data = next(self._read(max(self.header.nobs, 1)), empty)
+
+    def iter_chunks(self, chunksize: int) -> Iterator[pandas.DataFrame]:
+        """Read the data in chunks of consecutive rows.
+
+        Args:
+            chunksize: The maximum number of rows per chunk.
+
+        Yields:
+            A pandas.DataFrame for every chunk of the data.
+            It only contains the columns of selected variables.
+        """
+        return self._read(chunksize)
+
+    def _record_dtype(self, columns: List[str]) -> numpy.dtype:
+        """Describe the selected fields of a record, skipping all others."""
+        offsets = dict()
+        position = 0
+        for name, type_code in zip(self.header.varlist, self.header.typlist):
+            offsets[name] = (position, type_code)
+            position += (
+                8
+                if type_code == STRL_TYPE
+                else NUMERIC_TYPE_WIDTHS_XML.get(type_code, type_code)
+            )
+        return numpy.dtype(
+            {
+                "names": columns,
+                "formats": [
+                    self.header.byteorder + _column_dtype(offsets[name][1])
+                    for name in columns
+                ],
+                "offsets": [offsets[name][0] for name in columns],
+                "itemsize": position,
+            }
+        )
+
+    def _read(self, chunksize: int) -> Iterator[pandas.DataFrame]:
+        columns = self.selected_columns()
+        if columns is None:
+            columns = list(self.header.varlist)
+        if not self.header.nobs:
+            return
+        type_codes = dict(zip(self.header.varlist, self.header.typlist))
+        formats = dict(zip(self.header.varlist, self.header.fmtlist))
+        record_dtype = self._record_dtype(columns)
+        data_offset = self.header.section_offsets[9] + len(b"<data>")
+
+        with open(self.file_name, "rb") as file:
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        records = numpy.frombuffer(
+            mapped, dtype=record_dtype, count=self.header.nobs, offset=data_offset
+        )
+        try:
+            for start in range(0, self.header.nobs, chunksize):
+                chunk = records[start : start + chunksize]
+                data = pandas.DataFrame(
+                    {
+                        name: self._convert(chunk[name], type_codes[name], formats[name])
+                        for name in columns
+                    },
+                    columns=columns,
+                )
+                # Rows are numbered through all chunks like with pandas.read_stata.
+                data.index = pandas.RangeIndex(start, start + len(chunk))
+                del chunk
+                yield data
+        finally:
+            # The views have to be released before the map can be closed.
+            del records
+            try:
+                mapped.close()
+            except BufferError:
+                # A failed conversion can still refer to a view. The map is
+                # released when the error is.
+                pass
+
+    def _convert(
+        self, values: numpy.ndarray, type_code: int, display_format: str
+    ) -> pandas.Series:
+        """Convert a column of raw values in the same way as pandas.read_stata."""
+        if type_code == STRL_TYPE:
+            strls = self._read_strls()
+            return pandas.Series([strls[int(key)] for key in values])
+        if type_code not in NUMERIC_DTYPES:
+            return pandas.Series([self.header._decode(value) for value in values])
+
+        # Always copies, so the column does not refer to the mapped file.
+        values = values.astype(values.dtype.newbyteorder("="))
+        minimum, maximum = VALID_RANGES[type_code]
+        missing = (values < minimum) | (values > maximum)
+        if missing.any():
+            if values.dtype.kind != "f":
+                values = values.astype("float64")
+            values[missing] = numpy.nan
+        series = pandas.Series(values)
+        if any(display_format.startswith(date_format) for date_format in _date_formats):
+            series = _stata_elapsed_date_to_datetime_vec(series, display_format)
+        return series
+
+    def _read_strls(self) -> Dict[int, str]:
+        """Read the long strings of the file by the reference stored in the data.
+
+        The key of a string is built from its variable and observation number
+        in the same way as it is stored in the data.
+        """
+        if self._strls is not None:
+            return self._strls
+        byteorder = self.header.byteorder
+        self._strls = {0: ""}
+        with open(self.file_name, "rb") as file:
+            file.seek(self.header.section_offsets[10] + len(b"<strls>"))
+            while file.read(3) == b"GSO":
+                if self.header.format_version == 117:
+                    raw_key = file.read(8)
+                else:
+                    raw_key = file.read(12)
+                    v_size = 2 if self.header.format_version == 118 else 3
+                    if byteorder == "<":
+                        raw_key = raw_key[:v_size] + raw_key[4 : 12 - v_size]
+                    else:
+                        raw_key = raw_key[4 - v_size : 4] + raw_key[4 + v_size :]
+                key = struct.unpack(byteorder + "Q", raw_key)[0]
+                string_type = file.read(1)[0]
+                length = struct.unpack(byteorder + "I", file.read(4))[0]
+                value = file.read(length)
+                if string_type == 130:
+                    self._strls[key] = value[:-1].decode(self.header.encoding)
+                else:
+                    self._strls[key] = str(value)
+        return self._strls
+
+
+def create_extractor(
+    file_name: pathlib.Path,
+    engine: str = "pandas",
+    include: Optional[Sequence[str]] = None,
+    exclude: Optional[Sequence[str]] = None,
+    sidecar: Optional[pathlib.Path] = None,
+) -> "Extractor":
+    """Create an extractor for a stata file with the given engine.
+
+    Args:
+        file_name: The location of the stata file to be processed.
+        engine: "pandas" to read with pandas.read_stata or "mmap" to read
+                through a memory map. Files in formats before 117 are always
+                read with pandas.
+        include: Patterns of variables to read data for.
+        exclude: Patterns of variables to not read data for.
+        sidecar: Location of a Parquet or Feather sidecar of the stata file.
+                 It is read instead of the stata file if it is newer and
+                 contains all selected variables.
+    """
+    if engine not in ENGINES:
+        raise ValueError("Unknown engine {}".format(engine))
+    if sidecar is not None and is_current(sidecar, file_name):
+        try:
+            return SidecarExtractor(sidecar, include=include, exclude=exclude)
+        except ValueError:
+            pass
+    if engine == "mmap":
+        try:
+            return MappedStataExtractor(file_name, include=include, exclude=exclude)
+        except ValueError:
+            pass
+    return StataDataExtractor(file_name, include=include, exclude=exclude)
+
+
+Extractor = Union[StataDataExtractor, MappedStataExtractor, SidecarExtractor]
@@ -3,13 +3,33 @@ __author__ = "Marius Pahl"
 
 import pathlib
 import warnings
-from typing import List
+from fnmatch import fnmatchcase
+from typing import Iterator, List, Optional, Sequence
 
 import pandas
 import pandas.io.stata
 from pandas.api.types import is_numeric_dtype
 
-from collect_stata.types import Variable
+from collect_stata.read_header import StataHeaderReader, build_variable_metadata
+from collect_stata.variables import CompactVariable
+
+# Scales of the storage types, as named in the typlist of the StataReader.
+# All other types, string widths and "Q" for long strings, hold strings.
+TYPE_SCALES = {"b": "number", "h": "number", "l": "number", "f": "number", "d": "number"}
+
+
+def is_selected(
+    name: str, include: Optional[Sequence[str]], exclude: Optional[Sequence[str]]
+) -> bool:
+    """Check a variable name against include and exclude patterns.
+
+    Patterns are case sensitive shell-style wildcards, e.g. "hk*".
+    A variable is selected if it matches any include pattern, or no include
+    patterns are given, and does not match any exclude pattern.
+    """
+    if include and not any(fnmatchcase(name, pattern) for pattern in include):
+        return False
+    return not (exclude and any(fnmatchcase(name, pattern) for pattern in exclude))
 
 
 class StataDataExtractor:
@@ -17,37 +37,89 @@ class StataDataExtractor:
 
     Args:
         file_name: The location of the stata file to be processed.
+        include: Patterns of variables to read data for. Reads all if not given.
+        exclude: Patterns of variables to not read data for.
 
     Attributes:
         file_name: The location of the stata file to be processed.
+        include: Patterns of variables to read data for. Reads all if not given.
+        exclude: Patterns of variables to not read data for.
         reader: The reader object created withe the stata file.
                 Metadata is obtained from this object. Actual data is
                 read from it into a pandas.DataFrame.
         data: The actual data parsed from the stata file. Is initiated empty.
                 To parse the data, the method parse_file() has to be called.
+                Only contains the columns of selected variables.
         metadata: The metadata obtained from the reader. Is initiated empty.
                     To parse the data, the method parse_file() has to be called.
     """
 
     file_name: pathlib.Path
+    include: Optional[Sequence[str]]
+    exclude: Optional[Sequence[str]]
     reader: pandas.io.stata.StataReader
     data: pandas.DataFrame
-    metadata: List[Variable]
-
-    def __init__(self, file_name: pathlib.Path):
+    metadata: List[CompactVariable]
+
+    def __init__(
+        self,
+        file_name: pathlib.Path,
+        include: Optional[Sequence[str]] = None,
+        exclude: Optional[Sequence[str]] = None,
+    ):
         self.file_name = file_name
+        self.include = include
+        self.exclude = exclude
         self.reader = pandas.read_stata(
             file_name, iterator=True, convert_categoricals=False
         )
         self.data = pandas.DataFrame()
         self.metadata = list()
 
+    def selected_columns(self) -> Optional[List[str]]:
+        """Get the names of the variables to read data for.
+
+        Returns:
+            None if all variables are selected, to avoid the overhead
+            of a column selection in the reader.
+        """
+        if not self.include and not self.exclude:
+            return None
+        return [
+            variable.name
+            for variable in self.get_variable_metadata()
+            if is_selected(variable.name, self.include, self.exclude)
+        ]
+
     def parse_file(self) -> None:
         """Initiate reading of the data and metadata."""
-        self.data = self.reader.read()
         self.metadata = self.get_variable_metadata()
+        self.data = self.reader.read(columns=self.selected_columns())
+
+    def iter_chunks(self, chunksize: int) -> Iterator[pandas.DataFrame]:
+        """Read the data in chunks of consecutive rows.
+
+        In contrast to parse_file, the data is never held in memory as a whole.
+        The attribute data stays empty.
 
-    def get_variable_metadata(self) -> List[Variable]:
+        Args:
+            chunksize: The maximum number of rows per chunk.
+
+        Yields:
+            A pandas.DataFrame for every chunk of the data.
+            It only contains the columns of selected variables.
+        """
+        columns = self.selected_columns()
+        while True:
+            try:
+                chunk = self.reader.read(nrows=chunksize, columns=columns)
+            except StopIteration:
+                return
+            if chunk.empty:
+                return
+            yield chunk
+
+    def get_variable_metadata(self) -> List[CompactVariable]:
         """Gather metadata about variables in the data.
 
         Stores computed metadata in the attribute metadata.
@@ -55,56 +127,45 @@ class StataDataExtractor:
         be collected again. Instead it will return metadata.
 
         Returns:
-            A list with a dictionary for every variable.
-            For a detailed description of the dictionary see the test documentation
+            A CompactVariable for every variable.
+            For a detailed description of the content see the test documentation
             for this at collect_stata.tests.test_read_stata
         """
 
         if self.metadata:
             return self.metadata
 
-        dataset = pathlib.Path(self.file_name).stem
+        # The labels are taken from the header reader, so the pandas reader
+        # is not used before the data is read. Once its value_labels method
+        # was called, it no longer reads the long strings (strL) of the formats
+        # 117 to 119 and returns their keys instead.
+        try:
+            self.metadata = StataHeaderReader(self.file_name).get_variable_metadata()
+        except ValueError:
+            self.metadata = self._pandas_metadata()
+        return self.metadata
+
+    def _pandas_metadata(self) -> List[CompactVariable]:
+        """Gather metadata with the pandas reader.
 
+        Used for formats the header reader does not support. They are older
+        than 117 and have no long strings.
+        """
+        # The reader opens the file lazily. The label methods
+        # have to be called before any attribute is accessed.
         variable_labels = self.reader.variable_labels()
         value_labels = self.reader.value_labels()
-        for variable, valuelabel_link in zip(self.reader._varlist, self.reader._lbllist):
-            variable_meta: Variable = Variable()
-            variable_meta["name"] = variable
-            variable_meta["dataset"] = dataset
-            variable_meta["label"] = variable_labels.get(variable, None)
-            variable_meta["categories"] = {"values": [], "labels": []}
-            for value, label in value_labels.get(valuelabel_link, dict()).items():
-                # At the moment if a variable has value labels attached, it is
-                # interpretet as being on a categorical scale.
-                if value > 0 and label:
-                    variable_meta["scale"] = "cat"
-                #elif variable_meta.get("scale","") != "cat" and not label:
-                #   variable_meta["scale"] = "number"
-
-                variable_meta["categories"]["values"].append(int(value))
-                variable_meta["categories"]["labels"].append(label)
-
-            variable_meta["categories"]["labels"] = self._sort_labels(
-                labels=variable_meta["categories"]["labels"],
-                values=variable_meta["categories"]["values"],
-            )
-            variable_meta["categories"]["values"] = sorted(
-                variable_meta["categories"]["values"]
-            )
-
-            if "scale" not in variable_meta:
-                variable_meta["scale"] = self.get_variable_scale(
-                    self.reader._varlist.index(variable)
-                )
-            self.metadata.append(variable_meta)
-
-        return self.metadata
-
-    @staticmethod
-    def _sort_labels(values: List[int], labels: List[str]) -> List[str]:
-        """Sort a label list on the corresponding value."""
-        label_list = [label for _, label in sorted(zip(values, labels))]
-        return label_list
+        return build_variable_metadata(
+            dataset=pathlib.Path(self.file_name).stem,
+            varlist=self.reader._varlist,
+            lbllist=self.reader._lbllist,
+            variable_labels=variable_labels,
+            value_labels=value_labels,
+            scales=[
+                TYPE_SCALES.get(str(type_code), "string")
+                for type_code in self.reader._typlist
+            ],
+        )
 
     def get_variable_scale(self, variable_index: int) -> str:
         """Guess a variables scale.
@@ -116,6 +177,9 @@ class StataDataExtractor:
         identified by using the pandas.io.stata.StataReader generator instead of
         reading the whole data into a pandas DataFrame first.
 
+        Deprecated: get_variable_metadata determines scales from the storage
+        types of all variables at once.
+
         Args:
             variable_index: Index of a variable from the list returned by
             StataReader.variable_labels(). This index is used to retrieve the
@@ -0,0 +1,201 @@
+"""Keep the decoded data of stata files as Parquet or Feather sidecar files.
+
+After a stata file was decoded, its data can be written as a columnar sidecar
+file next to the json output. The metadata of the variables, including their
+labels and value labels, is embedded as json in the schema metadata of the
+sidecar, so other tools can use the data without decoding the stata file.
+Later runs read a sidecar instead of the stata file if it is newer than
+the stata file and contains the columns of all selected variables.
+
+Sidecars need the optional dependency pyarrow.
+"""
+__author__ = "Marius Pahl"
+
+import json
+import os
+import pathlib
+from typing import Iterator, List, Optional, Sequence
+
+import pandas
+
+from collect_stata.options import SIDECAR_FORMATS
+from collect_stata.read_stata import is_selected
+from collect_stata.variables import CompactVariable, to_dicts
+
+try:
+    import pyarrow
+    import pyarrow.feather
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:  # pragma: no cover
+    pyarrow = None  # type: ignore[assignment, unused-ignore]
+
+# Keys of the schema metadata written by collect_stata.
+VARIABLES_KEY = b"collect_stata.variables"
+COLUMNS_KEY = b"collect_stata.columns"
+
+
+def sidecar_file(
+    output_path: pathlib.Path, file: pathlib.Path, sidecar: str
+) -> pathlib.Path:
+    """Get the location of the sidecar of a stata file in the output folder."""
+    if sidecar not in SIDECAR_FORMATS:
+        raise ValueError("Unknown sidecar format {}".format(sidecar))
+    return output_path.joinpath(file.stem + "." + sidecar)
+
+
+def is_current(sidecar: pathlib.Path, file: pathlib.Path) -> bool:
+    """Check if a sidecar exists and is newer than its stata file."""
+    if pyarrow is None or not sidecar.is_file():
+        return False
+    return sidecar.stat().st_mtime_ns > file.stat().st_mtime_ns
+
+
+def write_sidecar(
+    data: pandas.DataFrame, metadata: List[CompactVariable], sidecar: pathlib.Path
+) -> None:
+    """Write the data of a stata file with the metadata of its variables.
+
+    The format is taken from the suffix of the sidecar file.
+    The file is written to a temporary file first and renamed when complete.
+
+    Args:
+        data: The data read from the stata file. May only contain some columns.
+        metadata: Metadata of all variables of the stata file.
+        sidecar: Location of the sidecar file.
+    """
+    if pyarrow is None:
+        raise RuntimeError("Sidecar files need pyarrow to be installed.")
+    table = pyarrow.Table.from_pandas(data, preserve_index=False)
+    schema_metadata = dict(table.schema.metadata or {})
+    variables = json.dumps(to_dicts(metadata), ensure_ascii=False)
+    schema_metadata[VARIABLES_KEY] = variables.encode()
+    schema_metadata[COLUMNS_KEY] = json.dumps(list(data.columns)).encode()
+    table = table.replace_schema_metadata(schema_metadata)
+
+    temporary_file = sidecar.with_name(sidecar.name + ".tmp")
+    try:
+        if sidecar.suffix == ".parquet":
+            pyarrow.parquet.write_table(table, temporary_file)
+        else:
+            pyarrow.feather.write_feather(table, temporary_file)
+        os.replace(temporary_file, sidecar)
+    except BaseException:
+        temporary_file.unlink(missing_ok=True)
+        raise
+
+
+class SidecarExtractor:
+    """Extract metadata and data from the sidecar of a stata file.
+
+    Provides the same interface as the StataDataExtractor.
+
+    Args:
+        sidecar: The location of the sidecar file.
+        include: Patterns of variables to read data for. Reads all if not given.
+        exclude: Patterns of variables to not read data for.
+
+    Raises:
+        ValueError: If the sidecar does not contain the columns of all
+                    selected variables, e.g. because it was written by a
+                    run with other include or exclude patterns.
+
+    Attributes:
+        file_name: The location of the sidecar file.
+        include: Patterns of variables to read data for. Reads all if not given.
+        exclude: Patterns of variables to not read data for.
+        columns: Names of the columns stored in the sidecar.
+        data: The data read from the sidecar. Is initiated empty.
+              To read the data, the method parse_file() has to be called.
+        metadata: The metadata of the variables stored in the sidecar.
+    """
+
+    file_name: pathlib.Path
+    include: Optional[Sequence[str]]
+    exclude: Optional[Sequence[str]]
+    columns: List[str]
+    data: pandas.DataFrame
+    metadata: List[CompactVariable]
+
+    def __init__(
+        self,
+        sidecar: pathlib.Path,
+        include: Optional[Sequence[str]] = None,
+        exclude: Optional[Sequence[str]] = None,
+    ) -> None:
+        if pyarrow is None:
+            raise ValueError("Sidecar files need pyarrow to be installed.")
+        self.file_name = sidecar
+        self.include = include
+        self.exclude = exclude
+        schema = self._schema()
+        schema_metadata = schema.metadata or {}
+        if VARIABLES_KEY not in schema_metadata:
+            raise ValueError("{} was not written by collect_stata".format(sidecar))
+        self.metadata = [
+            CompactVariable.from_dict(variable)
+            for variable in json.loads(schema_metadata[VARIABLES_KEY])
+        ]
+        self.columns = json.loads(schema_metadata[COLUMNS_KEY])
+        missing = set(self.selected_columns()) - set(self.columns)
+        if missing:
+            raise ValueError(
+                "{} does not contain {} selected variables".format(sidecar, len(missing))
+            )
+        self.data = pandas.DataFrame()
+
+    def _schema(self) -> "pyarrow.Schema":
+        if self.file_name.suffix == ".parquet":
+            return pyarrow.parquet.read_schema(self.file_name)
+        with pyarrow.memory_map(str(self.file_name)) as source:
+            return pyarrow.ipc.open_file(source).schema
+
+    def selected_columns(self) -> List[str]:
+        """Get the names of the variables to read data for."""
+        return [
+            variable.name
+            for variable in self.metadata
+            if is_selected(variable.name, self.include, self.exclude)
+        ]
+
+    def get_variable_metadata(self) -> List[CompactVariable]:
+        """Get the metadata of the variables stored in the sidecar."""
+        return self.metadata
+
+    def _read_table(self) -> "pyarrow.Table":
+        columns = self.selected_columns()
+        if self.file_name.suffix == ".parquet":
+            return pyarrow.parquet.read_table(self.file_name, columns=columns)
+        return pyarrow.feather.read_table(
+            self.file_name, columns=columns, memory_map=True
+        )
+
+    def parse_file(self) -> None:
+        """Read the data of the selected variables."""
+        self.data = self._read_table().to_pandas()
+
+    def iter_chunks(self, chunksize: int) -> Iterator[pandas.DataFrame]:
+        """Read the data in chunks of consecutive rows.
+
+        Parquet files are read one batch at a time. Feather files are mapped
+        into memory, so only the chunks are converted.
+
+        Args:
+            chunksize: The maximum number of rows per chunk.
+
+        Yields:
+            A pandas.DataFrame for every chunk of the data.
+            It only contains the columns of selected variables.
+        """
+        if self.file_name.suffix == ".parquet":
+            batches = pyarrow.parquet.ParquetFile(self.file_name).iter_batches(
+                batch_size=chunksize, columns=self.selected_columns()
+            )
+        else:
+            batches = iter(self._read_table().to_batches(max_chunksize=chunksize))
+        start = 0
+        for batch in batches:
+            chunk = batch.to_pandas()
+            chunk.index = pandas.RangeIndex(start, start + len(chunk))
+            start += len(chunk)
+            yield chunk
@@ -0,0 +1,263 @@
+"""Mergeable quantile sketch for approximate quantiles of numerical variables.
+
+The QuantileSketch follows the KLL sketch by Karnin, Lang and Liberty.
+Values are kept in levels of compactors. Values at level h stand for
+2 ** h original values. A full level is sorted and every second value is
+promoted to the next level, starting randomly at the first or second value.
+Upper levels get larger capacities than lower levels, so the memory used
+only depends on the error bound and grows logarithmically with the number
+of values.
+As long as no level was compacted, the quantiles are exact.
+Large updates are sampled before they are sorted: one random value of every
+2 ** h consecutive values is added at level h, so only a bounded number of
+values is sorted per update. The sampling keeps the standard deviation of the
+rank error at a quarter of the error bound.
+
+The DistinctSketch estimates the number of distinct values with HyperLogLog
+by Flajolet, Fusy, Gandouet and Meunier. Every value is hashed to 64 bits.
+The first bits select a register, which keeps the largest position of the
+first set bit seen in the remaining bits. Its memory only depends on the
+precision, not on the number of values.
+"""
+__author__ = "Marius Pahl"
+
+import math
+from typing import List
+
+import numpy
+import pandas
+
+from collect_stata.options import DEFAULT_ERROR
+
+# Capacity of a level relative to the level above it.
+CAPACITY_RATIO = 2 / 3
+
+# Updates are sampled down to between one and two times this number of values,
+# divided by the squared error bound.
+SAMPLE_FACTOR = 4
+
+# Number of hash bits selecting a register of the DistinctSketch.
+# 2 ** 14 registers give a relative standard error of about 0.8%.
+DEFAULT_PRECISION = 14
+
+
+def weighted_quantile(
+    values: numpy.ndarray, weights: numpy.ndarray, quantile: float
+) -> float:
+    """Compute a quantile from sorted values and the number of times they occur.
+
+    Uses the same linear interpolation as pandas.Series.quantile.
+    Returns 0.0 if there are no values.
+    """
+    cumulative_weights = numpy.cumsum(weights)
+    if not cumulative_weights.size or not cumulative_weights[-1]:
+        return 0.0
+    position = quantile * (cumulative_weights[-1] - 1)
+    lower = int(numpy.floor(position))
+    upper = int(numpy.ceil(position))
+    lower_value = values[numpy.searchsorted(cumulative_weights, lower, side="right")]
+    upper_value = values[numpy.searchsorted(cumulative_weights, upper, side="right")]
+    return float(lower_value + (upper_value - lower_value) * (position - lower))
+
+
+def bit_lengths(values: numpy.ndarray) -> numpy.ndarray:
+    """Get the position of the highest set bit of every uint64 value, 0 for zero.
+
+    Values with more bits than a float64 mantissa can be rounded up to the
+    next power of two when they are converted. Their halves of 32 bits are
+    converted exactly, so frexp gives the exact position.
+    """
+    _, high = numpy.frexp((values >> numpy.uint64(32)).astype("float64"))
+    _, low = numpy.frexp((values & numpy.uint64(0xFFFFFFFF)).astype("float64"))
+    lengths: numpy.ndarray = numpy.where(high > 0, high + 32, low)
+    return lengths
+
+
+def capacity_for_error(error: float) -> int:
+    """Get the capacity of the top level, that keeps the rank error below error.
+
+    Uses the empirical relation between capacity and error of the KLL sketch
+    published with the Apache DataSketches library.
+    """
+    if not 0 < error < 1:
+        raise ValueError("The quantile error has to be between 0 and 1.")
+    return max(8, math.ceil(math.pow(2.296 / error, 1 / 0.9723)))
+
+
+class QuantileSketch:
+    """Approximate quantiles of a stream of values with bounded memory.
+
+    Args:
+        error: Bound for the normalized rank error of quantiles.
+        seed: Seed for the choice of values during compaction.
+              A fixed seed makes results reproducible.
+
+    Attributes:
+        capacity: Capacity of the top level.
+        sample_size: Updates with at least twice this number of values are sampled.
+        count: Number of values added to the sketch.
+        levels: Values kept at every level, the lowest level first.
+    """
+
+    capacity: int
+    sample_size: int
+    count: int
+    levels: List[numpy.ndarray]
+
+    def __init__(self, error: float = DEFAULT_ERROR, seed: int = 0) -> None:
+        self.capacity = capacity_for_error(error)
+        self.sample_size = math.ceil(SAMPLE_FACTOR / error ** 2)
+        self.count = 0
+        self.levels = [numpy.empty(0, dtype="float64")]
+        self._random = numpy.random.default_rng(seed)
+
+    def _level_capacity(self, level: int) -> int:
+        depth = len(self.levels) - level - 1
+        return max(2, math.ceil(self.capacity * CAPACITY_RATIO ** depth))
+
+    def update(self, values: numpy.ndarray) -> None:
+        """Add values to the sketch. NaN values are ignored.
+
+        Every value is looked at once. At most 2 * sample_size values and
+        the values kept by the sketch are sorted.
+        """
+        values = numpy.asarray(values, dtype="float64")
+        values = values[~numpy.isnan(values)]
+        self.count += values.size
+        level = 0
+        while values.size >> level >= 2 * self.sample_size:
+            level += 1
+        if level:
+            # A random value of every stratum stands for all values of the stratum.
+            stride = 1 << level
+            strata = values.size >> level
+            positions = numpy.arange(0, strata * stride, stride)
+            positions += self._random.integers(stride, size=strata)
+            sampled, values = values[positions], values[strata * stride :]
+            while len(self.levels) <= level:
+                self.levels.append(numpy.empty(0, dtype="float64"))
+            self.levels[level] = numpy.concatenate([self.levels[level], sampled])
+        self.levels[0] = numpy.concatenate([self.levels[0], values])
+        self._compress()
+
+    def update_counts(self, values: numpy.ndarray, counts: numpy.ndarray) -> None:
+        """Add distinct values with the number of times they occur.
+
+        A value is added at the levels of the set bits of its count,
+        so the sketch stands for the same values as if every occurrence
+        was added, without repeating them.
+        """
+        values = numpy.asarray(values, dtype="float64")
+        counts = numpy.asarray(counts, dtype="int64")
+        self.count += int(counts.sum())
+        level = 0
+        while counts.size:
+            if level == len(self.levels):
+                self.levels.append(numpy.empty(0, dtype="float64"))
+            self.levels[level] = numpy.concatenate(
+                [self.levels[level], values[counts & 1 == 1]]
+            )
+            counts = counts >> 1
+            values, counts = values[counts > 0], counts[counts > 0]
+            level += 1
+        self._compress()
+
+    def merge(self, other: "QuantileSketch") -> None:
+        """Add all values of another sketch to this one."""
+        self.count += other.count
+        for level, values in enumerate(other.levels):
+            if level == len(self.levels):
+                self.levels.append(numpy.empty(0, dtype="float64"))
+            self.levels[level] = numpy.concatenate([self.levels[level], values])
+        self._compress()
+
+    def _compress(self) -> None:
+        level = 0
+        while level < len(self.levels):
+            values = self.levels[level]
+            if values.size > self._level_capacity(level):
+                values = numpy.sort(values)
+                # With an odd number of values, one value stays at this level.
+                kept, values = values[: values.size % 2], values[values.size % 2 :]
+                promoted = values[self._random.integers(2) :: 2]
+                self.levels[level] = kept
+                if level + 1 == len(self.levels):
+                    self.levels.append(numpy.empty(0, dtype="float64"))
+                self.levels[level + 1] = numpy.concatenate(
+                    [self.levels[level + 1], promoted]
+                )
+                # Capacities depend on the number of levels; start over.
+                level = 0
+                continue
+            level += 1
+
+    def quantile(self, quantile: float) -> float:
+        """Get the approximate quantile of all values added to the sketch.
+
+        Returns 0.0 if the sketch is empty.
+        """
+        values = numpy.concatenate(self.levels)
+        weights = numpy.concatenate(
+            [
+                numpy.full(level_values.size, 2 ** level, dtype="int64")
+                for level, level_values in enumerate(self.levels)
+            ]
+        )
+        order = numpy.argsort(values, kind="stable")
+        return weighted_quantile(values[order], weights[order], quantile)
+
+
+class DistinctSketch:
+    """Estimate the number of distinct values of a stream with HyperLogLog.
+
+    Args:
+        precision: Number of hash bits used to select a register.
+                   The relative standard error is about 1.04 / sqrt(2 ** precision).
+
+    Attributes:
+        precision: Number of hash bits used to select a register.
+        registers: Largest rank seen per register.
+    """
+
+    precision: int
+    registers: numpy.ndarray
+
+    def __init__(self, precision: int = DEFAULT_PRECISION) -> None:
+        if not 4 <= precision <= 18:
+            raise ValueError("The precision has to be between 4 and 18.")
+        self.precision = precision
+        self.registers = numpy.zeros(2 ** precision, dtype="uint8")
+
+    def update(self, values: numpy.ndarray) -> None:
+        """Add values to the sketch.
+
+        Values are hashed by their content with pandas.util.hash_array,
+        without building a table of the distinct values.
+        """
+        if len(values) == 0:
+            return
+        hashes = pandas.util.hash_array(numpy.asarray(values), categorize=False)
+        width = 64 - self.precision
+        registers = (hashes >> numpy.uint64(width)).astype("intp")
+        remainders = hashes & numpy.uint64((1 << width) - 1)
+        # The rank is the position of the first set bit; zero gives width + 1.
+        ranks = (width + 1 - bit_lengths(remainders)).astype("uint8")
+        numpy.maximum.at(self.registers, registers, ranks)
+
+    def merge(self, other: "DistinctSketch") -> None:
+        """Add all values of another sketch with the same precision to this one."""
+        if other.precision != self.precision:
+            raise ValueError("Only sketches with the same precision can be merged.")
+        numpy.maximum(self.registers, other.registers, out=self.registers)
+
+    def estimate(self) -> int:
+        """Get the estimated number of distinct values added to the sketch."""
+        size = self.registers.size
+        alpha = 0.7213 / (1 + 1.079 / size)
+        harmonic_sum = numpy.ldexp(1.0, -self.registers.astype("int64")).sum()
+        estimate = alpha * size ** 2 / harmonic_sum
+        empty = int((self.registers == 0).sum())
+        if estimate <= 2.5 * size and empty:
+            # Linear counting is more accurate for small numbers of values.
+            estimate = size * math.log(size / empty)
+        return int(round(estimate))
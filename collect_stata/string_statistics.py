@@ -0,0 +1,54 @@
+"""Compute statistics of string variables without counting every distinct value.
+
+Null values and the missing strings "" and "." are found with vectorised
+lookups over the column instead of counting every value with a Counter.
+The number of distinct valid values can be estimated with a DistinctSketch
+instead of building a histogram of all values.
+"""
+__author__ = "Marius Pahl"
+
+from typing import Dict, Optional
+
+import numpy
+import pandas
+
+from collect_stata.sketch import DistinctSketch
+
+STRING_MISSINGS = ("", ".")
+
+_MISSING_INDEX = pandas.Index(STRING_MISSINGS, dtype=object)
+
+
+def invalid_string_mask(column: pandas.Series) -> numpy.ndarray:
+    """Mark null values and missing strings with vectorised lookups.
+
+    The missing strings are found by a hash lookup of every value
+    in an index of STRING_MISSINGS, which works on object and string arrays.
+    """
+    mask: numpy.ndarray = _MISSING_INDEX.get_indexer(column.array) != -1
+    mask |= column.isna().to_numpy(dtype=bool)
+    return mask
+
+
+def get_string_statistics(
+    column: pandas.Series, sketch: Optional[DistinctSketch] = None
+) -> Dict[str, int]:
+    """Compute the statistics of a string column.
+
+    Null values, "" and "." are invalid, all other values are valid.
+
+    Args:
+        column: The values of the variable.
+        sketch: If given, the valid values are added to it and its estimate
+                of the distinct valid values is returned as "distinct".
+
+    Returns:
+        The number of valid and invalid values.
+    """
+    invalid_mask = invalid_string_mask(column)
+    invalid = int(invalid_mask.sum())
+    statistics = {"valid": len(column) - invalid, "invalid": invalid}
+    if sketch is not None:
+        sketch.update(column.to_numpy(dtype=object)[~invalid_mask])
+        statistics["distinct"] = sketch.estimate()
+    return statistics
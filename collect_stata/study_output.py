@@ -0,0 +1,231 @@
+"""Write the variables of all datasets of a study into a single file.
+
+Instead of one json file per dataset, all variables of a study can be
+written into one newline delimited json file or one SQLite database, keyed by
+dataset and variable name. Datasets are added one at a time as soon as they
+are processed. Datasets that are reused from an earlier run keep their
+variables, datasets that are rebuilt replace them.
+
+Newline delimited json files are built as a temporary file and moved into
+place when closed. SQLite databases are updated in place with one transaction
+per dataset. In both cases, a failed run keeps all datasets written before,
+like the json files and the manifest of the run.
+
+Both outputs are UTF-8 encoded. Text that pandas decoded incorrectly is
+repaired the way the json files repair it, if that gives valid UTF-8.
+Otherwise the text is stored as it was decoded, so no character is lost.
+"""
+__author__ = "Marius Pahl"
+
+import abc
+import json
+import os
+import pathlib
+import sqlite3
+from types import TracebackType
+from typing import TYPE_CHECKING, Collection, List, Optional, TextIO, Type
+
+from collect_stata.options import STUDY_FORMATS
+from collect_stata.types import Variable
+from collect_stata.write_json import output_encoding
+
+if TYPE_CHECKING:
+    from collect_stata.api import DatasetResult
+
+
+def study_output_file(
+    output_path: pathlib.Path, study: str, format_: str
+) -> pathlib.Path:
+    """Get the location of the study output in the output folder."""
+    if format_ not in STUDY_FORMATS:
+        raise ValueError("Unknown study output format {}".format(format_))
+    return output_path.joinpath(study + "." + format_)
+
+
+class StudyOutput(abc.ABC):
+    """Base class for study outputs.
+
+    A study output is used as a context manager. It can also be passed as
+    a sink to collect_stata.collect.
+
+    Args:
+        file_name: Location of the study output.
+        keep: Names of the datasets whose variables are kept from
+              an earlier run. All other datasets are removed.
+        latin1: Set if the source files are encoded with Latin-1.
+
+    Attributes:
+        file_name: Location of the study output.
+        keep: Names of the datasets whose variables are kept.
+        encoding: The encoding used for json files of the same run.
+    """
+
+    file_name: pathlib.Path
+    keep: Collection[str]
+    encoding: str
+
+    def __init__(
+        self, file_name: pathlib.Path, keep: Collection[str] = (), latin1: bool = False
+    ) -> None:
+        self.file_name = file_name
+        self.keep = keep
+        self.encoding = output_encoding(latin1)
+
+    def __enter__(self) -> "StudyOutput":
+        self.open()
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        self.close()
+
+    def __call__(self, result: "DatasetResult") -> None:
+        self.write(result.dataset, result.variables)
+
+    def _dumps(self, variable: Variable) -> str:
+        """Serialise a variable to a line with the content of a json output file."""
+        text = json.dumps(variable, ensure_ascii=False)
+        # Text is stored like the bytes of the json files would be decoded
+        # as UTF-8. Text of files that are really Latin-1 encoded, e.g. umlauts
+        # in labels, is no valid UTF-8 in this encoding and is kept as it is.
+        try:
+            return text.encode(self.encoding).decode("utf-8")
+        except UnicodeError:
+            return text
+
+    @abc.abstractmethod
+    def open(self) -> None:
+        """Prepare the output and keep the variables of reused datasets."""
+
+    @abc.abstractmethod
+    def write(self, dataset: str, variables: List[Variable]) -> None:
+        """Add or replace the variables of a dataset."""
+
+    @abc.abstractmethod
+    def close(self) -> None:
+        """Finish the output with all datasets written so far."""
+
+
+class NdjsonStudyOutput(StudyOutput):
+    """Write one variable per line into a newline delimited json file.
+
+    Lines of reused datasets are copied from the existing file.
+    """
+
+    _file: TextIO
+
+    def _temporary_file(self) -> pathlib.Path:
+        return self.file_name.with_name(self.file_name.name + ".tmp")
+
+    def open(self) -> None:
+        # Stays open until close, like the output used as a context manager.
+        self._file = open(  # pylint: disable=consider-using-with
+            self._temporary_file(), "w", encoding="utf-8"
+        )
+        if not self.keep or not self.file_name.is_file():
+            return
+        try:
+            with open(self.file_name, encoding="utf-8") as existing:
+                for line in existing:
+                    if json.loads(line).get("dataset") in self.keep:
+                        self._file.write(line)
+        except BaseException:
+            self._file.close()
+            self._temporary_file().unlink()
+            raise
+
+    def write(self, dataset: str, variables: List[Variable]) -> None:
+        for variable in variables:
+            self._file.write(self._dumps(variable) + "\n")
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+        os.replace(self._temporary_file(), self.file_name)
+
+
+class SqliteStudyOutput(StudyOutput):
+    """Write variables into a SQLite database with a row per variable.
+
+    The table variables has the primary key (dataset, variable).
+    The column data holds the variable as json, like in the json output files.
+    Study, label and scale are stored in own columns for queries.
+    """
+
+    connection: Optional[sqlite3.Connection] = None
+
+    def open(self) -> None:
+        # The thread opening the output owns the connection and closes it.
+        # Pipelined runs write the datasets from their writer thread in between,
+        # which is joined before the output is closed, so the connection is
+        # never used by two threads at a time.
+        connection = sqlite3.connect(self.file_name, check_same_thread=False)
+        try:
+            with connection:
+                connection.execute(
+                    "CREATE TABLE IF NOT EXISTS variables ("
+                    "dataset TEXT NOT NULL, variable TEXT NOT NULL, study TEXT, "
+                    "label TEXT, scale TEXT, data TEXT NOT NULL, "
+                    "PRIMARY KEY (dataset, variable)) WITHOUT ROWID"
+                )
+                rows = connection.execute("SELECT DISTINCT dataset FROM variables")
+                datasets = [row[0] for row in rows]
+                connection.executemany(
+                    "DELETE FROM variables WHERE dataset = ?",
+                    [(dataset,) for dataset in datasets if dataset not in self.keep],
+                )
+        except BaseException:
+            connection.close()
+            raise
+        self.connection = connection
+
+    def write(self, dataset: str, variables: List[Variable]) -> None:
+        if self.connection is None:
+            raise RuntimeError("The study output is not open.")
+        with self.connection:
+            self.connection.execute("DELETE FROM variables WHERE dataset = ?", (dataset,))
+            self.connection.executemany(
+                "INSERT INTO variables VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        dataset,
+                        variable["name"],
+                        variable.get("study"),
+                        variable.get("label"),
+                        variable.get("scale"),
+                        self._dumps(variable),
+                    )
+                    for variable in variables
+                ],
+            )
+
+    def close(self) -> None:
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+def create_study_output(
+    output_path: pathlib.Path,
+    study: str,
+    format_: str,
+    keep: Collection[str] = (),
+    latin1: bool = False,
+) -> StudyOutput:
+    """Create the study output in the given format in the output folder.
+
+    Args:
+        output_path: The output folder.
+        study: Name of the study, used as name of the output file.
+        format_: "ndjson" or "sqlite".
+        keep: Names of the datasets whose variables are kept from an earlier run.
+        latin1: Set if the source files are encoded with Latin-1.
+    """
+    file_name = study_output_file(output_path, study, format_)
+    if format_ == "sqlite":
+        return SqliteStudyOutput(file_name, keep, latin1)
+    return NdjsonStudyOutput(file_name, keep, latin1)
@@ -1,8 +1,11 @@
 """All custom type definitions for the project."""
-from typing import Dict, List, TypedDict, Union
+from typing import List, Mapping, Optional, TypedDict, Union
 
 Numeric = Union[int, float]
 
+# Datetime variables have ISO 8601 dates as statistics.
+Statistics = Mapping[str, Union[Numeric, str]]
+
 
 class Categories(TypedDict, total=False):
     """Represent the metadata about categories of a Variable."""
@@ -19,9 +22,9 @@ class Variable(TypedDict, total=False):
 
     study: str
     categories: Categories
-    statistics: Dict[str, Numeric]
+    statistics: Statistics
     dataset: str
     name: str
-    label: str
+    label: Optional[str]
     label_de: str
     scale: str
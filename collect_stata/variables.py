@@ -0,0 +1,186 @@
+"""Compact representation of variables while their statistics are computed.
+
+Files with tens of thousands of variables and large value label tables
+would need millions of small Python objects if every variable was a
+dictionary with lists of category values, frequencies and missing flags.
+A CompactVariable stores its fields in __slots__ and the category values,
+missing flags and frequencies in NumPy arrays. The values and labels of a
+value label table are shared by all variables using it.
+Variables are only converted to the Variable dictionaries of
+collect_stata.types when they are serialised.
+"""
+__author__ = "Marius Pahl"
+
+from typing import Iterable, List, Optional
+
+import numpy
+
+from collect_stata.types import Categories, Numeric, Statistics, Variable
+
+
+class CompactCategories:
+    """The categories of a variable in arrays.
+
+    Args:
+        values: The category values, sorted. Shared with other variables.
+        labels: The labels of the category values. Shared with other variables.
+
+    Attributes:
+        values: The category values as int64 array, sorted.
+        labels: The labels of the category values.
+        labels_de: The german labels of the category values, if available.
+        missings: Flags of the category values that are missing codes.
+                  Set when the statistics of the variable are computed.
+        frequencies: The frequencies of the category values in the data.
+                     Set when the statistics of the variable are computed.
+    """
+
+    __slots__ = ("values", "labels", "labels_de", "missings", "frequencies")
+
+    values: numpy.ndarray
+    labels: List[str]
+    labels_de: Optional[List[str]]
+    missings: Optional[numpy.ndarray]
+    frequencies: Optional[numpy.ndarray]
+
+    def __init__(self, values: numpy.ndarray, labels: List[str]) -> None:
+        self.values = values
+        self.labels = labels
+        self.labels_de = None
+        self.missings = None
+        self.frequencies = None
+
+    def value_list(self) -> List[Numeric]:
+        """Get the category values as Python ints."""
+        values: List[Numeric] = self.values.tolist()
+        return values
+
+    def to_dict(self) -> Categories:
+        """Convert the categories to the dictionary written to json files.
+
+        The labels are copied, because they are shared with other variables
+        and the value label cache.
+        """
+        categories = Categories(values=self.value_list(), labels=list(self.labels))
+        if self.labels_de is not None:
+            categories["labels_de"] = list(self.labels_de)
+        if self.missings is not None:
+            categories["missings"] = self.missings.tolist()
+        if self.frequencies is not None:
+            categories["frequencies"] = self.frequencies.tolist()
+        return categories
+
+    @classmethod
+    def from_dict(cls, categories: Categories) -> "CompactCategories":
+        """Create categories from the dictionary of a json file."""
+        compact = cls(
+            numpy.asarray(categories.get("values", []), dtype="int64"),
+            categories.get("labels", []),
+        )
+        compact.labels_de = categories.get("labels_de")
+        if "missings" in categories:
+            compact.missings = numpy.asarray(categories["missings"], dtype=bool)
+        if "frequencies" in categories:
+            compact.frequencies = numpy.asarray(categories["frequencies"], dtype="int64")
+        return compact
+
+
+class CompactVariable:
+    """The metadata and statistics of a single variable.
+
+    Args:
+        name: Name of the variable.
+        dataset: Name of the dataset.
+        label: Label of the variable.
+        scale: Scale of the variable, e.g. "cat", "number" or "string".
+        categories: The categories of the variable.
+
+    Attributes:
+        name: Name of the variable.
+        dataset: Name of the dataset.
+        label: Label of the variable.
+        scale: Scale of the variable. Datetime columns change it to "date".
+        categories: The categories of the variable.
+        label_de: The german label of the variable, if it was looked up.
+        study: Name of the study. Set when the statistics are computed.
+        statistics: The statistics of the variable. Not set for variables
+                    without data.
+    """
+
+    __slots__ = (
+        "name",
+        "dataset",
+        "label",
+        "scale",
+        "categories",
+        "label_de",
+        "study",
+        "statistics",
+    )
+
+    name: str
+    dataset: str
+    label: Optional[str]
+    scale: str
+    categories: CompactCategories
+    label_de: Optional[str]
+    study: Optional[str]
+    statistics: Optional[Statistics]
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        name: str,
+        dataset: str,
+        label: Optional[str],
+        scale: str,
+        categories: CompactCategories,
+    ) -> None:
+        self.name = name
+        self.dataset = dataset
+        self.label = label
+        self.scale = scale
+        self.categories = categories
+        self.label_de = None
+        self.study = None
+        self.statistics = None
+
+    def to_dict(self) -> Variable:
+        """Convert the variable to the dictionary written to json files.
+
+        The keys are in the order the json files had before variables
+        were compact, so the output stays the same.
+        """
+        variable = Variable(
+            name=self.name,
+            dataset=self.dataset,
+            label=self.label,
+            categories=self.categories.to_dict(),
+            scale=self.scale,
+        )
+        if self.label_de is not None:
+            variable["label_de"] = self.label_de
+        if self.study is not None:
+            variable["study"] = self.study
+        if self.statistics is not None:
+            variable["statistics"] = self.statistics
+        return variable
+
+    @classmethod
+    def from_dict(cls, variable: Variable) -> "CompactVariable":
+        """Create a variable from the dictionary of a json file."""
+        compact = cls(
+            variable["name"],
+            variable.get("dataset", ""),
+            variable.get("label"),
+            variable.get("scale", ""),
+            CompactCategories.from_dict(variable.get("categories", Categories())),
+        )
+        compact.label_de = variable.get("label_de")
+        compact.study = variable.get("study")
+        compact.statistics = variable.get("statistics")
+        return compact
+
+
+def to_dicts(variables: Iterable[CompactVariable]) -> List[Variable]:
+    """Convert variables to the dictionaries written to json files."""
+    return [variable.to_dict() for variable in variables]
@@ -1,20 +1,37 @@
 """write_json.py"""
 __author__ = "Marius Pahl"
 
+import gzip
 import json
 import logging
+import os
 import pathlib
-from collections import Counter
-from typing import Dict, List, Optional, Union
+from typing import Dict, Iterable, Iterator, List, Optional, TextIO, Union
 
 import numpy
 import pandas
 from pandas.api.types import is_numeric_dtype, is_datetime64_any_dtype
 
-from collect_stata.types import Categories, Numeric, Variable
-
-
-def get_categorical_frequencies(elem: Variable, data: pandas.DataFrame) -> Categories:
+from collect_stata.accumulators import VariableAccumulator
+from collect_stata.batch_statistics import get_batch_statistics
+from collect_stata.dates import get_date_statistics
+from collect_stata.metrics import FileMetrics, measure
+from collect_stata.missing_codes import DEFAULT_MISSING_CODES, MissingCodes
+from collect_stata.parallel_statistics import get_parallel_batch_statistics
+from collect_stata.sketch import DistinctSketch, QuantileSketch
+from collect_stata.string_statistics import get_string_statistics
+from collect_stata.types import Categories, Numeric, Statistics, Variable
+from collect_stata.variables import CompactVariable
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None  # type: ignore[assignment, unused-ignore]
+
+
+def get_categorical_frequencies(
+    elem: CompactVariable, data: pandas.DataFrame
+) -> Categories:
     """Generate dict with frequencies and labels for categorical variables
 
     Input:
@@ -28,68 +45,110 @@ def get_categorical_frequencies(elem: Variable, data: pandas.DataFrame) -> Categ
 
 
 def get_categorical_statistics(
-    elem: Variable, data: pandas.DataFrame
+    elem: CompactVariable,
+    data: pandas.DataFrame,
+    invalid_mask: Optional[numpy.ndarray] = None,
 ) -> Dict[str, Union[int, float]]:
     """Generate dict with statistics for categorical variables
 
     Input:
     elem: dict
     data: pandas DataFrame
+    invalid_mask: mask of the invalid values of the variable,
+                  computed with the default missing codes if not given
 
     Output:
     dict
     """
 
-    total = data[elem["name"]].size
-    invalid = int(data[elem["name"]].isnull().sum()) + int(
-        sum(n < 0 for n in data[elem["name"]])
-    )
+    if invalid_mask is None:
+        invalid_mask = DEFAULT_MISSING_CODES.invalid(data[elem.name])
+    total = data[elem.name].size
+    invalid = int(invalid_mask.sum())
     valid = total - invalid
 
     return {"valid": valid, "invalid": invalid}
 
 
-def get_nominal_statistics(elem: Variable, data: pandas.DataFrame) -> Dict[str, Numeric]:
+def get_nominal_statistics(
+    elem: CompactVariable, data: pandas.DataFrame, distinct: bool = False
+) -> Dict[str, Numeric]:
     """Generate dict with statistics for nominal variables
 
     Input:
     elem: dict
     data: pandas DataFrame
+    distinct: if set, the number of distinct valid values is estimated
 
     Output:
     dict
     """
 
-    frequencies = Counter(data[elem["name"]])
-    string_missings = frequencies[""] + frequencies["."]
-    valid = data[elem["name"]].value_counts().sum() - string_missings
-    invalid = data[elem["name"]].isnull().sum() + string_missings
+    sketch = DistinctSketch() if distinct else None
+    return dict(get_string_statistics(data[elem.name], sketch))
+
+
+def get_approximate_summary(
+    values: pandas.Series, quantile_error: float
+) -> pandas.Series:
+    """Summarize values like Series.describe with approximated quantiles
+
+    The quantiles are taken from a QuantileSketch instead of sorting the values.
+
+    Input:
+    values: pandas Series
+    quantile_error: error bound of the quantiles
+
+    Output:
+    summary: pandas Series with the keys used by Series.describe
+    """
 
-    return {"valid": int(valid), "invalid": int(invalid)}
+    sketch = QuantileSketch(error=quantile_error)
+    sketch.update(values.to_numpy(dtype="float64"))
+    return pandas.Series(
+        {
+            "min": values.min(),
+            "25%": sketch.quantile(0.25),
+            "50%": sketch.quantile(0.5),
+            "mean": values.mean(),
+            "75%": sketch.quantile(0.75),
+            "max": values.max(),
+        }
+    )
 
 
 def get_numerical_statistics(
-    elem: Variable, data: pandas.DataFrame
+    elem: CompactVariable,
+    data: pandas.DataFrame,
+    quantile_error: Optional[float] = None,
+    invalid_mask: Optional[numpy.ndarray] = None,
 ) -> Dict[str, Union[float, int]]:
     """Generate dict with statistics for numerical variables
 
     Input:
     elem: dict
     data: pandas DataFrame
+    quantile_error: if given, quantiles are approximated with this error bound
+    invalid_mask: mask of the invalid values of the variable,
+                  computed with the default missing codes if not given
 
     Output:
     statistics: OrderedDict
     """
 
-    data_without_missings = data[data[elem["name"]] >= 0][elem["name"]]
+    column = data[elem.name]
+    if invalid_mask is None:
+        invalid_mask = DEFAULT_MISSING_CODES.invalid(column)
+    data_without_missings = column[~invalid_mask]
 
-    total = data[elem["name"]].size
-    invalid = int(data[elem["name"]].isnull().sum()) + int(
-        sum(n < 0 for n in data[elem["name"]])
-    )
+    total = column.size
+    invalid = int(invalid_mask.sum())
     valid = total - invalid
 
-    summary = data_without_missings.describe()
+    if quantile_error is None:
+        summary = data_without_missings.describe()
+    else:
+        summary = get_approximate_summary(data_without_missings, quantile_error)
     return {
         "Min.": float(numpy.nan_to_num(summary["min"])),
         "1st Qu.": float(numpy.nan_to_num(summary["25%"])),
@@ -103,29 +162,44 @@ def get_numerical_statistics(
 
 
 def get_univariate_statistics(
-    elem: Variable, data: pandas.DataFrame
-) -> Dict[str, Union[int, float]]:
+    elem: CompactVariable,
+    data: pandas.DataFrame,
+    quantile_error: Optional[float] = None,
+    distinct: bool = False,
+    missing_codes: MissingCodes = DEFAULT_MISSING_CODES,
+) -> Statistics:
     """Call function to generate statistics depending on the variable type
 
+    The mask of invalid values is computed once for the column
+    and passed to the statistics functions.
+
     Input:
     elem: dict
     data: pandas DataFrame
+    quantile_error: if given, quantiles are approximated with this error bound
+    distinct: if set, the number of distinct values of strings is estimated
+    missing_codes: the values that are invalid besides null values
 
     Output:
     statistics: OrderedDict
     """
 
-    if is_datetime64_any_dtype(data[elem["name"]]):
-        data[elem["name"]] = data[elem["name"]].apply(str)
-        elem["scale"] = "string"
-
-    if elem["scale"] == "cat":
-        statistics = get_categorical_statistics(elem, data)
-    elif elem["scale"] == "string":
-        statistics = get_nominal_statistics(elem, data)
-    elif elem["scale"] == "number":
+    statistics: Statistics
+    column = data[elem.name]
+    if is_datetime64_any_dtype(column):
+        elem.scale = "date"
+        statistics = get_date_statistics(column)
+    elif elem.scale == "cat":
+        statistics = get_categorical_statistics(
+            elem, data, missing_codes.invalid(column)
+        )
+    elif elem.scale == "string":
+        statistics = get_nominal_statistics(elem, data, distinct)
+    elif elem.scale == "number":
         try:
-            statistics = get_numerical_statistics(elem, data)
+            statistics = get_numerical_statistics(
+                elem, data, quantile_error, missing_codes.invalid(column)
+            )
         except TypeError:
             statistics = dict()
     else:
@@ -134,7 +208,9 @@ def get_univariate_statistics(
     return statistics
 
 
-def set_frequencies(variable_metadata: Variable, data: pandas.DataFrame) -> Variable:
+def set_frequencies(
+    variable_metadata: CompactVariable, data: pandas.DataFrame
+) -> CompactVariable:
     """Store frequencies of variable values in an equally ordered list
 
     Args:
@@ -145,51 +221,193 @@ def set_frequencies(variable_metadata: Variable, data: pandas.DataFrame) -> Vari
         data:              The original dataset loaded by pandas.
 
     Returns:
-        The variable metadata with added list at ["categories"]["frequencies"].
-        List order is dependent on the list at ["categories"]["values"]
+        The variable metadata with an added array at categories.frequencies.
+        Array order is dependent on the array at categories.values
     """
 
-    value_counts: pandas.Series = data[variable_metadata["name"]].value_counts()
+    categories = variable_metadata.categories
+    if not categories.values.size:
+        # Without categories there is nothing to count.
+        categories.frequencies = numpy.zeros(0, dtype="int64")
+        return variable_metadata
 
-    variable_metadata["categories"]["frequencies"] = [
-        int(value_counts[value]) if value in value_counts else 0
-        for value in variable_metadata["categories"]["values"]
-    ]
+    value_counts: pandas.Series = data[variable_metadata.name].value_counts()
+
+    categories.frequencies = value_counts.reindex(
+        categories.values, fill_value=0
+    ).to_numpy("int64")
 
     return variable_metadata
 
 
-def generate_statistics(
-    data: pandas.DataFrame, metadata: List[Variable], study: str
-) -> List[Variable]:
+def generate_statistics(  # pylint: disable=too-many-arguments
+    data: pandas.DataFrame,
+    metadata: List[CompactVariable],
+    study: str,
+    quantile_error: Optional[float] = None,
+    metrics: Optional[FileMetrics] = None,
+    jobs: Optional[int] = None,
+    distinct: bool = False,
+    missing_codes: MissingCodes = DEFAULT_MISSING_CODES,
+) -> List[CompactVariable]:
     """Prepare statistics for every variable
 
+    See iter_statistics for the arguments.
+
+    Output:
+    stat: OrderedDict
+    """
+    return list(
+        iter_statistics(
+            data, metadata, study, quantile_error, metrics, jobs, distinct, missing_codes
+        )
+    )
+
+
+def iter_statistics(  # pylint: disable=too-many-arguments
+    data: pandas.DataFrame,
+    metadata: List[CompactVariable],
+    study: str,
+    quantile_error: Optional[float] = None,
+    metrics: Optional[FileMetrics] = None,
+    jobs: Optional[int] = None,
+    distinct: bool = False,
+    missing_codes: MissingCodes = DEFAULT_MISSING_CODES,
+) -> Iterator[CompactVariable]:
+    """Prepare statistics for every variable and yield it as soon as it is ready
+
+    Variables without a column in the data, e.g. because they were excluded
+    from reading, only get metadata and no statistics or frequencies.
+
     Input:
     data: pandas DataFrame
     metadata: dict
     study: string
+    quantile_error: if given, quantiles are approximated with this error bound
+    metrics: if given, the time spent is added to its stages
+    distinct: if set, the number of distinct values of strings is estimated
+    jobs: if greater than one, numeric variables are processed by this many processes
+    missing_codes: the values that are invalid besides null values
 
     Output:
-    stat: OrderedDict
+    the variables of metadata with statistics, in the same order
     """
 
-    logging.info("Processing {} variables for", len(metadata))
+    logging.info("Processing %s variables for study %s", len(metadata), study)
+    # Numeric variables are processed together in blocks.
+    # All others fall back to the per variable functions.
+    # Batches count frequencies along with the statistics.
+    # With quantile_error, they approximate the quartiles instead of sorting.
+    with measure(metrics, "statistics"):
+        batch_variables = [variable for variable in metadata if variable.name in data]
+        if jobs is not None and jobs > 1:
+            batch_statistics = get_parallel_batch_statistics(
+                data, batch_variables, jobs, missing_codes, quantile_error
+            )
+        else:
+            batch_statistics = get_batch_statistics(
+                data, batch_variables, missing_codes, quantile_error
+            )
     for variable_metadata in metadata:
-        variable_metadata["study"] = study
-        variable_metadata["statistics"] = get_univariate_statistics(
-            variable_metadata, data
+        variable_metadata.study = study
+        categories = variable_metadata.categories
+        categories.missings = missing_codes.flags(categories.values)
+        if variable_metadata.name in batch_statistics:
+            statistics, frequencies = batch_statistics.pop(variable_metadata.name)
+            variable_metadata.statistics = statistics
+            categories.frequencies = frequencies
+        elif variable_metadata.name in data:
+            with measure(metrics, "statistics"):
+                variable_metadata.statistics = get_univariate_statistics(
+                    variable_metadata, data, quantile_error, distinct, missing_codes
+                )
+            with measure(metrics, "frequencies"):
+                variable_metadata = set_frequencies(variable_metadata, data)
+        yield variable_metadata
+
+
+def generate_streaming_statistics(  # pylint: disable=too-many-arguments
+    chunks: Iterable[pandas.DataFrame],
+    metadata: List[CompactVariable],
+    study: str,
+    quantile_error: Optional[float] = None,
+    metrics: Optional[FileMetrics] = None,
+    distinct: bool = False,
+    missing_codes: MissingCodes = DEFAULT_MISSING_CODES,
+) -> List[CompactVariable]:
+    """Prepare statistics for every variable from chunks of the data
+
+    See iter_streaming_statistics for the arguments.
+
+    Output:
+    stat: OrderedDict
+    """
+    return list(
+        iter_streaming_statistics(
+            chunks, metadata, study, quantile_error, metrics, distinct, missing_codes
         )
-        variable_metadata["categories"]["missings"] = [
-            -200 <= value < 0 for value in variable_metadata["categories"]["values"]
-        ]
-        variable_metadata = set_frequencies(variable_metadata, data)
+    )
 
-    return metadata
+
+def iter_streaming_statistics(  # pylint: disable=too-many-arguments
+    chunks: Iterable[pandas.DataFrame],
+    metadata: List[CompactVariable],
+    study: str,
+    quantile_error: Optional[float] = None,
+    metrics: Optional[FileMetrics] = None,
+    distinct: bool = False,
+    missing_codes: MissingCodes = DEFAULT_MISSING_CODES,
+) -> Iterator[CompactVariable]:
+    """Prepare statistics for every variable from chunks of the data
+
+    Only one chunk is held in memory at a time.
+    The statistics are accumulated per variable and are computed
+    when all chunks are read.
+    Variables without a column in the chunks only get metadata.
+
+    Input:
+    chunks: pandas DataFrames with consecutive rows of the data
+    metadata: dict
+    study: string
+    quantile_error: if given, quantiles are approximated with this error bound
+    metrics: if given, the time spent is added to its stages
+    distinct: if set, the number of distinct values of strings is estimated
+    missing_codes: the values that are invalid besides null values
+
+    Output:
+    the variables of metadata with statistics, in the same order
+    """
+
+    logging.info("Processing %s variables for study %s", len(metadata), study)
+    accumulators = [
+        VariableAccumulator(variable, quantile_error, distinct, missing_codes)
+        for variable in metadata
+    ]
+    columns: Optional[pandas.Index] = None
+    if metrics is not None:
+        chunks = metrics.chunks(chunks)
+    for chunk in chunks:
+        columns = chunk.columns
+        with measure(metrics, "statistics"):
+            for accumulator in accumulators:
+                if accumulator.variable.name in columns:
+                    accumulator.update(chunk[accumulator.variable.name])
+
+    for variable_metadata, accumulator in zip(metadata, accumulators):
+        variable_metadata.study = study
+        categories = variable_metadata.categories
+        categories.missings = missing_codes.flags(categories.values)
+        if columns is None or variable_metadata.name in columns:
+            with measure(metrics, "statistics"):
+                variable_metadata.statistics = accumulator.statistics()
+            with measure(metrics, "frequencies"):
+                categories.frequencies = accumulator.frequencies()
+        yield variable_metadata
 
 
 def update_metadata(
-    metadata: List[Variable], metadata_de: Optional[List[Variable]]
-) -> List[Variable]:
+    metadata: List[CompactVariable], metadata_de: Optional[List[CompactVariable]]
+) -> List[CompactVariable]:
     """Get information of german and english metadata and create a new metadata variable
 
     Input:
@@ -202,26 +420,80 @@ def update_metadata(
 
     if metadata and not metadata_de:
         for main_variable in metadata:
-            main_variable["label_de"] = [""] * len(main_variable["label"])
+            main_variable.label_de = ""
     elif metadata and metadata_de:
         for main_variable, variable_de in zip(metadata, metadata_de):
-            main_variable["label_de"] = variable_de["label"]
-            if main_variable.get("categories", {}).get("labels", []):
-                main_variable["categories"]["labels_de"] = variable_de["categories"][
-                    "labels"
-                ]
+            main_variable.label_de = variable_de.label or ""
+            if main_variable.categories.labels:
+                main_variable.categories.labels_de = variable_de.categories.labels
 
     return metadata
 
 
+def dump_json(
+    stat: Iterable[Union[Variable, CompactVariable]],
+    json_file: TextIO,
+    compact: bool = False,
+    metrics: Optional[FileMetrics] = None,
+) -> None:
+    """Serialise the statistics into an open file, one variable at a time
+
+    Every variable is written as soon as it is taken from stat, so stat can be
+    a generator that computes the statistics while the file is written.
+    The default output is indented and written with the json module.
+    It is the same as with json.dump for the whole list, to keep
+    it unchanged between versions.
+    Compact output has no indentation. It is encoded with orjson,
+    if it is installed, which is considerably faster for large files.
+    Compact variables are converted to dictionaries one at a time while
+    they are written.
+
+    Input:
+    stat: iterable of variables, as dictionaries or compact variables
+    json_file: file opened for writing text
+    compact: drop indentation and whitespace
+    metrics: if given, the time spent writing is added to its serialise stage
+    """
+
+    json_file.write("[")
+    empty = True
+    for variable in stat:
+        with measure(metrics, "serialise"):
+            if isinstance(variable, CompactVariable):
+                variable = variable.to_dict()
+            if not empty:
+                json_file.write(",")
+            if not compact:
+                # Every line is indented by one level for the surrounding list.
+                text = json.dumps(variable, indent=2, ensure_ascii=False)
+                json_file.write("\n  " + text.replace("\n", "\n  "))
+            elif orjson is not None:
+                json_file.write(
+                    orjson.dumps(variable).decode("utf-8")  # pylint: disable=no-member
+                )
+            else:
+                json_file.write(
+                    json.dumps(variable, separators=(",", ":"), ensure_ascii=False)
+                )
+        empty = False
+    json_file.write("]" if compact or empty else "\n]")
+
+
 def write_json(  # pylint: disable=too-many-arguments
-    data: pandas.DataFrame,
-    metadata: List[Variable],
-    metadata_de: Optional[List[Variable]],
+    data: Union[pandas.DataFrame, Iterable[pandas.DataFrame]],
+    metadata: List[CompactVariable],
+    metadata_de: Optional[List[CompactVariable]],
     filename: pathlib.Path,
     study: str,
     latin1: bool,
-) -> None:
+    quantile_error: Optional[float] = None,
+    compact: bool = False,
+    compress: bool = False,
+    metrics: Optional[FileMetrics] = None,
+    jobs: Optional[int] = None,
+    distinct: bool = False,
+    missing_codes: MissingCodes = DEFAULT_MISSING_CODES,
+) -> List[CompactVariable]:
     """Main function to write json.
 
     metadata_test = [
@@ -277,18 +549,70 @@ def write_json(  # pylint: disable=too-many-arguments
     ]
 
     Args:
-        data: Datatable of imported data.
+        data: Datatable of imported data or an iterable of chunks of it.
+              Chunks are processed one at a time to limit memory usage.
         metadata_en: Metadata of the english imported data.
         metadata_de: Metadata of the german imported data.
         filename: Name of the output json file.
         study: Name of the study.
+        latin1: Set if the source files are encoded with Latin-1.
+        quantile_error: If given, quantiles of numerical variables are
+                        approximated with this error bound.
+        compact: Write json without indentation.
+        compress: Write gzip compressed json. The filename is used as given.
+        metrics: If given, the time spent in every stage is added to it.
+        jobs: If greater than one, the statistics of numeric variables are
+              computed by this many processes. Not used for chunks.
+        distinct: Estimate the number of distinct values of string variables.
+        missing_codes: The values that are invalid besides null values.
+                       Category values in its ranges are flagged as missings.
+
+    Returns:
+        The written variables with their statistics.
     """
 
     metadata = update_metadata(metadata, metadata_de)
 
-    stat = generate_statistics(data, metadata, study)
+    # Variables are computed while the file is written.
+    stat: Iterator[CompactVariable]
+    if isinstance(data, pandas.DataFrame):
+        stat = iter_statistics(
+            data,
+            metadata,
+            study,
+            quantile_error,
+            metrics,
+            jobs=jobs,
+            distinct=distinct,
+            missing_codes=missing_codes,
+        )
+    else:
+        stat = iter_streaming_statistics(
+            data,
+            metadata,
+            study,
+            quantile_error,
+            metrics,
+            distinct=distinct,
+            missing_codes=missing_codes,
+        )
+
+    write_variables(
+        stat, filename, latin1, compact=compact, compress=compress, metrics=metrics
+    )
+    return metadata
+
+
+def output_encoding(latin1: bool) -> str:
+    """Get the encoding to write output files with
+
+    Input:
+    latin1: set if the source files are encoded with Latin-1
+
+    Output:
+    encoding: name of the encoding
+    """
 
-    logging.info('write "%s"', filename)
     # Pandas decodes data with Latin-1
     # The source will be decoded incorrectly,
     # if the source files are UTF-8 or anything other than Latin-1.
@@ -300,6 +624,39 @@ def write_json(  # pylint: disable=too-many-arguments
     # But since, in this case, the source was correctly decoded by pandas, we can just
     # write the file with UTF-8 encoding.
     # TL;DR: if the source is Latin-1 encoded we can safely use utf-8 for writing output.
-    encoding = "utf-8" if latin1 else "latin1"
-    with open(filename, "w", encoding=encoding) as json_file:
-        json.dump(stat, json_file, indent=2, ensure_ascii=False)
+    return "utf-8" if latin1 else "latin1"
+
+
+def write_variables(  # pylint: disable=too-many-arguments
+    stat: Iterable[Union[Variable, CompactVariable]],
+    filename: pathlib.Path,
+    latin1: bool,
+    compact: bool = False,
+    compress: bool = False,
+    metrics: Optional[FileMetrics] = None,
+) -> None:
+    """Write variables with their statistics to a json file.
+
+    Args:
+        stat: The variables, also as an iterator that computes them while
+              they are written.
+        filename: Name of the output json file.
+        latin1: Set if the source files are encoded with Latin-1.
+        compact: Write json without indentation.
+        compress: Write gzip compressed json. The filename is used as given.
+        metrics: If given, the time spent serialising is added to it.
+    """
+
+    logging.info('write "%s"', filename)
+    encoding = output_encoding(latin1)
+    open_file = gzip.open if compress else open
+    # The file is only moved into place when it is complete,
+    # a failed run never leaves a truncated file behind.
+    temporary_file = filename.with_name(filename.name + ".tmp")
+    try:
+        with open_file(temporary_file, "wt", encoding=encoding) as json_file:
+            dump_json(stat, json_file, compact=compact, metrics=metrics)
+        os.replace(temporary_file, filename)
+    except BaseException:
+        temporary_file.unlink(missing_ok=True)
+        raise
@@ -28,6 +28,7 @@ setup(
     python_requires=REQUIRES_PYTHON,
     packages=find_packages(),
     install_requires=["pandas >= 0.25.0"],
+    extras_require={"fast": ["orjson"], "sidecar": ["pyarrow"]},
     entry_points={"console_scripts": ["collect_stata = collect_stata.__main__:main"]},
     license=LICENSE,
     classifiers=CLASSIFIERS,
@@ -0,0 +1,56 @@
+"""Helpers shared by the unit tests"""
+import pathlib
+import unittest
+from tempfile import TemporaryDirectory
+from typing import Any
+
+import pandas
+
+from collect_stata.__main__ import StataToJson
+from collect_stata.options import RunOptions
+
+INPUT_PATH = pathlib.Path("tests/input/en")
+GERMAN_PATH = pathlib.Path("tests/input/de")
+
+
+class TemporaryDirectoryTestCase(unittest.TestCase):
+    """Test case with a temporary directory that is removed after every test."""
+
+    path: pathlib.Path
+
+    def setUp(self) -> None:
+        # Removed by the cleanup, also if a test or a later setUp step fails.
+        directory = TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.addCleanup(directory.cleanup)
+        self.path = pathlib.Path(directory.name)
+
+    @staticmethod
+    def run_cli(
+        output_path: pathlib.Path, latin1: bool = True, options: RunOptions = RunOptions()
+    ) -> bytes:
+        """Convert the english and german test dataset like the command line interface.
+
+        Returns the content of the json file.
+        """
+        StataToJson(
+            study_name="study",
+            input_path=INPUT_PATH,
+            input_de_path=GERMAN_PATH,
+            output_path=output_path,
+            latin1=latin1,
+            options=options,
+        ).single_process_run()
+        return output_path.joinpath("test.json").read_bytes()
+
+
+def write_stata(
+    file_name: pathlib.Path,
+    data: pandas.DataFrame,
+    version: int,
+    byteorder: str = "<",
+    **options: Any,
+) -> None:
+    """Write a data frame without its index as a stata file of the given format."""
+    data.to_stata(
+        file_name, version=version, byteorder=byteorder, write_index=False, **options
+    )
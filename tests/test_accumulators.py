@@ -0,0 +1,205 @@
+"""Unittests for the collect_stata.accumulators module"""
+import copy
+import pathlib
+import unittest
+from typing import List
+from unittest import mock
+
+import numpy
+import pandas
+from deepdiff import DeepDiff
+
+from collect_stata.accumulators import Histogram, NumericalAccumulator
+from collect_stata.missing_codes import MissingCodes
+from collect_stata.read_stata import StataDataExtractor
+from collect_stata.types import Variable
+from collect_stata.variables import CompactVariable, to_dicts
+from collect_stata.write_json import generate_statistics, generate_streaming_statistics
+
+
+def _compact(metadata: List[Variable]) -> List[CompactVariable]:
+    return [CompactVariable.from_dict(variable) for variable in metadata]
+
+
+class TestStreamingStatistics(unittest.TestCase):
+    """Chunked statistics have to equal the statistics of the whole data."""
+
+    def test_chunks_equal_whole_data(self) -> None:
+        """Compare results for the test dataset read in chunks of different sizes."""
+        file_name = pathlib.Path("tests/input/en/test.dta")
+        data_extractor = StataDataExtractor(file_name)
+        data_extractor.parse_file()
+        expected = generate_statistics(
+            data_extractor.data, copy.deepcopy(data_extractor.metadata), "study"
+        )
+        for chunksize in (1, 5, 100):
+            chunk_extractor = StataDataExtractor(file_name)
+            metadata = chunk_extractor.get_variable_metadata()
+            result = generate_streaming_statistics(
+                chunk_extractor.iter_chunks(chunksize), metadata, "study"
+            )
+            diff = DeepDiff(to_dicts(expected), to_dicts(result), significant_digits=10)
+            self.assertTrue(expr=(not diff), msg=str(diff))
+
+    def test_mixed_scales(self) -> None:
+        """Compare results for categorical, numerical, string and date variables."""
+        data = pandas.DataFrame(
+            {
+                "cat": [1, 2, -1, numpy.nan, 2, 1, -2, 2],
+                "number": [0.5, 10, -1, numpy.nan, 3, 3, 7, -8],
+                "string": ["a", "", ".", None, "b", "b", "c", "."],
+                "date": pandas.to_datetime(
+                    ["2000-01-01", None, "1960-01-01", "2019-12-06"] * 2
+                ),
+            }
+        )
+        metadata = _compact(
+            [
+                {
+                    "name": "cat",
+                    "scale": "cat",
+                    "categories": {"values": [-2, -1, 1, 2, 3], "labels": []},
+                },
+                {"name": "number", "scale": "number"},
+                {"name": "string", "scale": "string"},
+                {"name": "date", "scale": "number"},
+            ]
+        )
+        expected = generate_statistics(data, copy.deepcopy(metadata), "study")
+        chunks = (data.iloc[start : start + 3] for start in range(0, len(data), 3))
+        result = generate_streaming_statistics(chunks, metadata, "study")
+        diff = DeepDiff(to_dicts(expected), to_dicts(result), significant_digits=10)
+        self.assertTrue(expr=(not diff), msg=str(diff))
+
+    def test_configured_missing_codes(self) -> None:
+        """Configured missing codes give the same statistics in both modes."""
+        data = pandas.DataFrame(
+            {
+                "cat": [1, 2, -1, numpy.nan, 9, 1, -2, 9],
+                "number": [0.5, 10, -1, numpy.nan, 99, 3, 7, 98],
+            }
+        )
+        metadata = _compact(
+            [
+                {
+                    "name": "cat",
+                    "scale": "cat",
+                    "categories": {"values": [-2, -1, 1, 2, 9], "labels": []},
+                },
+                {"name": "number", "scale": "number"},
+            ]
+        )
+        missing_codes = MissingCodes.parse("-1,9:99")
+        expected = generate_statistics(
+            data, copy.deepcopy(metadata), "study", missing_codes=missing_codes
+        )
+        chunks = (data.iloc[start : start + 3] for start in range(0, len(data), 3))
+        result = generate_streaming_statistics(
+            chunks, metadata, "study", missing_codes=missing_codes
+        )
+        diff = DeepDiff(to_dicts(expected), to_dicts(result), significant_digits=10)
+        self.assertTrue(expr=(not diff), msg=str(diff))
+        self.assertEqual({"valid": 4, "invalid": 4}, result[0].statistics)
+        self.assertEqual(
+            [False, True, False, False, True], result[0].categories.missings.tolist()
+        )
+        self.assertEqual(0.5, result[1].statistics["Min."])
+        self.assertEqual(7.0, result[1].statistics["Max."])
+
+    def test_distinct_strings(self) -> None:
+        """Estimated distinct values of strings are the same in both modes."""
+        data = pandas.DataFrame({"string": ["a", "", ".", None, "b", "b", "c"] * 3})
+        metadata = _compact([{"name": "string", "scale": "string"}])
+        expected = generate_statistics(
+            data, copy.deepcopy(metadata), "study", distinct=True
+        )
+        chunks = (data.iloc[start : start + 4] for start in range(0, len(data), 4))
+        result = generate_streaming_statistics(chunks, metadata, "study", distinct=True)
+        self.assertEqual(3, expected[0].statistics["distinct"])
+        self.assertEqual(to_dicts(expected), to_dicts(result))
+
+    def test_approximate_quantiles(self) -> None:
+        """Approximated quantiles are close to the exact ones in both modes."""
+        generator = numpy.random.default_rng(seed=0)
+        data = pandas.DataFrame({"number": generator.normal(100, 10, size=50_000)})
+        data.loc[::10, "number"] = -1
+        metadata = _compact([{"name": "number", "scale": "number"}])
+        expected = generate_statistics(data, copy.deepcopy(metadata), "study")
+        approximated = generate_statistics(
+            data, copy.deepcopy(metadata), "study", quantile_error=0.01
+        )
+        chunks = (data.iloc[start : start + 999] for start in range(0, len(data), 999))
+        streamed = generate_streaming_statistics(
+            chunks, copy.deepcopy(metadata), "study", quantile_error=0.01
+        )
+        exact = expected[0].statistics
+        for result in (approximated[0].statistics, streamed[0].statistics):
+            for key in ("Min.", "Max.", "valid", "invalid"):
+                self.assertEqual(exact[key], result[key])
+            for key in ("1st Qu.", "Median", "3rd Qu.", "Mean"):
+                self.assertAlmostEqual(exact[key], result[key], delta=0.5)
+
+
+class TestHistogram(unittest.TestCase):
+    """Test the bounded histograms of the exact accumulators."""
+
+    def test_chunks_equal_unique(self) -> None:
+        """Merged chunks give the distinct values and counts of the whole column."""
+        values = numpy.random.default_rng(seed=4).integers(0, 500, size=10_000)
+        histogram = Histogram("float64")
+        for chunk in numpy.array_split(values.astype("float64"), 13):
+            histogram.update(chunk)
+        distinct, counts = numpy.unique(values, return_counts=True)
+        self.assertEqual(distinct.tolist(), histogram.values.tolist())
+        self.assertEqual(counts.tolist(), histogram.counts.tolist())
+
+    def test_large_histograms_are_approximated(self) -> None:
+        """Above the maximum size, quantiles and medians come from a sketch."""
+        generator = numpy.random.default_rng(seed=5)
+        data = pandas.DataFrame(
+            {
+                "number": generator.normal(100, 10, size=20_000).round(3),
+                "date": pandas.to_datetime(
+                    generator.integers(0, 20_000, size=20_000), unit="D"
+                ),
+            }
+        )
+        data.loc[::10, "number"] = -1
+        metadata = _compact(
+            [{"name": "number", "scale": "number"}, {"name": "date", "scale": "date"}]
+        )
+        exact = generate_statistics(data, copy.deepcopy(metadata), "study")
+        chunks = (data.iloc[start : start + 999] for start in range(0, len(data), 999))
+        with mock.patch("collect_stata.accumulators.MAX_HISTOGRAM_SIZE", 1000):
+            streamed = generate_streaming_statistics(chunks, metadata, "study")
+        number, date = exact[0].statistics, exact[1].statistics
+        result = streamed[0].statistics
+        for key in ("Min.", "Max.", "valid", "invalid"):
+            self.assertEqual(number[key], result[key])
+        for key in ("1st Qu.", "Median", "3rd Qu.", "Mean"):
+            self.assertAlmostEqual(number[key], result[key], delta=0.5)
+        result = streamed[1].statistics
+        for key in ("valid", "invalid"):
+            self.assertEqual(date[key], result[key])
+        for key in ("Min.", "Max."):
+            self.assertEqual(pandas.Timestamp(date[key]), pandas.Timestamp(result[key]))
+        median = pandas.Timestamp(result["Median"])
+        self.assertEqual(10, len(result["Median"]))
+        self.assertLess(abs(median - pandas.Timestamp(date["Median"])).days, 400)
+
+    def test_merge_exact_and_approximated(self) -> None:
+        """An exact accumulator can be merged with an approximated one."""
+        values = numpy.random.default_rng(seed=6).uniform(size=4000)
+        with mock.patch("collect_stata.accumulators.MAX_HISTOGRAM_SIZE", 1000):
+            small = NumericalAccumulator()
+            small.update(pandas.Series(values[:500]))
+            large = NumericalAccumulator()
+            large.update(pandas.Series(values[500:]))
+            self.assertIsNone(small.approximation)
+            self.assertIsNotNone(large.approximation)
+            small.merge(large)
+        statistics = small.statistics()
+        self.assertEqual(4000, statistics["valid"])
+        self.assertEqual(float(values.min()), statistics["Min."])
+        self.assertEqual(float(values.max()), statistics["Max."])
+        self.assertAlmostEqual(0.5, statistics["Median"], delta=0.02)
@@ -0,0 +1,60 @@
+"""Unittests for the collect_stata.api module"""
+import json
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from collect_stata import JsonSink, collect
+from tests.helpers import GERMAN_PATH, INPUT_PATH, TemporaryDirectoryTestCase
+
+
+class TestCollect(TemporaryDirectoryTestCase):
+    """Results in memory have to equal the json files written by the cli."""
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.expected = self.run_cli(self.path.joinpath("cli"))
+
+    def test_same_variables_as_json_output(self) -> None:
+        """The variables of a result equal the json file of the cli."""
+        results = list(collect([INPUT_PATH], study="study", german_path=GERMAN_PATH))
+        self.assertEqual(["test"], [result.dataset for result in results])
+        self.assertEqual(json.loads(self.expected), results[0].variables)
+        self.assertEqual(results[0].metrics["file"], "test.dta")
+
+    def test_results_do_not_share_labels(self) -> None:
+        """Changing the labels of a result does not change later results."""
+        results = list(collect([INPUT_PATH], study="study", german_path=GERMAN_PATH))
+        for variable in results[0].variables:
+            variable["categories"]["labels"].append("changed")
+        results = list(collect([INPUT_PATH], study="study", german_path=GERMAN_PATH))
+        self.assertEqual(json.loads(self.expected), results[0].variables)
+
+    def test_json_sink(self) -> None:
+        """The json sink writes the same file as the cli."""
+        sink = JsonSink(self.path.joinpath("sink"), latin1=True)
+        for _ in collect(
+            [INPUT_PATH.joinpath("test.dta")],
+            study="study",
+            german_path=GERMAN_PATH,
+            sink=sink,
+        ):
+            pass
+        result = self.path.joinpath("sink", "test.json").read_bytes()
+        self.assertEqual(self.expected, result)
+
+    def test_pools_are_reused(self) -> None:
+        """A pool passed to collect stays usable for later calls."""
+        for pool_type in (ThreadPoolExecutor, ProcessPoolExecutor):
+            with pool_type(max_workers=1) as pool:
+                for _ in range(2):
+                    results = list(
+                        collect(
+                            [INPUT_PATH, INPUT_PATH],
+                            study="study",
+                            german_path=GERMAN_PATH,
+                            pool=pool,
+                            max_pending=1,
+                        )
+                    )
+                    self.assertEqual(2, len(results))
+                    for result in results:
+                        self.assertEqual(json.loads(self.expected), result.variables)
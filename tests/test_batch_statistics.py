@@ -0,0 +1,173 @@
+"""Unittests for the collect_stata.batch_statistics module"""
+import unittest
+from typing import List, Optional
+
+import numpy
+import pandas
+from deepdiff import DeepDiff
+
+from collect_stata.batch_statistics import count_categories, get_batch_statistics
+from collect_stata.missing_codes import DEFAULT_MISSING_CODES, MissingCodes
+from collect_stata.variables import CompactVariable
+from collect_stata.write_json import get_univariate_statistics, set_frequencies
+
+
+def _random_data(rows: int) -> pandas.DataFrame:
+    generator = numpy.random.default_rng(seed=0)
+    codes = generator.integers(-3, 6, size=rows).astype("float64")
+    codes[generator.random(rows) < 0.1] = numpy.nan
+    incomes = generator.integers(-8, 5000, size=rows).astype("float64")
+    incomes[generator.random(rows) < 0.2] = numpy.nan
+    return pandas.DataFrame(
+        {
+            "cat": codes,
+            "cat_int": generator.integers(-2, 3, size=rows).astype("int8"),
+            "income": incomes,
+            "income_float32": incomes.astype("float32"),
+            "age": generator.integers(0, 99, size=rows).astype("int32"),
+            "all_missing": numpy.full(rows, -1.0),
+        }
+    )
+
+
+def _metadata() -> List[CompactVariable]:
+    categories = {"values": [-3, -2, -1, 1, 2, 3, 4, 7], "labels": []}
+    variables = [
+        {"name": "cat", "scale": "cat", "categories": dict(categories)},
+        {"name": "cat_int", "scale": "cat", "categories": dict(categories)},
+        {"name": "income", "scale": "number", "categories": {"values": []}},
+        {"name": "income_float32", "scale": "number", "categories": {"values": []}},
+        {"name": "age", "scale": "number", "categories": {"values": [0, 98]}},
+        {"name": "all_missing", "scale": "number", "categories": {"values": [-1]}},
+    ]
+    return [CompactVariable.from_dict(variable) for variable in variables]
+
+
+class TestBatchStatistics(unittest.TestCase):
+    """Batch results have to equal the results of the per variable functions."""
+
+    def _assert_equal_to_per_variable(
+        self,
+        data: pandas.DataFrame,
+        missing_codes: MissingCodes = DEFAULT_MISSING_CODES,
+        quantile_error: Optional[float] = None,
+    ) -> None:
+        result = get_batch_statistics(data, _metadata(), missing_codes, quantile_error)
+        for variable in _metadata():
+            expected_statistics = get_univariate_statistics(
+                variable, data, quantile_error, missing_codes=missing_codes
+            )
+            expected_frequencies = set_frequencies(variable, data).categories.frequencies
+            statistics, frequencies = result[variable.name]
+            diff = DeepDiff(expected_statistics, statistics)
+            self.assertTrue(expr=(not diff), msg=f"{variable.name}: {diff}")
+            numpy.testing.assert_array_equal(
+                expected_frequencies, frequencies, err_msg=variable.name
+            )
+
+    def test_random_data(self) -> None:
+        """Compare on random integer coded data with missings."""
+        self._assert_equal_to_per_variable(_random_data(rows=10001))
+
+    def test_single_row(self) -> None:
+        """Compare on a dataset with a single row."""
+        self._assert_equal_to_per_variable(_random_data(rows=1))
+
+    def test_empty_data(self) -> None:
+        """Compare on a dataset without rows."""
+        self._assert_equal_to_per_variable(_random_data(rows=0))
+
+    def test_non_integer_floats(self) -> None:
+        """Means are rounded like the per variable functions round them."""
+        generator = numpy.random.default_rng(seed=3)
+        columns = dict()
+        for index in range(8):
+            values = generator.normal(1800, 900, size=20000).round(2)
+            values[generator.random(values.size) < 0.1] = -99
+            values[generator.random(values.size) < 0.05] = numpy.nan
+            columns[f"float{index}"] = values
+        data = pandas.DataFrame(columns)
+        metadata = [
+            CompactVariable.from_dict(
+                {"name": name, "scale": "number", "categories": {"values": []}}
+            )
+            for name in columns
+        ]
+        result = get_batch_statistics(data, metadata)
+        for variable in metadata:
+            self.assertEqual(
+                get_univariate_statistics(variable, data),
+                result[variable.name][0],
+                msg=variable.name,
+            )
+
+    def test_configured_missing_codes(self) -> None:
+        """Compare with missing codes between and above the valid values."""
+        missing_codes = MissingCodes.parse("-3:-2,2,4000:4999")
+        self._assert_equal_to_per_variable(_random_data(rows=10001), missing_codes)
+        self._assert_equal_to_per_variable(_random_data(rows=0), missing_codes)
+
+    def test_approximate_quantiles(self) -> None:
+        """Compare with approximated quartiles, also with sampled updates."""
+        self._assert_equal_to_per_variable(_random_data(rows=10001), quantile_error=0.05)
+        self._assert_equal_to_per_variable(_random_data(rows=10001), quantile_error=0.2)
+        self._assert_equal_to_per_variable(_random_data(rows=0), quantile_error=0.05)
+        missing_codes = MissingCodes.parse("-3:-2,2,4000:4999")
+        self._assert_equal_to_per_variable(
+            _random_data(rows=10001), missing_codes, quantile_error=0.05
+        )
+
+    def test_non_numeric_columns_are_skipped(self) -> None:
+        """String columns are left to the per variable functions."""
+        data = pandas.DataFrame({"text": ["a", "b"]})
+        metadata = [
+            CompactVariable.from_dict(
+                {"name": "text", "scale": "string", "categories": {"values": []}}
+            )
+        ]
+        self.assertEqual(dict(), get_batch_statistics(data, metadata))
+
+    def test_categories_without_integer_codes(self) -> None:
+        """Fractional or widely spread codes fall back to sorting."""
+        data = pandas.DataFrame(
+            {
+                "fraction": [1.5, 1.0, -1.0, numpy.nan],
+                "spread": [1.0, 2.0 ** 20, -1.0, numpy.inf],
+            }
+        )
+        categories = {"values": [-1, 1], "labels": []}
+        metadata = [
+            CompactVariable.from_dict(
+                {"name": "fraction", "scale": "cat", "categories": dict(categories)}
+            ),
+            CompactVariable.from_dict(
+                {"name": "spread", "scale": "cat", "categories": dict(categories)}
+            ),
+        ]
+        values = numpy.array([-1, 1])
+        self.assertIsNone(count_categories(data["fraction"].to_numpy(), values))
+        self.assertIsNone(count_categories(data["spread"].to_numpy(), values))
+        result = get_batch_statistics(data, metadata)
+        for variable in metadata:
+            expected = get_univariate_statistics(variable, data)
+            statistics, frequencies = result[variable.name]
+            self.assertEqual(expected, statistics)
+            self.assertEqual([1, 1], frequencies.tolist())
+
+    def test_count_categories(self) -> None:
+        """Valid and invalid counts and frequencies come from one bincount."""
+        column = numpy.array([-8, -1, 1, 1, 3, -1], dtype="int8")
+        values = numpy.array([-8, -2, -1, 1, 2, 3, 9])
+        statistics, frequencies = count_categories(column, values)
+        self.assertEqual({"valid": 3, "invalid": 3}, statistics)
+        self.assertEqual([1, 0, 2, 2, 0, 1, 0], frequencies.tolist())
+
+    def test_count_categories_with_configured_codes(self) -> None:
+        """Only codes in the configured ranges are invalid."""
+        column = numpy.array([-8, -1, 1, 1, 3, -1], dtype="int8")
+        values = numpy.array([-8, -1, 1, 3])
+        statistics, frequencies = count_categories(
+            column, values, MissingCodes.parse("-8,3")
+        )
+        self.assertEqual({"valid": 4, "invalid": 2}, statistics)
+        self.assertEqual([1, 2, 2, 1], frequencies.tolist())
@@ -0,0 +1,51 @@
+"""Unittests for the collect_stata.dates module"""
+
+import unittest
+
+import pandas
+
+from collect_stata.dates import get_date_statistics
+from collect_stata.variables import CompactVariable
+from collect_stata.write_json import get_univariate_statistics
+
+
+class TestDateStatistics(unittest.TestCase):
+    """Test statistics computed on the int64 representation of dates."""
+
+    def test_dates(self) -> None:
+        """Minimum, median and maximum are formatted as dates."""
+        column = pandas.Series(
+            pandas.to_datetime(["2000-01-01", None, "1960-01-01", "2019-12-06"])
+        )
+        expected = {
+            "Min.": "1960-01-01",
+            "Median": "2000-01-01",
+            "Max.": "2019-12-06",
+            "valid": 3,
+            "invalid": 1,
+        }
+        self.assertEqual(expected, get_date_statistics(column))
+
+    def test_median_between_dates(self) -> None:
+        """A median between two dates keeps its time of day."""
+        column = pandas.Series(pandas.to_datetime(["2000-01-01", "2000-01-02"]))
+        statistics = get_date_statistics(column)
+        self.assertEqual("2000-01-01T12:00:00", statistics["Median"])
+        self.assertEqual("2000-01-01T00:00:00", statistics["Min."])
+
+    def test_only_missing_dates(self) -> None:
+        """Only the counts are given if no date is valid."""
+        column = pandas.Series(pandas.to_datetime([None, None]))
+        self.assertEqual({"valid": 0, "invalid": 2}, get_date_statistics(column))
+
+    def test_data_is_not_converted(self) -> None:
+        """The date column is not replaced by its statistics."""
+        data = pandas.DataFrame({"date": pandas.to_datetime(["2000-01-01", None])})
+        variable = CompactVariable.from_dict({"name": "date", "scale": "number"})
+        statistics = get_univariate_statistics(variable, data)
+        self.assertEqual("date", variable.scale)
+        self.assertEqual(
+            {"valid": 1, "invalid": 1},
+            {key: statistics[key] for key in ("valid", "invalid")},
+        )
+        self.assertEqual("M", data["date"].dtype.kind)
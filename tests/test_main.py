@@ -1,7 +1,9 @@
 # -*- coding: utf-8 -*-
 """Test cases for command line interface."""
 
+import json
 import pathlib
+import subprocess
 import sys
 import unittest
 from pathlib import Path
@@ -11,6 +13,8 @@ from unittest.mock import patch
 import pytest
 
 from collect_stata.__main__ import main, StataToJson
+from collect_stata.missing_codes import DEFAULT_MISSING_CODES, MissingCodes
+from collect_stata.options import RunOptions
 
 
 def test_cli_without_arguments() -> None:
@@ -44,6 +48,7 @@ def test_cli_with_required_arguments() -> None:
             output_path=pathlib.Path("output_path").absolute(),
             input_de_path=None,
             latin1=True,
+            options=RunOptions(missing_codes=DEFAULT_MISSING_CODES),
         )
         mocked_stata_to_json.assert_called_once_with(**expected_arguments)
 
@@ -65,3 +70,126 @@ class test_two_dataset_inputs(unittest.TestCase):
             )
             stata_to_json.single_process_run()
 
+
+def test_cli_rejects_non_positive_jobs() -> None:
+    """Test main exits with an argument error, when --jobs is below one."""
+    _arguments = ["__main__.py", "-i", "in", "-o", "out", "-s", "study", "-m", "-j", "0"]
+    with patch.object(sys, "argv", _arguments):
+        with pytest.raises(SystemExit) as caught_exit:
+            main()
+    assert caught_exit.value.code == 2
+
+
+def test_cli_parses_missing_codes() -> None:
+    """Test main passes the ranges of --missing-codes and rejects invalid ones."""
+    _arguments = ["__main__.py", "-i", "in", "-o", "out", "-s", "study"]
+    with patch.object(
+        sys, "argv", _arguments + ["--missing-codes=-99:-91,9999"]
+    ), patch("collect_stata.__main__.StataToJson") as mocked_stata_to_json:
+        main()
+    missing_codes = mocked_stata_to_json.call_args.kwargs["options"].missing_codes
+    assert missing_codes == MissingCodes([(-99, -91), (9999, 9999)])
+    with patch.object(sys, "argv", _arguments + ["--missing-codes=-1:-9"]):
+        with pytest.raises(SystemExit) as caught_exit:
+            main()
+    assert caught_exit.value.code == 2
+
+
+def test_cli_starts_without_pandas() -> None:
+    """Test the cli module does not import pandas or numpy before processing."""
+    code = (
+        "import sys, collect_stata.__main__; "
+        "print('pandas' in sys.modules or 'numpy' in sys.modules)"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code], check=True, capture_output=True, text=True
+    )
+    assert result.stdout.strip() == "False"
+
+
+def test_parallel_run_raises_on_failed_file() -> None:
+    """Test a failing worker is reported instead of being lost in the child."""
+    with TemporaryDirectory() as input_dir, TemporaryDirectory() as output_dir:
+        Path(input_dir).joinpath("broken.dta").write_bytes(b"not a stata file")
+        stata_to_json = StataToJson(
+            study_name="test-study",
+            input_path=Path(input_dir),
+            output_path=Path(output_dir),
+        )
+        with pytest.raises(RuntimeError, match="broken.dta"):
+            stata_to_json.parallel_run(jobs=2)
+
+
+def test_file_pairs_are_sorted_largest_first() -> None:
+    """Test files are handed out to workers ordered by descending size."""
+    with TemporaryDirectory() as input_dir, TemporaryDirectory() as output_dir:
+        for name, size in (("small.dta", 1), ("large.dta", 100), ("medium.dta", 10)):
+            Path(input_dir).joinpath(name).write_bytes(b"0" * size)
+        stata_to_json = StataToJson(
+            study_name="test-study",
+            input_path=Path(input_dir),
+            input_de_path=Path("german"),
+            output_path=Path(output_dir),
+        )
+        # pylint: disable=protected-access
+        result = [(file.name, file_de) for file, file_de in stata_to_json._file_pairs()]
+    assert result == [
+        ("large.dta", Path("german/large.dta")),
+        ("medium.dta", Path("german/medium.dta")),
+        ("small.dta", Path("german/small.dta")),
+    ]
+
+
+def test_excluded_variables_only_get_metadata() -> None:
+    """Test excluded variables are written without statistics."""
+    with TemporaryDirectory() as output_dir:
+        stata_to_json = StataToJson(
+            study_name="test-study",
+            input_path=Path("tests/input/en"),
+            output_path=Path(output_dir),
+            latin1=True,
+            options=RunOptions(exclude=["HK*"]),
+        )
+        stata_to_json.single_process_run()
+        with open(Path(output_dir).joinpath("test.json"), encoding="utf-8") as json_file:
+            result = {variable["name"]: variable for variable in json.load(json_file)}
+    assert "statistics" not in result["HKIND"]
+    assert "frequencies" not in result["HKIND"]["categories"]
+    assert result["HKIND"]["categories"]["labels"]
+    assert "statistics" in result["HM04"]
+
+
+def test_pipelined_run_writes_the_same_files() -> None:
+    """Test the pipeline gives the same output as a sequential run."""
+    with TemporaryDirectory() as sequential_dir, TemporaryDirectory() as pipeline_dir:
+        for output_dir in (sequential_dir, pipeline_dir):
+            stata_to_json = StataToJson(
+                study_name="test-study",
+                input_path=Path("tests/input/en"),
+                input_de_path=Path("tests/input/de"),
+                output_path=Path(output_dir),
+                latin1=True,
+            )
+            if output_dir == pipeline_dir:
+                stata_to_json.pipelined_run(read_ahead=2)
+            else:
+                stata_to_json.single_process_run()
+        expected = Path(sequential_dir).joinpath("test.json").read_bytes()
+        assert expected == Path(pipeline_dir).joinpath("test.json").read_bytes()
+
+
+def test_pipelined_run_raises_on_failed_file() -> None:
+    """Test a failing file is reported after all other files were processed."""
+    with TemporaryDirectory() as input_dir, TemporaryDirectory() as output_dir:
+        Path(input_dir).joinpath("broken.dta").write_bytes(b"not a stata file")
+        Path(input_dir).joinpath("test.dta").write_bytes(
+            Path("tests/input/en/test.dta").read_bytes()
+        )
+        stata_to_json = StataToJson(
+            study_name="test-study",
+            input_path=Path(input_dir),
+            output_path=Path(output_dir),
+        )
+        with pytest.raises(RuntimeError, match="broken.dta"):
+            stata_to_json.pipelined_run()
+        assert Path(output_dir).joinpath("test.json").is_file()
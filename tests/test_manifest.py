@@ -0,0 +1,92 @@
+"""Unittests for the collect_stata.manifest module"""
+import os
+import shutil
+from typing import Optional
+from unittest import mock
+
+from collect_stata.__main__ import StataToJson
+from collect_stata.manifest import MANIFEST_NAME, Manifest
+from collect_stata.options import RunOptions
+from tests.helpers import TemporaryDirectoryTestCase
+
+
+class TestIncrementalRun(TemporaryDirectoryTestCase):
+    """Unchanged files are reused, changed files are processed again."""
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.input_path = self.path.joinpath("input")
+        self.input_path.mkdir()
+        self.output_path = self.path.joinpath("output")
+        shutil.copy("tests/input/en/test.dta", self.input_path)
+        self.output_file = self.output_path.joinpath("test.json")
+
+    def _stata_to_json(
+        self, force: bool = False, chunksize: Optional[int] = None
+    ) -> StataToJson:
+        return StataToJson(
+            study_name="test-study",
+            input_path=self.input_path,
+            output_path=self.output_path,
+            latin1=True,
+            options=RunOptions(chunksize=chunksize, force=force),
+        )
+
+    def _outdated_files(self, stata_to_json: StataToJson) -> list:
+        # pylint: disable=protected-access
+        manifest = stata_to_json._load_manifest()
+        return [file.name for file, _ in stata_to_json._outdated_file_pairs(manifest)]
+
+    def test_unchanged_file_is_reused(self) -> None:
+        """A second run does not process the file again."""
+        self._stata_to_json().single_process_run()
+        self.assertTrue(self.output_path.joinpath(MANIFEST_NAME).is_file())
+        with self.assertLogs(level="WARNING") as logs:
+            self.assertEqual([], self._outdated_files(self._stata_to_json()))
+        self.assertIn("Reusing 1 and rebuilding 0 of 1 files", logs.output[0])
+        self.assertEqual(["test.dta"], self._outdated_files(self._stata_to_json(True)))
+
+    def test_touched_file_with_same_content_is_reused(self) -> None:
+        """Only a changed modification time is resolved by the content hash."""
+        self._stata_to_json().single_process_run()
+        os.utime(self.input_path.joinpath("test.dta"), ns=(0, 0))
+        self.assertEqual([], self._outdated_files(self._stata_to_json()))
+
+    def test_touched_file_is_hashed_once(self) -> None:
+        """The new modification time is recorded when the content hash matches."""
+        self._stata_to_json().single_process_run()
+        os.utime(self.input_path.joinpath("test.dta"), ns=(0, 0))
+        self.assertEqual([], self._outdated_files(self._stata_to_json()))
+        with mock.patch("collect_stata.manifest.file_hash") as file_hash:
+            self.assertEqual([], self._outdated_files(self._stata_to_json()))
+        file_hash.assert_not_called()
+
+    def test_changed_file_is_rebuilt(self) -> None:
+        """Files with changed content or missing output are processed again."""
+        self._stata_to_json().single_process_run()
+        with open(self.input_path.joinpath("test.dta"), "r+b") as file:
+            # Change a character of the data label, keeping the size.
+            file.seek(10)
+            file.write(b"X" if file.read(1) != b"X" else b"Y")
+        self.assertEqual(["test.dta"], self._outdated_files(self._stata_to_json()))
+
+        self._stata_to_json().single_process_run()
+        self.output_file.unlink()
+        self.assertEqual(["test.dta"], self._outdated_files(self._stata_to_json()))
+
+    def test_changed_options_invalidate_manifest(self) -> None:
+        """Entries recorded with other options are not used."""
+        self._stata_to_json().single_process_run()
+        options = {"study": "other", "latin1": True, "engine": "pandas"}
+        options.update(chunksize=None, include=None, exclude=None)
+        options.update(quantile_error=None, distinct=False, sidecar=None)
+        options.update(compact=False, compress=False)
+        manifest = Manifest(self.output_path, options=options)
+        self.assertEqual(dict(), manifest.files)
+
+    def test_changed_chunksize_rebuilds(self) -> None:
+        """Chunked statistics can differ in the last digits, so they are rebuilt."""
+        self._stata_to_json().single_process_run()
+        self.assertEqual(
+            ["test.dta"], self._outdated_files(self._stata_to_json(chunksize=10))
+        )
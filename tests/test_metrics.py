@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""Test cases for the instrumentation of processing runs."""
+
+import csv
+import json
+import pathlib
+import unittest
+from tempfile import TemporaryDirectory
+
+import pandas
+
+from collect_stata.__main__ import StataToJson
+from collect_stata.metrics import (
+    STAGES,
+    SUMMARY_CSV,
+    SUMMARY_JSON,
+    FileMetrics,
+    measure,
+)
+
+INPUT = pathlib.Path("tests/input/en")
+
+
+class TestFileMetrics(unittest.TestCase):
+    """Test the accumulation of stage times."""
+
+    def test_stages_accumulate(self) -> None:
+        """Times of a repeated stage are added up."""
+        metrics = FileMetrics(pathlib.Path("test.dta"))
+        for _ in range(2):
+            with metrics.stage("statistics"):
+                pass
+        record = metrics.record()
+        self.assertEqual(list(STAGES), list(record["stages"]))
+        self.assertGreater(record["stages"]["statistics"], 0)
+        self.assertEqual(0, record["stages"]["read"])
+        self.assertEqual("test.dta", record["file"])
+
+    def test_chunks_count_rows(self) -> None:
+        """Rows of all chunks passed through are counted."""
+        metrics = FileMetrics(pathlib.Path("test.dta"))
+        chunks = [pandas.DataFrame({"a": range(3)}), pandas.DataFrame({"a": range(2)})]
+        self.assertEqual(2, len(list(metrics.chunks(chunks))))
+        self.assertEqual(5, metrics.rows)
+
+    def test_measure_without_metrics(self) -> None:
+        """Measuring is skipped if no metrics are recorded."""
+        with measure(None, "read"):
+            pass
+
+
+class TestRunSummary(unittest.TestCase):
+    """Test the run summary written into the output folder."""
+
+    def test_summary_is_written(self) -> None:
+        """The json and csv summaries hold a record per file."""
+        with TemporaryDirectory() as output:
+            output_path = pathlib.Path(output)
+            StataToJson(
+                study_name="test", input_path=INPUT, output_path=output_path
+            ).single_process_run()
+            with open(output_path.joinpath(SUMMARY_JSON), encoding="utf-8") as file:
+                summary = json.load(file)
+            with open(output_path.joinpath(SUMMARY_CSV), encoding="utf-8") as file:
+                rows = list(csv.DictReader(file))
+
+        self.assertEqual(1, len(summary["files"]))
+        record = summary["files"][0]
+        self.assertEqual("test.dta", record["file"])
+        self.assertEqual(12, record["rows"])
+        self.assertEqual(11, record["variables"])
+        self.assertEqual(INPUT.joinpath("test.dta").stat().st_size, record["file_size"])
+        self.assertEqual(["test.dta"], [row["file"] for row in rows])
+        self.assertEqual("12", rows[0]["rows"])
@@ -0,0 +1,71 @@
+"""Unittests for the collect_stata.missing_codes module"""
+import json
+import pickle
+import unittest
+
+import numpy
+import pandas
+
+from collect_stata.missing_codes import DEFAULT_MISSING_CODES, MissingCodes
+
+
+class TestMissingCodes(unittest.TestCase):
+    """Test the default and configured missing codes."""
+
+    def test_default_codes(self) -> None:
+        """All negative values are invalid, only -200 to -1 are flagged."""
+        values = numpy.array([-201, -200, -1, 0, 1])
+        self.assertEqual(
+            [False, True, True, False, False],
+            DEFAULT_MISSING_CODES.flags(values).tolist(),
+        )
+        self.assertEqual(
+            [True, True, True, False, False],
+            DEFAULT_MISSING_CODES.codes(values).tolist(),
+        )
+        self.assertIsNone(DEFAULT_MISSING_CODES.option())
+
+    def test_parse(self) -> None:
+        """Ranges and single codes are read from a comma separated list."""
+        missing_codes = MissingCodes.parse("-99:-91, -1,9999")
+        self.assertEqual(
+            ((-99.0, -91.0), (-1.0, -1.0), (9999.0, 9999.0)), missing_codes.ranges
+        )
+        values = numpy.array([-100, -99, -95, -91, -90, -1, 0, 9999, 10000])
+        self.assertEqual(
+            [False, True, True, True, False, True, False, True, False],
+            missing_codes.codes(values).tolist(),
+        )
+        self.assertEqual(
+            missing_codes.codes(values).tolist(), missing_codes.flags(values).tolist()
+        )
+
+    def test_parse_rejects_invalid_ranges(self) -> None:
+        """Ranges have to be numbers, with the lowest code first."""
+        for text in ("", "a:b", "-1:-9", "1:2:3"):
+            with self.assertRaises(ValueError, msg=text):
+                MissingCodes.parse(text)
+
+    def test_invalid_mask(self) -> None:
+        """Null values and missing codes of a column are invalid."""
+        column = pandas.Series([1.0, numpy.nan, -1.0, 97.0, 5.0])
+        self.assertEqual(
+            [False, True, True, False, False],
+            DEFAULT_MISSING_CODES.invalid(column).tolist(),
+        )
+        self.assertEqual(
+            [False, True, False, True, False],
+            MissingCodes([(97, 99)]).invalid(column).tolist(),
+        )
+
+    def test_option_round_trip(self) -> None:
+        """The ranges stored in the manifest compare equal after loading them."""
+        missing_codes = MissingCodes.parse("-9:-1")
+        option = missing_codes.option()
+        self.assertEqual(option, json.loads(json.dumps(option)))
+        self.assertEqual(missing_codes, MissingCodes(option))  # type: ignore
+
+    def test_pickle(self) -> None:
+        """Missing codes are sent to worker processes."""
+        for missing_codes in (DEFAULT_MISSING_CODES, MissingCodes.parse("9999")):
+            self.assertEqual(missing_codes, pickle.loads(pickle.dumps(missing_codes)))
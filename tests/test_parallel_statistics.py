@@ -0,0 +1,88 @@
+"""Unittests for the collect_stata.parallel_statistics module"""
+import threading
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Tuple
+from unittest.mock import patch
+
+import numpy
+import pandas
+
+from collect_stata.batch_statistics import BatchResult, get_batch_statistics
+from collect_stata.parallel_statistics import get_parallel_batch_statistics
+from collect_stata.variables import CompactVariable
+
+
+def _data_and_metadata() -> Tuple[pandas.DataFrame, List[CompactVariable]]:
+    generator = numpy.random.default_rng(seed=0)
+    rows = 1001
+    data = pandas.DataFrame(
+        {
+            "cat": generator.integers(-3, 4, size=rows).astype("int8"),
+            "income": generator.lognormal(7, 1, size=rows),
+            "income_float32": generator.lognormal(7, 1, size=rows).astype("float32"),
+            "age": generator.integers(0, 99, size=rows).astype("int32"),
+            "text": ["a"] * rows,
+        }
+    )
+    data.loc[::7, "income"] = numpy.nan
+    metadata = [
+        {"name": "cat", "scale": "cat", "categories": {"values": [-1, 1, 2]}},
+        {"name": "income", "scale": "number", "categories": {"values": []}},
+        {"name": "income_float32", "scale": "number", "categories": {"values": []}},
+        {"name": "age", "scale": "number", "categories": {"values": [0, 98]}},
+        {"name": "text", "scale": "string", "categories": {"values": []}},
+    ]
+    return data, [CompactVariable.from_dict(variable) for variable in metadata]
+
+
+def _as_lists(results: Dict[str, BatchResult]) -> Dict[str, Tuple[dict, list]]:
+    """Convert the frequency arrays, so results can be compared with assertEqual."""
+    return {
+        name: (statistics, frequencies.tolist())
+        for name, (statistics, frequencies) in results.items()
+    }
+
+
+class TestParallelBatchStatistics(unittest.TestCase):
+    """Results of the worker processes have to equal the serial results."""
+
+    def test_same_results_as_batch_statistics(self) -> None:
+        """Columns split between workers give the serial results."""
+        data, metadata = _data_and_metadata()
+        expected = get_batch_statistics(data, metadata)
+        with patch("collect_stata.parallel_statistics.MIN_PARALLEL_VALUES", 0):
+            result = get_parallel_batch_statistics(data, metadata, jobs=2)
+        self.assertEqual(_as_lists(expected), _as_lists(result))
+        self.assertEqual(["cat", "income", "income_float32", "age"], list(result))
+
+    def test_small_data_stays_in_process(self) -> None:
+        """No workers are started for data below the threshold."""
+        data, metadata = _data_and_metadata()
+        with patch("collect_stata.parallel_statistics.ProcessPoolExecutor") as pool:
+            result = get_parallel_batch_statistics(data, metadata, jobs=2)
+        pool.assert_not_called()
+        self.assertEqual(
+            _as_lists(get_batch_statistics(data, metadata)), _as_lists(result)
+        )
+
+    def test_workers_are_not_forked(self) -> None:
+        """Workers started from a thread do not fork the calling process."""
+        data, metadata = _data_and_metadata()
+        expected = get_batch_statistics(data, metadata)
+        results: List[Dict[str, BatchResult]] = list()
+        with patch("collect_stata.parallel_statistics.MIN_PARALLEL_VALUES", 0):
+            with patch(
+                "collect_stata.parallel_statistics.ProcessPoolExecutor",
+                wraps=ProcessPoolExecutor,
+            ) as pool:
+                thread = threading.Thread(
+                    target=lambda: results.append(
+                        get_parallel_batch_statistics(data, metadata, jobs=2)
+                    )
+                )
+                thread.start()
+                thread.join()
+        context = pool.call_args.kwargs["mp_context"]
+        self.assertNotEqual("fork", context.get_start_method())
+        self.assertEqual(_as_lists(expected), _as_lists(results[0]))
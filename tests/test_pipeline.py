@@ -0,0 +1,81 @@
+"""Unittests for the collect_stata.pipeline module"""
+import threading
+import unittest
+from typing import List
+
+from collect_stata.pipeline import Pipeline
+
+
+class TestPipeline(unittest.TestCase):
+    """Test the stages and the bounded queues of the pipeline."""
+
+    def test_items_pass_all_stages_in_order(self) -> None:
+        """Every item is loaded, computed and written in the given order."""
+        written: List[int] = list()
+        pipeline: Pipeline[int, int, int] = Pipeline(
+            load=lambda item: item * 10,
+            compute=lambda loaded: loaded + 1,
+            write=written.append,
+        )
+        self.assertEqual([], pipeline.run(range(5)))
+        self.assertEqual([1, 11, 21, 31, 41], written)
+
+    def test_failed_items_skip_later_stages(self) -> None:
+        """Items failing in a stage are reported and not written."""
+        def load(item: int) -> int:
+            if item == 1:
+                raise ValueError("load")
+            return item
+
+        def compute(item: int) -> int:
+            if item == 2:
+                raise ValueError("compute")
+            return item
+
+        written: List[int] = list()
+        pipeline: Pipeline[int, int, int] = Pipeline(load, compute, written.append)
+        failed = pipeline.run(range(4))
+        self.assertEqual([0, 3], written)
+        self.assertEqual([1, 2], sorted(item for item, _ in failed))
+
+    def test_read_ahead_is_bounded(self) -> None:
+        """The reader waits while the queue of loaded items is full."""
+        loaded: List[int] = list()
+        computing = threading.Event()
+        ahead: List[int] = list()
+
+        def load(item: int) -> int:
+            loaded.append(item)
+            return item
+
+        def compute(item: int) -> int:
+            if not computing.is_set():
+                computing.set()
+                # Give the reader time to fill the queue.
+                threading.Event().wait(0.2)
+                ahead.append(len(loaded) - 1)
+            return item
+
+        pipeline: Pipeline[int, int, int] = Pipeline(
+            load, compute, lambda item: None, read_ahead=2
+        )
+        pipeline.run(range(10))
+        # Two items in the queue and one held by the blocked reader.
+        self.assertLessEqual(ahead[0], 3)
+        self.assertEqual(list(range(10)), loaded)
+
+    def test_ended_writer_does_not_block(self) -> None:
+        """Computed items are not put into a queue the ended writer never empties."""
+
+        def write(item: int) -> None:
+            # Ends the writer thread instead of failing a single item.
+            raise SystemExit(item)
+
+        pipeline: Pipeline[int, int, int] = Pipeline(
+            lambda item: item, lambda item: item, write
+        )
+        runner = threading.Thread(target=pipeline.run, args=(range(10),))
+        runner.start()
+        runner.join(timeout=10)
+        self.assertFalse(runner.is_alive())
+        self.assertEqual([0], [item for item, _ in pipeline.failed])
@@ -0,0 +1,109 @@
+"""Unittests for the collect_stata.read_header module"""
+import pathlib
+import unittest
+from tempfile import TemporaryDirectory
+
+import numpy
+import pandas
+from deepdiff import DeepDiff
+
+from collect_stata.read_header import (
+    StataHeaderReader,
+    ValueLabelCache,
+    build_variable_metadata,
+)
+from collect_stata.read_stata import StataDataExtractor
+from collect_stata.variables import to_dicts
+from tests.helpers import write_stata
+
+
+def _write_test_file(file_name: pathlib.Path, version: int, byteorder: str) -> None:
+    data = pandas.DataFrame(
+        {
+            "category": numpy.array([1, -1, 2], dtype="int8"),
+            "text": ["a", "bb", ""],
+            "number": [1.5, 2.0, numpy.nan],
+        }
+    )
+    value_labels = {"category": {-1: "missing", 1: "yes", 2: "no"}}
+    write_stata(
+        file_name,
+        data,
+        version=version,
+        byteorder=byteorder,
+        variable_labels={"category": "Kategorie ä", "text": "Text"},
+        value_labels=value_labels,
+    )
+
+
+class TestStataHeaderReader(unittest.TestCase):
+    """The header reader has to give the same metadata as the pandas reader."""
+
+    def _assert_same_labels(self, file_name: pathlib.Path) -> None:
+        # The pandas reader is the reference the header reader replaces.
+        # pylint: disable=protected-access
+        expected = StataDataExtractor(file_name)._pandas_metadata()
+        result = StataHeaderReader(file_name).get_variable_metadata()
+        diff = DeepDiff(to_dicts(expected), to_dicts(result))
+        self.assertTrue(expr=(not diff), msg=str(diff))
+
+    def test_test_dataset(self) -> None:
+        """Compare metadata of the format 115 test datasets."""
+        self._assert_same_labels(pathlib.Path("tests/input/en/test.dta"))
+        self._assert_same_labels(pathlib.Path("tests/input/de/test.dta"))
+
+    def test_formats_and_byteorders(self) -> None:
+        """Compare metadata of the old and the xml like formats."""
+        with TemporaryDirectory() as directory:
+            for version in (114, 117, 118, 119):
+                for byteorder in ("<", ">"):
+                    file_name = pathlib.Path(directory).joinpath(f"{version}.dta")
+                    _write_test_file(file_name, version, byteorder)
+                    self._assert_same_labels(file_name)
+                    reader = StataHeaderReader(file_name)
+                    self.assertEqual(3, reader.nobs)
+                    self.assertEqual(
+                        ["cat", "string", "number"],
+                        [
+                            variable.scale
+                            for variable in reader.get_variable_metadata()
+                        ],
+                    )
+
+
+class TestValueLabelCache(unittest.TestCase):
+    """Value label tables are sorted once and shared between variables."""
+
+    def test_shared_tables(self) -> None:
+        """Equal tables are sorted once and shared by variables and files."""
+        cache = ValueLabelCache()
+        yes_no = {2: "no", 1: "yes", -1: "missing"}
+        metadata = build_variable_metadata(
+            dataset="test",
+            varlist=["a", "b", "c"],
+            lbllist=["yes_no", "yes_no", ""],
+            variable_labels={},
+            value_labels={"yes_no": yes_no},
+            scales=["number", "number", "string"],
+            cache=cache,
+        )
+        self.assertEqual([-1, 1, 2], metadata[0].categories.value_list())
+        self.assertEqual(["missing", "yes", "no"], metadata[0].categories.labels)
+        first, second = metadata[0].categories, metadata[1].categories
+        self.assertIs(first.values, second.values)
+        self.assertFalse(first.values.flags.writeable)
+        self.assertEqual(["cat", "cat", "string"], [var.scale for var in metadata])
+        self.assertEqual((0, 1), (cache.hits, cache.misses))
+
+        # The same table in another file, under another name, is reused.
+        other = build_variable_metadata(
+            dataset="other",
+            varlist=["d"],
+            lbllist=["ja_nein"],
+            variable_labels={},
+            value_labels={"ja_nein": dict(yes_no)},
+            scales=["number"],
+            cache=cache,
+        )
+        self.assertIs(first.labels, other[0].categories.labels)
+        self.assertEqual((1, 1), (cache.hits, cache.misses))
@@ -0,0 +1,152 @@
+"""Unittests for the collect_stata.read_mmap module"""
+import mmap
+import pathlib
+from typing import Iterator, List
+from unittest import mock
+
+import numpy
+import pandas
+
+from collect_stata.read_mmap import MappedStataExtractor, create_extractor
+from collect_stata.read_stata import StataDataExtractor
+from collect_stata.variables import to_dicts
+from collect_stata.write_json import generate_statistics, generate_streaming_statistics
+from tests.helpers import TemporaryDirectoryTestCase, write_stata
+
+
+def _write_test_file(file_name: pathlib.Path, version: int, byteorder: str) -> None:
+    data = pandas.DataFrame(
+        {
+            "category": numpy.array([1, -1, 2, 1], dtype="int8"),
+            "count": numpy.array([10, 20, 30, 40], dtype="int32"),
+            "text": ["a", "bb", "", "ä"],
+            "long_text": ["x" * 300, "", "y", "z"],
+            "number": [1.5, 2.0, numpy.nan, -3.0],
+            "date": pandas.to_datetime(["2000-01-01", None, "2019-12-06", "1960-01-01"]),
+        }
+    )
+    write_stata(
+        file_name,
+        data,
+        version,
+        byteorder,
+        convert_strl=["long_text"] if version > 117 else [],
+        convert_dates={"date": "td"},
+        value_labels={"category": {-1: "missing", 1: "yes", 2: "no"}},
+    )
+
+
+def _write_strl_file(file_name: pathlib.Path) -> None:
+    data = pandas.DataFrame(
+        {
+            "long_text": ["x", "", "long" * 700, "", ".", "y"],
+            "category": numpy.array([1, -1, 2, 1, 1, 2], dtype="int8"),
+        }
+    )
+    write_stata(
+        file_name,
+        data,
+        118,
+        convert_strl=["long_text"],
+        value_labels={"category": {-1: "missing", 1: "yes", 2: "no"}},
+    )
+
+
+class TestMappedStataExtractor(TemporaryDirectoryTestCase):
+    """The mapped reader has to give the same data as pandas.read_stata."""
+
+    def _files(self) -> Iterator[pathlib.Path]:
+        """Write the test data in all mapped formats and byte orders."""
+        for version in (117, 118, 119):
+            for byteorder in ("<", ">"):
+                endian = "big" if byteorder == ">" else "little"
+                file_name = self.path.joinpath(f"{version}{endian}.dta")
+                _write_test_file(file_name, version, byteorder)
+                yield file_name
+
+    def test_same_data_as_pandas(self) -> None:
+        """All formats and byte orders are decoded like pandas decodes them."""
+        for file_name in self._files():
+            extractor = MappedStataExtractor(file_name)
+            extractor.parse_file()
+            expected = pandas.read_stata(file_name, convert_categoricals=False)
+            pandas.testing.assert_frame_equal(expected, extractor.data)
+
+    def test_same_chunks_as_pandas(self) -> None:
+        """Chunks of selected columns equal the chunks read by pandas."""
+        for file_name in self._files():
+            extractor = MappedStataExtractor(file_name, exclude=["text"])
+            expected = pandas.read_stata(
+                file_name,
+                convert_categoricals=False,
+                columns=extractor.selected_columns(),
+                chunksize=3,
+            )
+            for expected_chunk, chunk in zip(expected, extractor.iter_chunks(3)):
+                pandas.testing.assert_frame_equal(expected_chunk, chunk)
+
+    def test_unselected_columns_are_not_read(self) -> None:
+        """Only the columns of included variables are in the data."""
+        for file_name in self._files():
+            extractor = MappedStataExtractor(file_name, include=["c*"])
+            extractor.parse_file()
+            self.assertEqual(["category", "count"], list(extractor.data.columns))
+            self.assertEqual([10, 20, 30, 40], extractor.data["count"].tolist())
+
+    def test_old_formats_fall_back_to_pandas(self) -> None:
+        """Files before the format 117 are read with pandas."""
+        file_name = pathlib.Path("tests/input/en/test.dta")
+        with self.assertRaises(ValueError):
+            MappedStataExtractor(file_name)
+        self.assertIsInstance(
+            create_extractor(file_name, engine="mmap"), StataDataExtractor
+        )
+
+    def test_long_strings_give_the_same_statistics(self) -> None:
+        """The engines read long strings (strL) as strings, not as their keys."""
+        file_name = self.path.joinpath("strl.dta")
+        _write_strl_file(file_name)
+        results = list()
+        for engine in ("pandas", "mmap"):
+            extractor = create_extractor(file_name, engine=engine)
+            extractor.parse_file()
+            results.append(
+                to_dicts(
+                    generate_statistics(
+                        extractor.data, extractor.get_variable_metadata(), "study"
+                    )
+                )
+            )
+            chunk_extractor = create_extractor(file_name, engine=engine)
+            results.append(
+                to_dicts(
+                    generate_streaming_statistics(
+                        chunk_extractor.iter_chunks(4),
+                        chunk_extractor.get_variable_metadata(),
+                        "study",
+                    )
+                )
+            )
+        self.assertEqual({"valid": 3, "invalid": 3}, results[0][0]["statistics"])
+        for result in results[1:]:
+            self.assertEqual(results[0], result)
+
+    def test_map_is_closed_after_the_last_chunk(self) -> None:
+        """The chunks do not refer to the mapped file, so it can be closed."""
+        maps: List[mmap.mmap] = list()
+        create = mmap.mmap
+
+        def create_map(*args: int, **kwargs: int) -> mmap.mmap:
+            maps.append(create(*args, **kwargs))
+            return maps[-1]
+
+        for file_name in self._files():
+            extractor = MappedStataExtractor(file_name)
+            with mock.patch("collect_stata.read_mmap.mmap.mmap", create_map):
+                chunks = list(extractor.iter_chunks(3))
+            self.assertTrue(maps[-1].closed)
+            expected = pandas.read_stata(
+                file_name, convert_categoricals=False, chunksize=3
+            )
+            for expected_chunk, chunk in zip(expected, chunks):
+                pandas.testing.assert_frame_equal(expected_chunk, chunk)
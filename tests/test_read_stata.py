@@ -4,19 +4,19 @@ import unittest
 from typing import Dict, List
 from unittest.mock import patch
 
-import numpy
 import pandas
 from deepdiff import DeepDiff
 
-from collect_stata.read_stata import StataDataExtractor
+from collect_stata.read_stata import StataDataExtractor, is_selected
 from collect_stata.types import Variable
+from collect_stata.variables import to_dicts
 
 
 class MockedStataReader:
     """Implement StataReader functions needed for tests; provide test data."""
 
-    varlist: List[str] = ["variable_name"]
-    dtypelist: List[object] = [numpy.int8]
+    _varlist: List[str] = ["variable_name"]
+    _typlist: List[object] = ["b"]
 
     @staticmethod
     def value_labels() -> Dict[str, Dict[int, str]]:
@@ -28,7 +28,7 @@ class MockedStataReader:
         """Control what variable labels are ingested during a test."""
         return {"variable_name": "variable_label"}
 
-    lbllist: List[str] = ["variable_name"]
+    _lbllist: List[str] = ["variable_name"]
 
     @staticmethod
     def expected_metadata(dataset_name: str) -> List[Variable]:
@@ -53,10 +53,11 @@ class TestMetadataFunctions(unittest.TestCase):
     def test_get_variable_metadata(self) -> None:
         """ Do we get desired metadata from the method?
 
-        get_variable_metadata should return a list with a dictionary for every
-        variable accessible through the stata reader.
+        get_variable_metadata should return a list with a CompactVariable for every
+        variable accessible through the stata reader. Files in formats the header
+        reader does not support get their metadata from the pandas reader.
 
-        The expected keys should be as follow:
+        Converted to a dictionary, the expected keys should be as follow:
             * name: The name of the variable.
             * label: The label of the variable.
             * categories: A dictionary containing:
@@ -72,12 +73,40 @@ class TestMetadataFunctions(unittest.TestCase):
         dataset_path = pathlib.Path("/tmp").joinpath(dataset_path)
         with patch.object(pandas, attribute="read_stata", return_value=MockedStataReader):
             data_extractor = StataDataExtractor(dataset_path)
-            result = data_extractor.get_variable_metadata()
+            # The fallback for formats the header reader does not support.
+            result = data_extractor._pandas_metadata()  # pylint: disable=protected-access
 
         # We deepdiff both structures to ensure, that they contain the same content
         # even in the nested parts of the structure.
         # The diff should be empty, giving a {} that evaluates to False.
         # Otherwise it contains information about the difference which should be
         # usefull in the test output.
-        diff = DeepDiff(MockedStataReader.expected_metadata(dataset_name), result)
+        expected = MockedStataReader.expected_metadata(dataset_name)
+        diff = DeepDiff(expected, to_dicts(result))
         self.assertTrue(expr=(not diff), msg=str(diff))
+
+
+class TestColumnProjection(unittest.TestCase):
+    """Test reading only the columns of selected variables."""
+
+    def test_is_selected(self) -> None:
+        """Exclude patterns take precedence over include patterns."""
+        self.assertTrue(is_selected("hkind", None, None))
+        self.assertTrue(is_selected("hkind", ["hk*"], None))
+        self.assertFalse(is_selected("hm04", ["hk*"], None))
+        self.assertFalse(is_selected("hkind", ["hk*"], ["hkind"]))
+        self.assertFalse(is_selected("HKIND", ["hk*"], None))
+
+    def test_only_selected_columns_are_read(self) -> None:
+        """Data and chunks only contain the selected columns."""
+        file_name = pathlib.Path("tests/input/en/test.dta")
+        data_extractor = StataDataExtractor(
+            file_name, include=["HK*"], exclude=["HKGEBB"]
+        )
+        data_extractor.parse_file()
+        expected = ["HKIND", "HKIND_Dummy", "HKGEBA", "HKGEBC", "HKGEBD"]
+        self.assertEqual(expected, list(data_extractor.data.columns))
+        self.assertEqual(11, len(data_extractor.metadata))
+
+        chunks = StataDataExtractor(file_name, exclude=["H*"]).iter_chunks(5)
+        self.assertEqual(["AHHNR"], list(next(chunks).columns))
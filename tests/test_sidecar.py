@@ -0,0 +1,124 @@
+"""Unittests for the collect_stata.sidecar module"""
+
+import os
+import pathlib
+import sys
+import unittest
+from tempfile import TemporaryDirectory
+from unittest import mock
+
+import pandas
+
+from collect_stata.__main__ import main
+from collect_stata.read_mmap import create_extractor
+from collect_stata.read_stata import StataDataExtractor
+from collect_stata.sidecar import (
+    SIDECAR_FORMATS,
+    SidecarExtractor,
+    pyarrow,
+    sidecar_file,
+    write_sidecar,
+)
+from collect_stata.variables import to_dicts
+from tests.helpers import TemporaryDirectoryTestCase
+
+TEST_FILE = pathlib.Path("tests/input/en/test.dta")
+
+
+class TestCreateExtractor(unittest.TestCase):
+    """Sidecars are only used if they exist and are up to date."""
+
+    def test_missing_sidecar_falls_back_to_stata_file(self) -> None:
+        """The stata file is read if there is no sidecar."""
+        with TemporaryDirectory() as output_dir:
+            sidecar = sidecar_file(pathlib.Path(output_dir), TEST_FILE, "parquet")
+            self.assertEqual(pathlib.Path(output_dir, "test.parquet"), sidecar)
+            extractor = create_extractor(TEST_FILE, sidecar=sidecar)
+        self.assertIsInstance(extractor, StataDataExtractor)
+
+
+@mock.patch("collect_stata.sidecar.pyarrow", None)
+class TestMissingPyarrow(TemporaryDirectoryTestCase):
+    """Without pyarrow, sidecars are rejected or ignored with a clear message."""
+
+    def test_existing_sidecar_is_ignored(self) -> None:
+        """The stata file is read, even if its sidecar is newer."""
+        sidecar = self.path.joinpath("test.parquet")
+        sidecar.write_bytes(b"")
+        with self.assertRaisesRegex(ValueError, "pyarrow"):
+            SidecarExtractor(sidecar)
+        self.assertIsInstance(
+            create_extractor(TEST_FILE, sidecar=sidecar), StataDataExtractor
+        )
+
+    def test_writing_fails(self) -> None:
+        """Writing a sidecar fails before a file is created."""
+        sidecar = self.path.joinpath("test.parquet")
+        with self.assertRaisesRegex(RuntimeError, "pyarrow"):
+            write_sidecar(pandas.DataFrame({"a": [1]}), [], sidecar)
+        self.assertEqual([], list(self.path.iterdir()))
+
+    def test_cli_rejects_sidecar_option(self) -> None:
+        """The --sidecar option is an argument error if pyarrow is not found."""
+        arguments = ["__main__.py", "-i", "in", "-o", "out", "-s", "study"]
+        with mock.patch.object(sys, "argv", arguments + ["--sidecar", "parquet"]):
+            with mock.patch("importlib.util.find_spec", return_value=None):
+                with self.assertRaises(SystemExit) as caught_exit:
+                    main()
+        self.assertEqual(2, caught_exit.exception.code)
+
+
+@unittest.skipIf(pyarrow is None, "pyarrow is not installed")
+class TestSidecar(TemporaryDirectoryTestCase):
+    """Sidecars have to give the same data and metadata as the stata file."""
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.stata_data = StataDataExtractor(TEST_FILE)
+        self.stata_data.parse_file()
+
+    def _write(self, sidecar_format: str) -> pathlib.Path:
+        sidecar = sidecar_file(self.path, TEST_FILE, sidecar_format)
+        write_sidecar(self.stata_data.data, self.stata_data.metadata, sidecar)
+        return sidecar
+
+    def test_same_data_and_metadata(self) -> None:
+        """Both formats give the data and metadata of the stata file."""
+        for sidecar_format in SIDECAR_FORMATS:
+            extractor = create_extractor(TEST_FILE, sidecar=self._write(sidecar_format))
+            self.assertIsInstance(extractor, SidecarExtractor)
+            self.assertEqual(
+                to_dicts(self.stata_data.metadata),
+                to_dicts(extractor.get_variable_metadata()),
+            )
+            extractor.parse_file()
+            pandas.testing.assert_frame_equal(
+                self.stata_data.data, extractor.data, check_dtype=False
+            )
+
+    def test_chunks(self) -> None:
+        """Chunks hold all rows of the selected columns."""
+        for sidecar_format in SIDECAR_FORMATS:
+            extractor = SidecarExtractor(self._write(sidecar_format), include=["HK*"])
+            chunks = list(extractor.iter_chunks(3))
+            data = pandas.concat(chunks)
+            self.assertEqual(extractor.selected_columns(), list(data.columns))
+            self.assertEqual(len(self.stata_data.data), len(data))
+
+    def test_outdated_or_incomplete_sidecar_is_not_used(self) -> None:
+        """Older sidecars or sidecars without all selected columns are not read."""
+        sidecar = self._write("parquet")
+        stat = TEST_FILE.stat()
+        os.utime(sidecar, ns=(stat.st_atime_ns, stat.st_mtime_ns - 1))
+        self.assertIsInstance(
+            create_extractor(TEST_FILE, sidecar=sidecar), StataDataExtractor
+        )
+
+        write_sidecar(self.stata_data.data[["HKIND"]], self.stata_data.metadata, sidecar)
+        self.assertIsInstance(
+            create_extractor(TEST_FILE, sidecar=sidecar), StataDataExtractor
+        )
+        self.assertIsInstance(
+            create_extractor(TEST_FILE, include=["HKIND"], sidecar=sidecar),
+            SidecarExtractor,
+        )
@@ -0,0 +1,115 @@
+"""Unittests for the collect_stata.sketch module"""
+import unittest
+
+import numpy
+import pandas
+
+from collect_stata.sketch import DistinctSketch, QuantileSketch, bit_lengths
+
+
+class TestQuantileSketch(unittest.TestCase):
+    """Test the approximation of quantiles."""
+
+    def test_small_input_is_exact(self) -> None:
+        """Without compaction the quantiles equal the pandas quantiles."""
+        values = numpy.random.default_rng(seed=0).normal(size=100)
+        sketch = QuantileSketch(error=0.01)
+        sketch.update(values)
+        for quantile in (0.25, 0.5, 0.75):
+            expected = pandas.Series(values).quantile(quantile)
+            self.assertEqual(expected, sketch.quantile(quantile))
+
+    def test_error_bound(self) -> None:
+        """The rank of approximated quantiles is within the error bound."""
+        values = numpy.random.default_rng(seed=1).exponential(size=200_000)
+        error = 0.01
+        sketch = QuantileSketch(error=error)
+        for chunk in numpy.array_split(values, 37):
+            sketch.update(chunk)
+        self.assertEqual(values.size, sketch.count)
+        self.assertLess(sum(level.size for level in sketch.levels), 5000)
+        sorted_values = numpy.sort(values)
+        for quantile in (0.25, 0.5, 0.75):
+            rank = numpy.searchsorted(sorted_values, sketch.quantile(quantile))
+            rank = rank / values.size
+            self.assertLess(abs(rank - quantile), error)
+
+    def test_large_update_is_sampled(self) -> None:
+        """A single large update keeps the error bound without keeping the values."""
+        values = numpy.random.default_rng(seed=3).exponential(size=1_000_000)
+        error = 0.02
+        sketch = QuantileSketch(error=error)
+        sketch.update(values)
+        self.assertEqual(values.size, sketch.count)
+        self.assertGreater(len(sketch.levels), 2)
+        self.assertLess(sum(level.size for level in sketch.levels), 2000)
+        sorted_values = numpy.sort(values)
+        for quantile in (0.25, 0.5, 0.75):
+            rank = numpy.searchsorted(sorted_values, sketch.quantile(quantile))
+            self.assertLess(abs(rank / values.size - quantile), error)
+
+    def test_update_counts(self) -> None:
+        """Distinct values with counts stand for their repeated occurrences."""
+        values = numpy.array([1.0, 2.5, 4.0, 8.0])
+        counts = numpy.array([3, 1, 6, 2])
+        sketch = QuantileSketch(error=0.01)
+        sketch.update_counts(values, counts)
+        self.assertEqual(12, sketch.count)
+        repeated = pandas.Series(numpy.repeat(values, counts))
+        for quantile in (0.25, 0.5, 0.75):
+            self.assertEqual(repeated.quantile(quantile), sketch.quantile(quantile))
+
+    def test_merge(self) -> None:
+        """Merged sketches of parts approximate the quantiles of the whole."""
+        values = numpy.random.default_rng(seed=2).uniform(size=100_000)
+        sketches = [QuantileSketch(error=0.01) for _ in range(4)]
+        for sketch, part in zip(sketches, numpy.array_split(values, 4)):
+            sketch.update(part)
+        merged = sketches[0]
+        for sketch in sketches[1:]:
+            merged.merge(sketch)
+        self.assertEqual(values.size, merged.count)
+        self.assertAlmostEqual(0.5, merged.quantile(0.5), delta=0.01)
+
+
+class TestDistinctSketch(unittest.TestCase):
+    """Test the estimation of distinct values."""
+
+    def test_small_counts_are_exact(self) -> None:
+        """Few distinct values are counted exactly."""
+        sketch = DistinctSketch()
+        sketch.update(numpy.array(["a", "b", "c", "a", "b"], dtype=object))
+        self.assertEqual(3, sketch.estimate())
+
+    def test_bit_lengths(self) -> None:
+        """Bit lengths are exact also for values with more than 53 bits."""
+        values = [0, 1, 2, 3, 2 ** 31, 2 ** 32 - 1, 2 ** 32, 2 ** 53 + 1]
+        values += [2 ** 60 - 1, 2 ** 63, 2 ** 64 - 1]
+        result = bit_lengths(numpy.array(values, dtype="uint64"))
+        self.assertEqual([value.bit_length() for value in values], result.tolist())
+
+    def test_ranks_of_all_precisions(self) -> None:
+        """The registers equal a reference computed with Python integers."""
+        values = numpy.array([f"value {i}" for i in range(5000)], dtype=object)
+        hashes = pandas.util.hash_array(values, categorize=False).tolist()
+        for precision in (4, 10, 11, 18):
+            sketch = DistinctSketch(precision)
+            sketch.update(values)
+            width = 64 - precision
+            expected = [0] * 2 ** precision
+            for value_hash in hashes:
+                remainder = value_hash & ((1 << width) - 1)
+                register = value_hash >> width
+                rank = width + 1 - remainder.bit_length()
+                expected[register] = max(expected[register], rank)
+            self.assertEqual(expected, sketch.registers.tolist(), msg=precision)
+
+    def test_error_bound(self) -> None:
+        """Estimates from merged chunks are within a few standard errors."""
+        values = numpy.array([f"value {i}" for i in range(300_000)], dtype=object)
+        sketch = DistinctSketch()
+        for chunk in numpy.array_split(numpy.concatenate([values, values[::3]]), 7):
+            part = DistinctSketch()
+            part.update(chunk)
+            sketch.merge(part)
+        self.assertAlmostEqual(values.size, sketch.estimate(), delta=values.size * 0.03)
@@ -0,0 +1,28 @@
+"""Unittests for the collect_stata.string_statistics module"""
+import unittest
+
+import numpy
+import pandas
+
+from collect_stata.sketch import DistinctSketch
+from collect_stata.string_statistics import get_string_statistics
+
+
+class TestStringStatistics(unittest.TestCase):
+    """Test the valid and invalid counts of string variables."""
+
+    values = ["a", "", None, ".", numpy.nan, "b", "a", pandas.NA]
+
+    def test_object_and_string_arrays(self) -> None:
+        """Missing strings are counted for object and string dtypes."""
+        for dtype in (object, "str"):
+            column = pandas.Series(self.values, dtype=object).astype(dtype)
+            self.assertEqual(
+                {"valid": 3, "invalid": 5}, get_string_statistics(column), msg=dtype
+            )
+
+    def test_distinct_values(self) -> None:
+        """The sketch counts the distinct valid strings."""
+        column = pandas.Series(self.values, dtype=object)
+        statistics = get_string_statistics(column, DistinctSketch())
+        self.assertEqual({"valid": 3, "invalid": 5, "distinct": 2}, statistics)
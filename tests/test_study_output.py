@@ -0,0 +1,107 @@
+"""Unittests for the collect_stata.study_output module"""
+
+import json
+import sqlite3
+
+from collect_stata.options import RunOptions
+from collect_stata.study_output import create_study_output, study_output_file
+from tests.helpers import TemporaryDirectoryTestCase
+
+
+class TestStudyOutput(TemporaryDirectoryTestCase):
+    """The study output has to contain the variables of the json files."""
+
+    def write_study_output(self, study_output: str, latin1: bool = True) -> None:
+        """Run the cli with a study output of the given format."""
+        self.run_cli(self.path, latin1, RunOptions(study_output=study_output))
+
+    def expected(self) -> list:
+        """Get the variables of the json file written by the cli."""
+        return json.loads(self.path.joinpath("test.json").read_bytes())
+
+    def test_ndjson(self) -> None:
+        """Every line of the ndjson file is a variable of the json file."""
+        self.write_study_output("ndjson")
+        file_name = study_output_file(self.path, "study", "ndjson")
+        with open(file_name, encoding="utf-8") as file:
+            variables = [json.loads(line) for line in file]
+        self.assertEqual(self.expected(), variables)
+
+    def test_sqlite(self) -> None:
+        """Every row of the database holds a variable of the json file."""
+        self.write_study_output("sqlite")
+        file_name = study_output_file(self.path, "study", "sqlite")
+        with sqlite3.connect(file_name) as connection:
+            rows = connection.execute(
+                "SELECT dataset, variable, data FROM variables"
+            ).fetchall()
+        variables = {variable: json.loads(data) for _, variable, data in rows}
+        self.assertEqual({"test"}, {dataset for dataset, _, _ in rows})
+        self.assertEqual(
+            {variable["name"]: variable for variable in self.expected()}, variables
+        )
+
+    def test_default_options_keep_umlauts(self) -> None:
+        """Labels of Latin-1 encoded files are not replaced with U+FFFD."""
+        self.write_study_output("ndjson", latin1=False)
+        self.write_study_output("sqlite", latin1=False)
+        # Without --latin1, the json files are written Latin-1 encoded.
+        expected = json.loads(
+            self.path.joinpath("test.json").read_bytes().decode("latin-1")
+        )
+        file_name = study_output_file(self.path, "study", "ndjson")
+        with open(file_name, encoding="utf-8") as file:
+            variables = [json.loads(line) for line in file]
+        self.assertEqual(expected, variables)
+        self.assertIn("Dummy für Anzahl Kinder", [v["label_de"] for v in variables])
+        file_name = study_output_file(self.path, "study", "sqlite")
+        with sqlite3.connect(file_name) as connection:
+            rows = connection.execute("SELECT data FROM variables").fetchall()
+        self.assertNotIn("\ufffd", "".join(data for data, in rows))
+
+    def test_missing_study_output_is_rebuilt(self) -> None:
+        """Reused files are processed again if the study output was removed."""
+        self.write_study_output("ndjson")
+        study_output_file(self.path, "study", "ndjson").unlink()
+        self.write_study_output("ndjson")
+        self.assertTrue(study_output_file(self.path, "study", "ndjson").is_file())
+
+    def test_reused_datasets_are_kept(self) -> None:
+        """Kept datasets stay in the output, all others are replaced."""
+        variables = [{"name": "a", "dataset": "kept"}, {"name": "a", "dataset": "old"}]
+        for format_ in ("ndjson", "sqlite"):
+            with create_study_output(self.path, "study", format_) as output:
+                output.write("kept", variables[:1])
+                output.write("old", variables[1:])
+            with create_study_output(
+                self.path, "study", format_, keep={"kept"}
+            ) as output:
+                output.write("new", [{"name": "a", "dataset": "new"}])
+            file_name = study_output_file(self.path, "study", format_)
+            if format_ == "ndjson":
+                with open(file_name, encoding="utf-8") as file:
+                    datasets = [json.loads(line)["dataset"] for line in file]
+            else:
+                with sqlite3.connect(file_name) as connection:
+                    datasets = [
+                        row[0]
+                        for row in connection.execute("SELECT dataset FROM variables")
+                    ]
+            self.assertEqual(["kept", "new"], sorted(datasets), format_)
+
+    def test_failed_open_releases_the_output(self) -> None:
+        """A study output that can not be opened leaves no file or connection open."""
+        for format_, error in (("ndjson", ValueError), ("sqlite", sqlite3.DatabaseError)):
+            file_name = study_output_file(self.path, "study", format_)
+            file_name.write_text("no " + format_ + "\n", encoding="utf-8")
+            output = create_study_output(self.path, "study", format_, keep={"a"})
+            with self.assertRaises(error):
+                output.open()
+            self.assertEqual([file_name], list(self.path.iterdir()))
+            self.assertIsNone(getattr(output, "connection", None))
+            file_name.unlink()
+
+    def test_unknown_format(self) -> None:
+        """Only the formats of the --study-output option are accepted."""
+        with self.assertRaises(ValueError):
+            study_output_file(self.path, "study", "csv")
@@ -0,0 +1,66 @@
+"""Unittests for the collect_stata.variables module"""
+import copy
+import json
+import pickle
+import unittest
+
+from collect_stata.variables import CompactVariable
+
+VARIABLE = {
+    "name": "hkind",
+    "dataset": "test",
+    "label": "Kind",
+    "categories": {
+        "values": [-2, -1, 1, 2],
+        "labels": ["no answer", "missing", "yes", "no"],
+        "labels_de": ["keine Angabe", "fehlend", "ja", "nein"],
+        "missings": [True, True, False, False],
+        "frequencies": [1, 0, 300, 2],
+    },
+    "scale": "cat",
+    "label_de": "Kind",
+    "study": "study",
+    "statistics": {"valid": 302, "invalid": 1},
+}
+
+
+class TestCompactVariable(unittest.TestCase):
+    """Compact variables have to convert to the dictionaries of json files."""
+
+    def test_round_trip(self) -> None:
+        """A dictionary is converted back to the same json."""
+        variable = CompactVariable.from_dict(VARIABLE)
+        self.assertEqual("int64", variable.categories.values.dtype)
+        self.assertEqual(
+            json.dumps(VARIABLE, indent=2), json.dumps(variable.to_dict(), indent=2)
+        )
+
+    def test_unset_fields_are_left_out(self) -> None:
+        """Fields that are not set are not added to the dictionary."""
+        metadata = {
+            "name": "text",
+            "dataset": "test",
+            "label": None,
+            "categories": {"values": [], "labels": []},
+            "scale": "string",
+        }
+        self.assertEqual(metadata, CompactVariable.from_dict(metadata).to_dict())
+
+    def test_labels_are_copied(self) -> None:
+        """Changing the labels of a dictionary leaves the shared labels alone."""
+        variable = CompactVariable.from_dict(copy.deepcopy(VARIABLE))
+        categories = variable.to_dict()["categories"]
+        categories["labels"].append("changed")
+        categories["labels_de"].clear()
+        self.assertEqual(VARIABLE, variable.to_dict())
+
+    def test_pickle(self) -> None:
+        """Compact variables can be sent to worker processes."""
+        variable = CompactVariable.from_dict(VARIABLE)
+        self.assertEqual(VARIABLE, pickle.loads(pickle.dumps(variable)).to_dict())
+
+    def test_no_instance_dictionary(self) -> None:
+        """Variables and categories only use their slots."""
+        variable = CompactVariable.from_dict(VARIABLE)
+        self.assertFalse(hasattr(variable, "__dict__"))
+        self.assertFalse(hasattr(variable.categories, "__dict__"))
@@ -0,0 +1,116 @@
+"""Unittests for the collect_stata.write_json module"""
+import gzip
+import io
+import json
+import unittest
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import List
+from unittest.mock import patch
+
+from collect_stata import write_json as write_json_module
+from collect_stata.read_stata import StataDataExtractor
+from collect_stata.types import Variable
+from collect_stata.write_json import dump_json, write_json
+
+
+def _statistics() -> List[Variable]:
+    return [
+        {
+            "study": "study",
+            "name": "variable",
+            "label": "Ümlaut label",
+            "statistics": {"Mean": 1e-05, "valid": 3, "invalid": 0},
+            "categories": {"values": [], "labels": []},
+        }
+    ]
+
+
+class TestDumpJson(unittest.TestCase):
+    """Test the serialisation backends."""
+
+    def test_default_output_is_unchanged(self) -> None:
+        """Indented output equals json.dump, whether orjson is installed or not."""
+        expected = io.StringIO()
+        json.dump(_statistics(), expected, indent=2, ensure_ascii=False)
+        for orjson_module in (write_json_module.orjson, None):
+            with patch.object(write_json_module, "orjson", orjson_module):
+                result = io.StringIO()
+                dump_json(_statistics(), result)
+                self.assertEqual(expected.getvalue(), result.getvalue())
+
+    def test_compact_output(self) -> None:
+        """Compact output contains the same data without whitespace."""
+        for orjson_module in (write_json_module.orjson, None):
+            with patch.object(write_json_module, "orjson", orjson_module):
+                result = io.StringIO()
+                dump_json(_statistics(), result, compact=True)
+                self.assertNotIn("\n", result.getvalue())
+                self.assertEqual(_statistics(), json.loads(result.getvalue()))
+
+    def test_variables_are_written_from_an_iterator(self) -> None:
+        """Output written one variable at a time equals json.dump of the list."""
+        for statistics in (list(), _statistics(), _statistics() * 3):
+            for compact in (False, True):
+                expected = io.StringIO()
+                if compact:
+                    json.dump(statistics, expected, separators=(",", ":"))
+                else:
+                    json.dump(statistics, expected, indent=2, ensure_ascii=False)
+                result = io.StringIO()
+                dump_json(iter(statistics), result, compact=compact)
+                self.assertEqual(
+                    json.loads(expected.getvalue()), json.loads(result.getvalue())
+                )
+                if not compact:
+                    self.assertEqual(expected.getvalue(), result.getvalue())
+
+
+class TestWriteJson(unittest.TestCase):
+    """Test writing files."""
+
+    def test_gzip_output(self) -> None:
+        """Compressed output contains the same data as plain output."""
+        results = list()
+        with TemporaryDirectory() as output_dir:
+            for compress in (False, True):
+                data_extractor = StataDataExtractor(Path("tests/input/en/test.dta"))
+                data_extractor.parse_file()
+                output_file = Path(output_dir).joinpath(f"test{compress}.json")
+                write_json(
+                    data_extractor.data,
+                    data_extractor.metadata,
+                    None,
+                    output_file,
+                    study="study",
+                    latin1=True,
+                    compress=compress,
+                )
+                open_file = gzip.open if compress else open
+                with open_file(output_file, "rt", encoding="utf-8") as json_file:
+                    results.append(json.load(json_file))
+        self.assertEqual(results[0], results[1])
+
+    def test_failed_write_keeps_previous_output(self) -> None:
+        """A failure while writing leaves neither a truncated nor a temporary file."""
+        with TemporaryDirectory() as output_dir:
+            output_file = Path(output_dir).joinpath("test.json")
+            output_file.write_text("previous", encoding="utf-8")
+            data_extractor = StataDataExtractor(Path("tests/input/en/test.dta"))
+            data_extractor.parse_file()
+            with patch.object(
+                write_json_module,
+                "get_batch_statistics",
+                side_effect=RuntimeError("failed"),
+            ), self.assertRaises(RuntimeError):
+                write_json(
+                    data_extractor.data,
+                    data_extractor.metadata,
+                    None,
+                    output_file,
+                    study="study",
+                    latin1=True,
+                )
+            self.assertEqual("previous", output_file.read_text(encoding="utf-8"))
+            files = [file.name for file in Path(output_dir).iterdir()]
+            self.assertEqual(["test.json"], files)